@@ -1,29 +1,405 @@
 import asyncio
+import io
 import logging
 import re
 import time
-from typing import Any, Dict, List, Optional
+from collections import defaultdict, deque
+from contextvars import ContextVar
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from hashlib import blake2b
+from itertools import islice
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Sequence, Tuple
 from app.models import MessageRequest, MessageResponse
 from app.services.vector_intent_service import vector_intent_service
-from app.services.function_service import FunctionService
-from app.services.vector_service import vector_service
+from app.services.function_service import function_service
+from app.services.vector_service import parse_tag_list, vector_service
 from app.services.menu_reasoning_service import menu_reasoning_service
+from app.services.response_cache import response_cache
+from app.core.cache import TTLCache
 from app.core.config import settings
-from openai import OpenAI
+from openai import AsyncOpenAI
+import orjson
 
 logger = logging.getLogger("restaurant_agent")
 
+# Sink nhận từng chunk LLM của request đang stream (None = trả response 1 lần như cũ)
+_stream_sink: ContextVar[Optional[Callable[[str], None]]] = ContextVar("_stream_sink", default=None)
+
+
+def _keyword_pattern(keywords, flags: int = 0) -> "re.Pattern":
+    """Compile list keyword thành 1 regex alternation (keyword dài match trước)"""
+    ordered = sorted(set(keywords), key=len, reverse=True)
+    return re.compile("|".join(re.escape(kw) for kw in ordered), flags)
+
+
+@lru_cache(maxsize=4096)
+def _lc(text: str) -> str:
+    """
+    Lowercase có cache cho các chuỗi lặp lại giữa các request
+    (metadata keys, tags, cuisine, constraint ăn kiêng phổ biến)
+    """
+    return text.lower()
+
+
+# Patterns để tìm restaurant name trong AI response (compile 1 lần khi import)
+_NAME_PATTERNS = tuple(
+    re.compile(pattern, re.IGNORECASE)
+    for pattern in (
+        r"nhà hàng\s+([A-Za-z\s]+?)(?:\s|,|\.|$|chuyên)",
+        r"tại\s+([A-Za-z\s]+?)(?:\s|,|\.|$|chuyên)",
+        r"([A-Za-z\s]+?(?:BBQ|Premium|Restaurant|Restaurants))(?:\s|,|\.|$|chuyên)",
+        r"NHÀ HÀNG\s*-\s*Tên:\s*([A-Za-z\s]+?)(?:\s|,|$)",
+    )
+)
+_NAME_STOPWORDS = frozenset(['có', 'là', 'nào', 'và', 'cho'])
+
+# Restaurant names trong assistant responses cũ (conversation history), 1 alternation cho 3 format.
+# ✅ FIX: Chỉ extract từ list restaurants (có số thứ tự), không extract món ăn
+_HISTORY_NAME_RE = re.compile(
+    # Format: "1. **Seoul BBQ Premium**" (có số thứ tự ở đầu)
+    r"\n\s*\d+\.\s+\*\*(?P<numlist>[^*]+?)\*\*"
+    # Format: "**Seoul BBQ Premium**" (không có "- " hoặc "( " phía trước, không có VNĐ sau)
+    r"|(?<![-(\s])\*\*(?P<bold>[A-Za-z0-9\s\-]+(?:Restaurant|BBQ|Premium|Restaurants|Cafe|Café|Bar|Bistro)?)\*\*(?!\s*[-\()]|\s*-\s*\d+\.?\d*\s*VN?Đ)"
+    # Format: "NHÀ HÀNG - Tên: Seoul BBQ Premium"
+    r"|NHÀ HÀNG\s*-\s*Tên:\s*(?P<label>[A-Za-z0-9\s\-]+?)(?:\s|,|$|Địa)",
+    re.IGNORECASE | re.MULTILINE,
+)
+
+# Marker trên dict đã qua _normalize_menu_item/_normalize_restaurant_item → lần gọi sau return ngay
+_NORMALIZED_KEY = "_normalized"
+# Keys của search result không copy sang normalized menu item
+_MENU_ITEM_SKIP_KEYS = frozenset({"metadata", "document", "id", "_norm", "_flat"})
+
+# Thứ tự key fallback khi lấy name/description/price của matched item (menu, service, table)
+_ITEM_NAME_KEYS = ("name", "dishName", "serviceName", "tableName", "title")
+_ITEM_DESCRIPTION_KEYS = ("description", "serviceDescription", "details", "note")
+_ITEM_PRICE_KEYS = ("price", "cost", "amount")
+
+
+def _first_value(metadata: Dict[str, Any], keys: Sequence[str]) -> Any:
+    """Giá trị truthy đầu tiên theo thứ tự keys (giống chuỗi `a or b or c`, None nếu không có)"""
+    value = None
+    for key in keys:
+        value = metadata.get(key)
+        if value:
+            return value
+    return value
+
+
+# Số message (user + assistant) giữ lại cho mỗi conversation
+_HISTORY_MAXLEN = 20
+# Số message history đưa vào prompt của LLM formatter
+_FORMATTER_HISTORY_LEN = 4
+
+
+def _recent_history(history: Sequence[Dict[str, str]], n: int) -> List[Dict[str, str]]:
+    """``n`` message cuối của history (deque không hỗ trợ slice)"""
+    return list(islice(history, max(0, len(history) - n), None))
+
+
+@lru_cache(maxsize=4096)
+def _restaurant_card_details(address: str, cuisine: str) -> str:
+    """Phần cố định của card nhà hàng (địa chỉ + ẩm thực), build 1 lần cho mỗi nhà hàng"""
+    return f"📍 {address}\n🍽️ {cuisine}"
+
+
+def _trim_text(text: str, limit: int) -> str:
+    """Strip + cắt text dài quá ``limit`` ký tự, thêm "..." (strip() không copy nếu text đã sạch)"""
+    text = text.strip()
+    if len(text) > limit:
+        return text[:limit].rstrip() + "..."
+    return text
+
+
+def _estimate_tokens(text: str) -> int:
+    """Ước lượng số token không cần tokenizer (tiếng Việt có dấu ~3 ký tự/token)"""
+    return len(text) // 3 + 1
+
+
+def _fit_to_token_budget(
+    sections: Sequence[Tuple[str, List[str], int, str, str]], budget: int
+) -> List[str]:
+    """Ghép các section data_context, giữ item xếp hạng cao nhất cho tới khi hết budget
+
+    Mỗi section là ``(title, item_lines, total, noun, separator)``; item đã sort theo
+    distance nên cắt từ cuối. Luôn giữ ít nhất 1 item/section để LLM không báo "không tìm thấy".
+    """
+    parts: List[str] = []
+    remaining = budget
+    for title, item_lines, total, noun, separator in sections:
+        remaining -= _estimate_tokens(title)
+        kept: List[str] = []
+        for line in item_lines:
+            cost = _estimate_tokens(line)
+            if kept and cost > remaining:
+                break
+            kept.append(line)
+            remaining -= cost
+        if total > len(kept):
+            kept.append(f"... và {total - len(kept)} {noun} khác.")
+        parts.append(title + separator.join(kept))
+    return parts
+
+
+# Collections đóng góp vào kết quả aggregate của 1 nhà hàng (bitmask thay vì set)
+_SRC_RESTAURANTS, _SRC_MENUS, _SRC_SERVICES, _SRC_TABLES, _SRC_IMAGES = 1, 2, 4, 8, 16
+_SRC_NAMES = (
+    (_SRC_RESTAURANTS, "restaurants"),
+    (_SRC_MENUS, "menus"),
+    (_SRC_SERVICES, "services"),
+    (_SRC_TABLES, "tables"),
+    (_SRC_IMAGES, "image_url"),
+)
+
+# Validate tên extract từ history (loại bỏ món ăn)
+_HISTORY_NAME_STOPWORDS = frozenset([
+    'có', 'là', 'nào', 'và', 'cho', 'món', 'địa chỉ', 'loại', 'rating',
+    'canh', 'cá', 'cơm', 'bánh', 'lẩu', 'gỏi', 'chả', 'súp', 'salad',
+])
+_DISH_KEYWORD_RE = _keyword_pattern(('canh', 'súp', 'gỏi', 'chả', 'nem', 'bánh', 'cơm', 'lẩu', 'salad'))
+_PRICE_CONTEXT_RE = _keyword_pattern(("vnđ", "đồng", "giá", "price", "- 50", "- 100", "000", "triệu", "k"))
+_VENUE_KEYWORD_RE = _keyword_pattern(
+    ("restaurant", "bbq", "premium", "cafe", "café", "bar", "bistro"), re.IGNORECASE
+)
+_MAX_DISH_NAME_LEN = 30
+
+# Fallback khi LLM lỗi: (pattern, câu trả lời), check theo thứ tự, match substring như cũ
+_FALLBACK_REPLIES = (
+    (
+        _keyword_pattern(("giờ", "open", "hour")),
+        "Nhà hàng mở cửa từ 10:00 đến 22:00 mỗi ngày. Bạn muốn đặt bàn khung giờ nào?",
+    ),
+    (
+        _keyword_pattern(("địa chỉ", "address", "ở đâu")),
+        "Nhà hàng nằm tại trung tâm thành phố. Bạn có thể tìm kiếm nhà hàng gần vị trí của bạn không?",
+    ),
+    (
+        _keyword_pattern(("giá", "price", "cost")),
+        "Giá cả tùy thuộc vào món ăn và nhà hàng. Bạn muốn xem menu của nhà hàng nào?",
+    ),
+)
+_DEFAULT_FALLBACK_REPLY = (
+    "Tôi là trợ lý đặt bàn nhà hàng. Tôi có thể giúp bạn tìm nhà hàng, xem menu, "
+    "đặt bàn hoặc kiểm tra voucher. Bạn cần hỗ trợ gì?"
+)
+# Response lỗi / fallback không phải kết quả thật → không đưa vào response cache
+_FALLBACK_REPLY_TEXTS = frozenset(reply for _, reply in _FALLBACK_REPLIES) | {_DEFAULT_FALLBACK_REPLY}
+_FAILED_RESPONSE_PREFIXES = ("Xin lỗi", "Không tìm thấy")
+
+# ========== Forbidden tags (kiêng khem) ==========
+_BEEF_TAGS = ("beef", "thịt bò", "bò")
+_SEAFOOD_TAGS = (
+    "seafood", "hải sản",
+    "shrimp", "tôm",
+    "crab", "cua",
+    "squid", "mực",
+    "clam", "nghêu",
+    "scallop", "sò", "sò điệp",
+    "snail", "ốc",
+    "oyster", "hàu"
+)
+_ALL_MEAT_TAGS = ("beef", "pork", "chicken", "meat", "thịt bò", "thịt heo", "thịt gà", "thịt")
+_RED_MEAT_TAGS = ("beef", "thịt bò", "pork", "thịt heo", "lamb", "thịt cừu")
+
+# Constraint keywords → forbidden tags; mỗi nhóm 1 regex (các nhóm có thể overlap substring)
+_CONSTRAINT_TAG_RULES = tuple(
+    (_keyword_pattern(keywords), tags)
+    for keywords, tags in (
+        # THỊT BÒ
+        (("tránh thịt bò", "kiêng bò", "không bò", "tránh bò"), _BEEF_TAGS),
+        # HẢI SẢN (tổng quát)
+        (("tránh hải sản", "kiêng hải sản", "không hải sản"), _SEAFOOD_TAGS),
+        # Tôm / Cua / Mực cụ thể
+        (("tránh tôm", "kiêng tôm"), ("shrimp", "tôm")),
+        (("tránh cua", "kiêng cua"), ("crab", "cua")),
+        (("tránh mực", "kiêng mực"), ("squid", "mực")),
+        # CAY
+        (("không cay", "tránh cay", "kiêng cay", "không quá cay", "ít cay", "hạn chế cay", "không ớt"),
+         ("spicy", "cay", "ớt", "pepper", "chili")),
+        # ĐỒ CHIÊN XÀO
+        (("tránh đồ chiên", "tránh đồ xào", "kiêng chiên xào", "hạn chế đồ chiên xào", "không chiên", "không xào"),
+         ("fried", "deep_fried", "chiên", "xào", "pan_fried")),
+        # ĐƯỜNG / NGỌT (tiểu đường)
+        (("ít đường", "không đường", "tránh đường", "kiêng đường",
+          "tránh đồ ngọt", "ít ngọt", "không ngọt", "tiểu đường"),
+         ("sweet", "dessert", "sugar", "đường", "ngọt", "caramel")),
+        # MUỐI / MẶN (huyết áp cao) - fallback cho text matching
+        (("ít muối", "không muối", "tránh muối", "huyết áp cao", "tăng huyết áp", "ít mặn", "không mặn"),
+         ("mặn", "muối", "salty")),
+        # RƯỢU
+        (("tránh rượu", "kiêng rượu", "không rượu", "gan yếu", "viêm gan"),
+         ("alcohol", "rượu", "beer", "bia", "wine")),
+    )
+)
+
+# Condition detection (summary / constraints dùng keyword khác nhau)
+_SCAR_SUMMARY_RE = _keyword_pattern(("sẹo", "vết mổ", "mới phẫu thuật", "phẫu thuật", "vết thương"))
+_SCAR_CONSTRAINT_RE = _keyword_pattern(("sẹo", "vết mổ"))
+_VEGETARIAN_SUMMARY_RE = _keyword_pattern(("ăn chay", "đồ chay", "vegetarian", "vegan"))
+_VEGETARIAN_CONSTRAINT_RE = _keyword_pattern(("ăn chay", "đồ chay", "không ăn thịt"))
+_GOUT_SUMMARY_RE = _keyword_pattern(("gout", "đau khớp"))
+_GOUT_CONSTRAINT_RE = _keyword_pattern(("gout", "đau khớp", "thịt đỏ"))
+_GENERIC_MEAT_RE = _keyword_pattern(("không thịt", "tránh thịt", "kiêng thịt", "không có thịt"))
+
+# Các key có thể chứa restaurant id trong metadata (theo thứ tự ưu tiên)
+_RESTAURANT_ID_KEYS = ("restaurant_id", "restaurantId", "restaurantID", "id")
+
+# Metadata keys dùng để phân loại item trong menus collection (so sánh lowercase)
+_SERVICE_INDICATORS = frozenset({"serviceid", "servicename", "service_name", "servicecategory", "servicetype", "duration"})
+_TABLE_INDICATORS = frozenset({"tableid", "tablename", "table_name", "capacity", "tabletype", "tablelayout"})
+
+# Tách message thành từ (bỏ dấu câu) cho keyword 1 từ
+_WORD_RE = re.compile(r"\w+")
+
+# Booking time rules: (pattern, value) check theo thứ tự, rule đầu tiên match thắng
+_BOOKING_DAY_RULES = tuple(
+    (_keyword_pattern(keywords), day_offset)
+    for keywords, day_offset in (
+        (("ngày mai", "tomorrow"), 1),
+        (("hôm nay", "today"), 0),
+    )
+)
+# Chỉ dùng khi message không có giờ explicit (xem _parse_booking_hour)
+_BOOKING_HOUR_RULES = tuple(
+    (_keyword_pattern(keywords), hour)
+    for keywords, hour in (
+        (("sáng", "morning"), 8),
+        (("tối", "evening", "night"), 19),
+    )
+)
+_DEFAULT_BOOKING_DAY_OFFSET = 1  # Default: ngày mai
+_DEFAULT_BOOKING_HOUR = 19  # Default: 19:00
+# Giờ explicit: "7h", "12 giờ", "2 gio" - không match giữa số khác ("12h" không chứa "2h")
+_EXPLICIT_HOUR_RE = re.compile(r"(?<!\d)(\d{1,2})\s*(?:h|giờ|gio)(?![^\W\d])")
+_AFTERNOON_HOUR_RE = _keyword_pattern(("chiều", "tối", "evening", "night"))
+_MORNING_HOUR_RE = _keyword_pattern(("sáng", "morning"))
+
+
+def _match_rule(rules, text: str, default):
+    for pattern, value in rules:
+        if pattern.search(text):
+            return value
+    return default
+
+
+def _parse_booking_hour(text: str) -> int:
+    """Giờ đặt bàn từ text: giờ explicit thắng, không có mới fallback keyword (sáng/tối)"""
+    match = _EXPLICIT_HOUR_RE.search(text)
+    if match:
+        hour = int(match.group(1))
+        # "7h tối" → 19; "2h" không kèm "sáng" → 14 (nhà hàng không nhận bàn 2h sáng)
+        if hour < 12 and (
+            _AFTERNOON_HOUR_RE.search(text)
+            or (1 <= hour <= 5 and not _MORNING_HOUR_RE.search(text))
+        ):
+            hour += 12
+        if hour <= 23:
+            return hour
+    return _match_rule(_BOOKING_HOUR_RULES, text, _DEFAULT_BOOKING_HOUR)
+
+
+def _ensure_normalized(item: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Lowercase/parse metadata của 1 search result đúng 1 lần, cache vào item["_norm"]
+
+    Các pass filter chạy lại trên cùng list results sẽ đọc từ cache thay vì parse lại.
+    """
+    norm = item.get("_norm")
+    if norm is not None:
+        return norm
+
+    metadata = item.get("metadata", {})
+    ingredients = metadata.get("ingredients", "")
+    if isinstance(ingredients, str):
+        ingredients = ingredients.lower()
+    elif isinstance(ingredients, list):
+        ingredients = " ".join(str(i) for i in ingredients).lower()
+    else:
+        ingredients = ""
+
+    norm = {
+        "name_lc": (metadata.get("name") or "").lower(),
+        "desc_lc": (metadata.get("description") or "").lower(),
+        "ing_lc": ingredients,
+        "tags_lc": frozenset(_lc(str(tag)) for tag in parse_tag_list(metadata.get("tags", []))),
+        "ingredient_tags_lc": frozenset(
+            _lc(str(tag)) for tag in parse_tag_list(metadata.get("ingredient_tags", []))
+        ),
+    }
+    item["_norm"] = norm
+    return norm
+
+
+@dataclass(slots=True)
+class TurnState:
+    """Context của turn trước cho 1 user (nhà hàng vừa gợi ý, intent cuối)"""
+    last_restaurant_id: Optional[Any] = None
+    last_restaurant_name: Optional[str] = None
+    last_intent: Optional[str] = None
+    # Nhà hàng vừa gợi ý + response tương ứng → follow-up (so sánh...) không cần parse history
+    last_suggested: Optional[List[Dict]] = None
+    last_suggested_response: Optional[str] = None
+
+
 class RestaurantAgent:
     """Anti-Hallucination Restaurant Agent với Vector DB First + Multi-Collection Search"""
     
+    # Message nhắc lại nhà hàng đã gợi ý ở turn trước
+    REFERENCE_KEYWORDS = (
+        "nhà hàng đó", "nhà hàng bạn gợi ý", "nhà hàng phía trên",
+        "nhà hàng vừa nói", "nhà hàng trước đó", "restaurant đó",
+        "nhà hàng kia", "nhà hàng vừa rồi", "nhà hàng trên"
+    )
+    
+    # Follow-up questions (so sánh, bạn vừa gợi ý...) - phụ thuộc conversation history
+    FOLLOW_UP_KEYWORDS = (
+        "so sánh", "bạn vừa gợi ý", "những nhà hàng trên", "nhà hàng trên",
+        "2 nhà hàng", "hai nhà hàng", "các nhà hàng", "những nhà hàng"
+    )
+    
+    # Keyword groups cho complex availability query
+    RESTAURANT_KEYWORDS = ('nhà hàng', 'restaurant', 'quán', 'chỗ ăn')
+    AVAILABILITY_KEYWORDS = ('có bàn', 'bàn trống', 'availability', 'còn chỗ', 'đặt được')
+    # Keyword 1 từ → so token (substring sẽ match nhầm, vd: "hàn" trong "nhà hàng")
+    CUISINE_TOKENS = frozenset({'nhật', 'japanese', 'hàn', 'korean', 'ý', 'italian', 'việt', 'vietnamese'})
+    TIME_KEYWORDS = ('ngày mai', 'hôm nay', 'tối nay', 'trưa nay', 'chiều nay')
+    BOOKING_REDIRECT_KEYWORDS = ('đặt bàn', 'booking', 'reservation', 'waitlist', 'xếp hàng', 'chờ bàn')
+    
+    # Pre-compiled patterns - 1 lần scan thay vì any(kw in msg) cho từng keyword
+    _REFERENCE_RE = _keyword_pattern(REFERENCE_KEYWORDS)
+    _FOLLOW_UP_RE = _keyword_pattern(FOLLOW_UP_KEYWORDS, re.IGNORECASE)  # search thẳng trên message gốc
+    _CONTEXT_DEPENDENT_RE = _keyword_pattern(REFERENCE_KEYWORDS + FOLLOW_UP_KEYWORDS)
+    _RESTAURANT_RE = _keyword_pattern(RESTAURANT_KEYWORDS)
+    _AVAILABILITY_RE = _keyword_pattern(AVAILABILITY_KEYWORDS)
+    _TIME_RE = _keyword_pattern(TIME_KEYWORDS)
+    _BOOKING_REDIRECT_RE = _keyword_pattern(BOOKING_REDIRECT_KEYWORDS)
+    
     def __init__(self):
         self.intent_service = vector_intent_service
-        self.function_service = FunctionService()
+        self.function_service = function_service
         self.vector_service = vector_service
+        self.response_cache = response_cache
         self.openai_client = None
-        self.conversations = {}
+        # Intent → handler, signature chung: (user_message, entities, user_id, query_vector=None) -> str
+        self._intent_handlers = {
+            "restaurant_search": self._handle_restaurant_search,
+            "menu_inquiry": self._handle_menu_inquiry,
+        }
+        # Giữ reference tới background tasks để không bị GC trước khi chạy xong
+        self._background_tasks = set()
+        # Vector DB initialization chạy nền, progress cho GET /vector/initialize/status
+        self._init_task: Optional[asyncio.Task] = None
+        self.init_progress: Dict[str, Any] = {"state": "idle", "done": 0, "total": 0}
+        # Bounded theo số user + TTL theo thời gian không hoạt động để tránh memory leak
+        self.conversations = TTLCache(settings.SESSION_CACHE_SIZE, settings.SESSION_TTL)
         # TurnState memory để track context
-        self.turn_states = {}  # {user_id: {"last_restaurant_id": ..., "last_restaurant_name": ...}}
+        self.turn_states = TTLCache(settings.SESSION_CACHE_SIZE, settings.SESSION_TTL)  # {user_id: TurnState}
+        # Completion cache theo hash của messages: prompt y hệt → bỏ qua API call
+        self._llm_cache = TTLCache(settings.LLM_CACHE_SIZE, settings.LLM_CACHE_TTL)
+        # {cache_key: Future} của các LLM call đang chạy (single-flight)
+        self._llm_inflight: Dict[str, asyncio.Future] = {}
         
         # STRICT System Prompt - Ngăn hallucination
         self.strict_system_prompt = """You are RestaurantBot, a friendly AI concierge for restaurant booking system.
@@ -40,22 +416,94 @@ Your capabilities:
 - Format responses naturally and friendly
 - Use Vietnamese by default, English if user uses English
 - Keep responses concise but informative"""
+        
+        # Phần tĩnh của prompt format data, build 1 lần: prefix giống hệt nhau giữa các request
+        # → provider prompt caching (OpenAI tự cache prefix dài) hit được, chỉ data_context thay đổi
+        self._strict_prompt_prefix = (
+            f"{self.strict_system_prompt}\n\nDỮ LIỆU THỰC TẾ (CHỈ ĐƯỢC ĐỀ CẬP ĐẾN CÁC THÔNG TIN NÀY):\n"
+        )
+        self._strict_prompt_suffix = """
+
+HƯỚNG DẪN FORMAT RESPONSE:
+
+- Luôn trả lời bằng tiếng Việt (trừ khi user dùng tiếng Anh).
+
+- Mở đầu bằng 1–2 câu tóm tắt ngắn gọn bối cảnh của user 
+
+  (ví dụ: tập gym, bị cảm, bị sẹo, huyết áp cao...) dựa trên nội dung câu hỏi.
+
+- BẮT BUỘC: Mỗi món ăn/nhà hàng phải được format trên NHIỀU DÒNG, KHÔNG được gộp vào 1 dòng.
+
+- Format MÓN ĂN theo mẫu sau (MỖI THÔNG TIN MỘT DÒNG):
+
+  • **Tên món**
+    🏠 Nhà hàng: Tên nhà hàng
+    💰 Giá: X VNĐ
+    📝 Mô tả ngắn gọn
+
+  Ví dụ cụ thể:
+  • **Canh chua cá lóc**
+    🏠 Nhà hàng: Hải Sản Bà Cường
+    💰 Giá: 50.000 VNĐ
+    📝 Canh chua ngọt với cá lóc tươi, rau thơm
+
+- Format NHÀ HÀNG theo mẫu sau (MỖI THÔNG TIN MỘT DÒNG):
+
+  **Tên nhà hàng**
+  📍 Địa chỉ: ...
+  🍽️ Loại: ...
+  ⭐ Rating: ... (chỉ nếu có)
+
+- SỬ DỤNG XUỐNG DÒNG (\\n) giữa mỗi thông tin. KHÔNG BAO GIỜ gộp tất cả vào 1 dòng dài.
+
+- Sử dụng markdown: **bold**, emoji (🍽️ 📍 ⭐ 💰 🏠 🩹 💪 🤒) để giúp dễ đọc.
+
+QUAN TRỌNG:
+
+- CHỈ được đề cập đến thông tin trong danh sách trên.
+
+- KHÔNG được tự tạo tên nhà hàng, món ăn, dịch vụ, hoặc thông tin nào khác.
+
+- ✅ KHI ĐÃ CÓ DỮ LIỆU trong danh sách → BẮT BUỘC phải gợi ý ít nhất một số món/nhà hàng phù hợp với câu hỏi.
+
+- KHÔNG được trả "Không tìm thấy" nếu ĐÃ có dữ liệu trong danh sách.
+
+- Nếu user hỏi về thông tin không có trong danh sách → trả lời theo dạng:
+
+  "Trong danh sách hiện tại, tôi có thể gợi ý cho bạn những lựa chọn sau..." 
+
+  và dùng các item có sẵn trong dữ liệu.
+
+- Format response tự nhiên, dễ đọc, có xuống dòng hợp lý.
+
+LƯU Ý CUỐI CÙNG - RẤT QUAN TRỌNG:
+- MỖI món ăn phải có TÊN MÓN trên 1 dòng, NHÀ HÀNG trên 1 dòng, GIÁ trên 1 dòng, MÔ TẢ trên 1 dòng.
+- KHÔNG BAO GIỜ viết kiểu: "• **Tên món** 🏠 Nhà hàng: ... 💰 Giá: ... 📝 ..." trên cùng 1 dòng.
+- PHẢI viết:
+  • **Tên món**
+    🏠 Nhà hàng: ...
+    💰 Giá: ...
+    📝 Mô tả
+
+"""
 
     async def handle_message(self, payload: MessageRequest) -> MessageResponse:
         """Anti-Hallucination message handling với Vector DB First + Multi-Collection Search"""
         try:
             conversation_id = payload.userId
             user_id = payload.userId
+            # Lowercase 1 lần, dùng chung cho các keyword check bên dưới
+            message_lower = payload.message.lower()
             
             # 0. Initialize turn state nếu chưa có
             if user_id not in self.turn_states:
-                self.turn_states[user_id] = {
-                    "last_restaurant_id": None,
-                    "last_restaurant_name": None,
-                    "last_intent": None
-                }
+                self.turn_states[user_id] = TurnState()
             
             # 1. Intent Recognition với turn state context
+            # Embedding message không phụ thuộc intent → encode song song (batch với request khác)
+            embedding_task = asyncio.create_task(
+                self.vector_service.aencode_query(payload.message)
+            )
             intent_result = await self.intent_service.recognize_intent_with_context(
                 payload.message, payload.userId
             )
@@ -64,55 +512,93 @@ Your capabilities:
             )
             
             # 1.1. Resolve restaurant reference từ turn state
-            entities = await self._resolve_restaurant_reference(payload.message, entities, user_id)
+            entities = self._resolve_restaurant_reference(
+                payload.message, entities, user_id, message_lower=message_lower
+            )
             
-            logger.info(f"Intent: {intent_result['intent']}, Confidence: {intent_result['confidence']}")
-            logger.info(f"Entities: {entities}")
+            logger.info("Intent: %s, Confidence: %s", intent_result['intent'], intent_result['confidence'])
+            logger.info("Entities: %s", entities)
             
-            # 2. Check for complex queries (restaurant search + availability)
-            if self._is_complex_availability_query(payload.message, intent_result["intent"]):
-                response = await self._handle_complex_availability_query(
-                    payload.message, entities, payload.userId
+            # 1.2. Semantic response cache - bỏ qua vector search + LLM nếu đã trả lời câu tương tự
+            is_complex_query = self._is_complex_availability_query(
+                payload.message, intent_result["intent"], message_lower=message_lower
+            )
+            message_vector = await embedding_task
+            cache_signature = None
+            cached_response = None
+            if self._is_cacheable_message(payload.message, message_lower=message_lower):
+                # LLM formatter đưa history gần nhất vào prompt → response chỉ dùng chung
+                # giữa các turn có cùng history (vd user mới chưa có history)
+                signature_entities = {**entities, "_history": self._history_fingerprint(user_id)}
+                if not is_complex_query and intent_result["intent"] not in self._intent_handlers:
+                    # General inquiry filter theo restaurant của turn trước → phải nằm trong key
+                    signature_entities["_last_restaurant_id"] = self.turn_states[user_id].last_restaurant_id
+                cache_signature = self.response_cache.build_signature(
+                    intent_result["intent"], signature_entities
+                )
+                cached_response = self.response_cache.lookup(
+                    cache_signature, payload.message, message_vector
                 )
+            
+            if cached_response is not None:
+                logger.info("Semantic response cache hit for intent: %s", intent_result['intent'])
+                response = cached_response
                 response_success = True
             
-            # 3. Data Retrieval Strategy - Vector DB First
-            elif intent_result["intent"] == "restaurant_search":
-                # VECTOR DB FIRST - Multi-collection search
-                response = await self._handle_restaurant_search(
-                    payload.message, entities, payload.userId
+            # 2. Check for complex queries (restaurant search + availability)
+            elif is_complex_query:
+                response = await self._handle_complex_availability_query(
+                    payload.message, entities, payload.userId,
+                    query_vector=message_vector, message_lower=message_lower
                 )
                 response_success = True
-                
-            elif intent_result["intent"] == "menu_inquiry":
+            
+            # 3. Data Retrieval Strategy - Vector DB First (dispatch theo intent)
+            elif intent_result["intent"] in self._intent_handlers:
                 # VECTOR DB FIRST - Multi-collection search
-                response = await self._handle_menu_inquiry(
-                    payload.message, entities, payload.userId
+                handler = self._intent_handlers[intent_result["intent"]]
+                response = await handler(
+                    payload.message, entities, payload.userId, query_vector=message_vector
                 )
                 response_success = True
                 
-                
             else:
                 # Check for booking/waitlist requests and redirect
-                if ("đặt bàn" in payload.message.lower() or "booking" in payload.message.lower() or 
-                    "reservation" in payload.message.lower() or "waitlist" in payload.message.lower() or 
-                    "xếp hàng" in payload.message.lower() or "chờ bàn" in payload.message.lower()):
+                if self._BOOKING_REDIRECT_RE.search(message_lower):
                     response = "Tôi có thể giúp bạn tìm nhà hàng phù hợp và kiểm tra bàn trống. Để đặt bàn hoặc tham gia waitlist, vui lòng truy cập trang đặt bàn của chúng tôi hoặc liên hệ trực tiếp với nhà hàng. Bạn muốn tôi tìm nhà hàng nào cho bạn?"
                     response_success = True
                 else:
                     # General inquiry - Try Vector DB first, then OpenAI với strict context
                     response = await self._handle_general_inquiry(
-                        payload.message, payload.userId
+                        payload.message, payload.userId, query_vector=message_vector
                     )
                     response_success = True
             
-            # 3. Store conversation
-            await self.vector_service.store_conversation(
-                payload.userId, payload.message, response, intent_result["intent"]
+            # 2.1. Cache response mới (availability thay đổi nhanh → TTL ngắn hơn),
+            # bỏ qua error string / fallback reply
+            if (
+                cached_response is None
+                and cache_signature is not None
+                and self._is_cacheable_response(response)
+            ):
+                self.response_cache.store(
+                    cache_signature,
+                    payload.message,
+                    message_vector,
+                    response,
+                    ttl_seconds=settings.RESPONSE_CACHE_AVAILABILITY_TTL if is_complex_query else None,
+                )
+            
+            # 3. Store conversation (background - user không cần chờ ghi vector DB)
+            self._spawn_background(
+                self.vector_service.store_conversation(
+                    payload.userId, payload.message, response, intent_result["intent"]
+                ),
+                "store_conversation"
             )
             
             # 4. Update turn state với restaurant đã gợi ý
-            await self._update_turn_state(user_id, intent_result["intent"], entities, response)
+            self._update_turn_state(user_id, intent_result["intent"], entities, response)
             
             # 5. Learn from interaction
             # ✅ FIX: Không học sai khi pattern đã match nhưng LLM trả general_inquiry
@@ -123,14 +609,17 @@ Your capabilities:
             if (intent_method in ["pattern_override_llm_general", "pattern_override_llm_low_confidence"] and
                 intent_name == "general_inquiry"):
                 logger.info(
-                    f"Skipping learning: pattern overrode LLM general_inquiry, "
-                    f"not learning incorrect intent"
+                    "Skipping learning: pattern overrode LLM general_inquiry, "
+                    "not learning incorrect intent"
                 )
                 # Không gọi learn_from_interaction để tránh học sai
             else:
-                await self.intent_service.learn_from_interaction(
-                    payload.userId, payload.message, intent_name, 
-                    entities, response_success
+                self._spawn_background(
+                    self.intent_service.learn_from_interaction(
+                        payload.userId, payload.message, intent_name, 
+                        entities, response_success
+                    ),
+                    "learn_from_interaction"
                 )
             
             # 6. Store in memory
@@ -139,119 +628,166 @@ Your capabilities:
             return MessageResponse(response=response)
                     
         except Exception as e:
-            logger.error(f"Error handling message: {e}", exc_info=True)
+            logger.error("Error handling message: %s", e, exc_info=True)
             return MessageResponse(response="Xin lỗi, có lỗi xảy ra khi xử lý tin nhắn của bạn.")
     
-    async def _resolve_restaurant_reference(self, user_message: str, entities: Dict, user_id: str) -> Dict:
+    async def handle_message_stream(self, payload: MessageRequest) -> AsyncIterator[Dict[str, str]]:
+        """Streaming variant của handle_message
+
+        Yield các event ``{"event": "delta", "content": chunk}`` trong lúc LLM format câu trả lời,
+        kết thúc bằng ``{"event": "final", "content": response}``. Response cuối có thể khác phần
+        đã stream (cache hit, fallback formatter) → client dùng event "final" làm bản chính thức.
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        token = _stream_sink.set(queue.put_nowait)
+        try:
+            # Task copy context hiện tại → sink chỉ áp dụng cho request này
+            task = asyncio.create_task(self.handle_message(payload))
+        finally:
+            _stream_sink.reset(token)
+        task.add_done_callback(lambda _: queue.put_nowait(None))
+        
+        while True:
+            chunk = await queue.get()
+            if chunk is None:
+                break
+            yield {"event": "delta", "content": chunk}
+        
+        result = await task
+        yield {"event": "final", "content": result.response}
+    
+    def _spawn_background(self, coro, label: str):
+        """Chạy side effect (lưu/learn) ngoài response path, log lỗi thay vì raise"""
+        async def _run():
+            try:
+                await coro
+            except Exception as e:
+                logger.error("Background task %s failed: %s", label, e, exc_info=True)
+        
+        task = asyncio.create_task(_run())
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+        return task
+    
+    def _is_cacheable_message(self, user_message: str, message_lower: Optional[str] = None) -> bool:
+        """Message tham chiếu turn trước / history của user thì không được dùng chung response"""
+        if message_lower is None:
+            message_lower = user_message.lower()
+        return not self._CONTEXT_DEPENDENT_RE.search(message_lower)
+    
+    def _history_fingerprint(self, user_id: str) -> Optional[str]:
+        """Hash của phần history mà LLM formatter sẽ đưa vào prompt (None nếu chưa có history)"""
+        history = self.conversations.get(user_id)
+        if not history:
+            return None
+        return self._llm_cache_key(_recent_history(history, _FORMATTER_HISTORY_LEN))
+    
+    @staticmethod
+    def _is_cacheable_response(response: Optional[str]) -> bool:
+        """Handler trả về kết quả thật (không phải error string / fallback reply) → được cache"""
+        return bool(response) and not (
+            response.startswith(_FAILED_RESPONSE_PREFIXES) or response in _FALLBACK_REPLY_TEXTS
+        )
+    
+    def _resolve_restaurant_reference(
+        self, user_message: str, entities: Dict, user_id: str,
+        message_lower: Optional[str] = None
+    ) -> Dict:
         """Resolve restaurant reference từ turn state"""
         try:
-            reference_keywords = [
-                "nhà hàng đó", "nhà hàng bạn gợi ý", "nhà hàng phía trên", 
-                "nhà hàng vừa nói", "nhà hàng trước đó", "restaurant đó",
-                "nhà hàng kia", "nhà hàng vừa rồi", "nhà hàng trên"
-            ]
-            
-            if not any(kw in user_message.lower() for kw in reference_keywords):
+            if message_lower is None:
+                message_lower = user_message.lower()
+            if not self._REFERENCE_RE.search(message_lower):
                 return entities
             
-            turn_state = self.turn_states.get(user_id, {})
-            last_restaurant_id = turn_state.get("last_restaurant_id")
-            last_restaurant_name = turn_state.get("last_restaurant_name")
+            turn_state = self.turn_states.get(user_id) or TurnState()
+            last_restaurant_id = turn_state.last_restaurant_id
+            last_restaurant_name = turn_state.last_restaurant_name
             
             if last_restaurant_id:
                 entities["restaurant_id"] = last_restaurant_id
-                logger.info(f"Resolved restaurant reference: ID={last_restaurant_id}, Name={last_restaurant_name}")
+                logger.info("Resolved restaurant reference: ID=%s, Name=%s", last_restaurant_id, last_restaurant_name)
             else:
-                logger.warning(f"No restaurant reference found for user {user_id}")
+                logger.warning("No restaurant reference found for user %s", user_id)
             
             return entities
             
         except Exception as e:
-            logger.error(f"Error resolving restaurant reference: {e}")
+            logger.error("Error resolving restaurant reference: %s", e)
             return entities
     
-    async def _update_turn_state(self, user_id: str, intent: str, entities: Dict, response: str):
+    def _update_turn_state(self, user_id: str, intent: str, entities: Dict, response: str):
         """Update turn state với restaurant đã gợi ý"""
         try:
-            if user_id not in self.turn_states:
-                self.turn_states[user_id] = {
-                    "last_restaurant_id": None,
-                    "last_restaurant_name": None,
-                    "last_intent": None
-                }
+            turn_state = self.turn_states.get(user_id)
+            if turn_state is None:
+                turn_state = self.turn_states[user_id] = TurnState()
             
             # Update last intent
-            self.turn_states[user_id]["last_intent"] = intent
+            turn_state.last_intent = intent
             
             # Extract restaurant info từ response nếu có
             if intent in ["restaurant_search", "menu_inquiry"] and entities.get("restaurant_id"):
-                self.turn_states[user_id]["last_restaurant_id"] = entities["restaurant_id"]
+                turn_state.last_restaurant_id = entities["restaurant_id"]
                 
                 # Extract restaurant name từ response
                 restaurant_name = self._extract_restaurant_name_from_response(response)
                 if restaurant_name:
-                    self.turn_states[user_id]["last_restaurant_name"] = restaurant_name
-                    logger.info(f"Updated turn state for user {user_id}: restaurant_id={entities['restaurant_id']}, name={restaurant_name}")
+                    turn_state.last_restaurant_name = restaurant_name
+                    logger.info("Updated turn state for user %s: restaurant_id=%s, name=%s", user_id, entities['restaurant_id'], restaurant_name)
             
         except Exception as e:
-            logger.error(f"Error updating turn state: {e}")
+            logger.error("Error updating turn state: %s", e)
     
     def _extract_restaurant_name_from_response(self, response: str) -> Optional[str]:
         """Extract restaurant name từ AI response"""
-        import re
-        
-        # Patterns để tìm restaurant name
-        patterns = [
-            r"nhà hàng\s+([A-Za-z\s]+?)(?:\s|,|\.|$|chuyên)",
-            r"tại\s+([A-Za-z\s]+?)(?:\s|,|\.|$|chuyên)",
-            r"([A-Za-z\s]+?(?:BBQ|Premium|Restaurant|Restaurants))(?:\s|,|\.|$|chuyên)",
-            r"NHÀ HÀNG\s*-\s*Tên:\s*([A-Za-z\s]+?)(?:\s|,|$)",
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, response, re.IGNORECASE)
+        for pattern in _NAME_PATTERNS:
+            match = pattern.search(response)
             if match:
                 name = match.group(1).strip()
                 # Filter out common words
-                if len(name) > 3 and name.lower() not in ['có', 'là', 'nào', 'và', 'cho']:
+                if len(name) > 3 and name.lower() not in _NAME_STOPWORDS:
                     return name
         
         return None
     
-    def _is_complex_availability_query(self, user_message: str, intent: str) -> bool:
+    def _is_complex_availability_query(
+        self, user_message: str, intent: str, message_lower: Optional[str] = None
+    ) -> bool:
         """Detect complex queries that combine restaurant search + availability check"""
-        message_lower = user_message.lower()
-        
-        # Keywords that indicate both restaurant search and availability
-        restaurant_keywords = ['nhà hàng', 'restaurant', 'quán', 'chỗ ăn']
-        availability_keywords = ['có bàn', 'bàn trống', 'availability', 'còn chỗ', 'đặt được']
-        cuisine_keywords = ['nhật', 'japanese', 'hàn', 'korean', 'ý', 'italian', 'việt', 'vietnamese']
-        time_keywords = ['ngày mai', 'hôm nay', 'tối nay', 'trưa nay', 'chiều nay']
-        
-        has_restaurant = any(kw in message_lower for kw in restaurant_keywords)
-        has_availability = any(kw in message_lower for kw in availability_keywords)
-        has_cuisine = any(kw in message_lower for kw in cuisine_keywords)
-        has_time = any(kw in message_lower for kw in time_keywords)
+        if message_lower is None:
+            message_lower = user_message.lower()
         
         # Complex query if it has restaurant + availability + (cuisine or time)
-        is_complex = has_restaurant and has_availability and (has_cuisine or has_time)
-        
-        logger.info(f"Complex query detection: restaurant={has_restaurant}, availability={has_availability}, cuisine={has_cuisine}, time={has_time}, is_complex={is_complex}")
+        # Availability keywords hiếm nhất → check trước để return sớm ở đa số message
+        if not self._AVAILABILITY_RE.search(message_lower):
+            return False
+        if not self._RESTAURANT_RE.search(message_lower):
+            return False
+        
+        is_complex = bool(self._TIME_RE.search(message_lower)) or not self.CUISINE_TOKENS.isdisjoint(
+            _WORD_RE.findall(message_lower)
+        )
+        logger.info("Complex query detection: is_complex=%s", is_complex)
         return is_complex
     
-    async def _handle_complex_availability_query(self, user_message: str, entities: Dict, user_id: str) -> str:
+    async def _handle_complex_availability_query(
+        self, user_message: str, entities: Dict, user_id: str,
+        query_vector: Optional[List[float]] = None, message_lower: Optional[str] = None
+    ) -> str:
         """Handle complex queries that combine restaurant search + availability check"""
         try:
-            logger.info(f"Handling complex availability query: {user_message}")
+            logger.info("Handling complex availability query: %s", user_message)
             
             # 1. First, search for restaurants matching the criteria
-            collections = await self._detect_required_collections(user_message, {"intent": "restaurant_search"})
+            collections = self._detect_required_collections(user_message, {"intent": "restaurant_search"})
             
             search_results = await self._multi_collection_search(
                 user_message,
                 collections,
                 distance_threshold=0.6,  # Higher threshold for complex queries
-                limit_per_collection=30
+                limit_per_collection=30,
+                query_vector=query_vector
             )
             
             aggregated = await self._aggregate_search_results(search_results)
@@ -260,46 +796,60 @@ Your capabilities:
             if not restaurants_enriched:
                 return "Xin lỗi, tôi không tìm thấy nhà hàng nào phù hợp với tiêu chí của bạn."
             
-            # 2. Check availability for each restaurant
-            availability_results = []
+            # 2. Check availability for each restaurant (song song, top 5)
+            # booking_time giống nhau cho mọi nhà hàng → normalize 1 lần
+            if message_lower is None:
+                message_lower = user_message.lower()
+            normalized_entities = self._normalize_booking_entities(
+                entities, user_message, message_lower=message_lower
+            )
+            booking_time = normalized_entities.get("booking_time") or self._extract_booking_time_from_message(
+                user_message, message_lower=message_lower
+            )
+            guest_count = entities.get("guest_count", 2)
             
+            candidates = []
             for restaurant in restaurants_enriched[:5]:  # Limit to top 5 restaurants
                 restaurant_id = self._extract_restaurant_id_from_metadata(restaurant)
-                if not restaurant_id:
-                    continue
-                
-                # Normalize entities and extract booking_time coherently
-                normalized_entities = self._normalize_booking_entities(entities, user_message)
-                booking_time = normalized_entities.get("booking_time", self._extract_booking_time_from_message(user_message))
-                
-                # Check availability
-                try:
-                    availability_result = await self.function_service.execute_function(
+                if restaurant_id:
+                    candidates.append((restaurant, restaurant_id))
+            
+            results = await asyncio.gather(
+                *(
+                    self.function_service.execute_function(
                         "check_availability",
                         {
                             "restaurant_id": restaurant_id,
                             "booking_time": booking_time,
-                            "guest_count": entities.get("guest_count", 2)
+                            "guest_count": guest_count
                         },
                         user_id
                     )
-                    
-                    # Parse availability result
-                    has_availability = "có bàn trống" in availability_result.lower() or "available" in availability_result.lower()
-                    
-                    availability_results.append({
-                        "restaurant": restaurant,
-                        "has_availability": has_availability,
-                        "availability_text": availability_result
-                    })
-                    
-                except Exception as e:
-                    logger.error(f"Error checking availability for restaurant {restaurant_id}: {e}")
+                    for _, restaurant_id in candidates
+                ),
+                return_exceptions=True
+            )
+            
+            availability_results = []
+            for (restaurant, restaurant_id), availability_result in zip(candidates, results):
+                if isinstance(availability_result, Exception):
+                    logger.error("Error checking availability for restaurant %s: %s", restaurant_id, availability_result)
                     availability_results.append({
                         "restaurant": restaurant,
                         "has_availability": False,
                         "availability_text": "Không thể kiểm tra khả dụng"
                     })
+                    continue
+                
+                # Parse availability result
+                availability_lower = availability_result.lower()
+                has_availability = "có bàn trống" in availability_lower or "available" in availability_lower
+                
+                availability_results.append({
+                    "restaurant": restaurant,
+                    "has_availability": has_availability,
+                    "availability_text": availability_result
+                })
             
             # 3. Format response
             available_restaurants = [r for r in availability_results if r["has_availability"]]
@@ -337,66 +887,49 @@ Your capabilities:
                 return "\n".join(response_parts)
                 
         except Exception as e:
-            logger.error(f"Error handling complex availability query: {e}")
+            logger.error("Error handling complex availability query: %s", e)
             return "Xin lỗi, có lỗi xảy ra khi xử lý yêu cầu phức tạp của bạn."
     
-    def _extract_booking_time_from_message(self, user_message: str) -> str:
+    def _extract_booking_time_from_message(self, user_message: str, message_lower: Optional[str] = None) -> str:
         """Extract booking time from user message"""
-        from datetime import datetime, timedelta
-        
-        message_lower = user_message.lower()
-        current_date = datetime.now()
-        tomorrow_date = current_date + timedelta(days=1)
-        
-        # Default to tomorrow 19:00
-        default_time = tomorrow_date.strftime("%Y-%m-%d 19:00")
-        
-        # Check for "ngày mai"
-        if "ngày mai" in message_lower:
-            if "12 giờ trưa" in message_lower or "12h trưa" in message_lower:
-                return tomorrow_date.strftime("%Y-%m-%d 12:00")
-            elif "tối" in message_lower:
-                return tomorrow_date.strftime("%Y-%m-%d 19:00")
-            elif "sáng" in message_lower:
-                return tomorrow_date.strftime("%Y-%m-%d 08:00")
-            else:
-                return tomorrow_date.strftime("%Y-%m-%d 19:00")
-        
-        # Check for "hôm nay"
-        elif "hôm nay" in message_lower:
-            if "12 giờ trưa" in message_lower or "12h trưa" in message_lower:
-                return current_date.strftime("%Y-%m-%d 12:00")
-            elif "tối" in message_lower:
-                return current_date.strftime("%Y-%m-%d 19:00")
-            else:
-                return current_date.strftime("%Y-%m-%d 19:00")
+        if message_lower is None:
+            message_lower = user_message.lower()
         
-        return default_time
+        day_offset = _match_rule(_BOOKING_DAY_RULES, message_lower, _DEFAULT_BOOKING_DAY_OFFSET)
+        hour = _parse_booking_hour(message_lower)
+        booking_date = date.today() + timedelta(days=day_offset)
+        return f"{booking_date.isoformat()} {hour:02d}:00"
 
-    def _normalize_booking_entities(self, entities: Dict, user_message: str) -> Dict:
+    def _normalize_booking_entities(
+        self, entities: Dict, user_message: str, message_lower: Optional[str] = None
+    ) -> Dict:
         """Normalize date/time + compose booking_time consistently from entities and raw text."""
-        from datetime import datetime, timedelta
         try:
             normalized = dict(entities) if entities else {}
+            text = message_lower if message_lower is not None else (user_message or "").lower()
 
             # Parse base date
-            now = datetime.now()
             base_date = None
 
             date_value = normalized.get("date")
             if isinstance(date_value, str):
                 lower = date_value.lower()
                 if "mai" in lower or "tomorrow" in lower:
-                    base_date = now + timedelta(days=1)
+                    base_date = date.today() + timedelta(days=1)
                 elif "hôm nay" in lower or "today" in lower:
-                    base_date = now
+                    base_date = date.today()
                 else:
                     # Try YYYY-MM-DD
                     try:
-                        base_date = datetime.strptime(date_value[:10], "%Y-%m-%d")
+                        base_date = datetime.strptime(date_value[:10], "%Y-%m-%d").date()
                     except Exception:
                         base_date = None
 
+            if base_date is None:
+                # Fallback: không xác định được từ entity → suy ra từ raw text
+                day_offset = _match_rule(_BOOKING_DAY_RULES, text, _DEFAULT_BOOKING_DAY_OFFSET)
+                base_date = date.today() + timedelta(days=day_offset)
+
             # Derive hour/minute
             hour = None
             minute = 0
@@ -404,106 +937,68 @@ Your capabilities:
             # If booking_time exists, try extract time portion
             bt = normalized.get("booking_time")
             if isinstance(bt, str):
-                # Try parse time part HH:MM
+                # Try parse time part HH:MM (ISO datetime parse bằng C, không slice + int() từng field)
                 try:
                     if len(bt) >= 16:
-                        hour = int(bt[11:13])
-                        minute = int(bt[14:16])
+                        parsed = datetime.fromisoformat(bt[:19].replace(" ", "T", 1))
+                        hour, minute = parsed.hour, parsed.minute
                     elif len(bt) >= 5 and ":" in bt:
-                        hour = int(bt.split(":")[0][-2:])
-                        minute = int(bt.split(":")[1][:2])
-                except Exception:
+                        hour_part, minute_part = bt.split(":", 2)[:2]
+                        hour = int(hour_part[-2:])
+                        minute = int(minute_part[:2])
+                except ValueError:
                     hour = None
 
             # Infer from raw user text if needed
-            text = (user_message or "").lower()
             if hour is None:
-                if "12 giờ trưa" in text or "12h trưa" in text or "12 gio trua" in text:
-                    hour = 12
-                elif "2h" in text or "2 giờ" in text:
-                    hour = 14
-                elif "sáng" in text or "morning" in text:
-                    hour = 8
-                elif "tối" in text or "evening" in text or "night" in text:
-                    hour = 19
-                else:
-                    hour = 19  # default
-
-            if base_date is None:
-                # Fallback: if we can't determine date, use helper that considers text
-                normalized["booking_time"] = self._extract_booking_time_from_message(user_message)
-                return normalized
+                hour = _parse_booking_hour(text)
 
             # Compose final booking_time from base_date + time
-            final_dt = base_date.replace(hour=hour, minute=minute, second=0, microsecond=0)
-            normalized["booking_time"] = final_dt.strftime("%Y-%m-%d %H:%M")
+            normalized["booking_time"] = f"{base_date.isoformat()} {hour:02d}:{minute:02d}"
             return normalized
         except Exception:
             return entities
     
-    async def _detect_required_collections(self, user_message: str, intent_result: Dict) -> List[str]:
+    # Số giây tối đa chờ background tasks khi shutdown
+    BACKGROUND_DRAIN_TIMEOUT = 10.0
+    
+    # Intent → collections cần query (semantic-first, không dùng keywords)
+    _INTENT_COLLECTIONS: Dict[str, Tuple[str, ...]] = {
+        # Menu + layout/table info thường đi kèm với restaurant search → thêm để có context
+        "restaurant_search": ("restaurants", "menus", "image_url"),
+        # Menu cần restaurant context; có thể có table/layout info
+        "menu_inquiry": ("menus", "restaurants", "image_url"),
+        # Tables stored in menus collection + restaurant context + table layouts
+        "table_inquiry": ("menus", "restaurants", "image_url"),
+        # Vouchers associated with restaurants
+        "voucher_inquiry": ("restaurants",),
+    }
+    # General query hoặc intent không rõ → search tất cả collections
+    # (Semantic search sẽ tự filter kết quả phù hợp)
+    _DEFAULT_COLLECTIONS: Tuple[str, ...] = ("restaurants", "menus", "image_url")
+    
+    def _detect_required_collections(self, user_message: str, intent_result: Dict) -> Tuple[str, ...]:
         """
         Detect các collections cần query dựa trên INTENT (semantic-first)
         
         ✅ ĐÃ BỎ KEYWORD DETECTION - Dựa vào intent đã được recognize
-        Chỉ giữ keyword detection như fallback cuối cùng nếu intent không rõ
         
         Returns:
-            List of collection names: ['restaurants', 'menus', 'tables', 'image_url', ...]
+            Tuple of collection names: ('restaurants', 'menus', 'image_url', ...)
         """
-        collections = []
-        intent = intent_result.get("intent", "")
-        confidence = intent_result.get("confidence", 0.0)
-        
-        # ✅ SEMANTIC-FIRST: Dựa vào intent đã được recognize (không dùng keywords)
-        if intent == "restaurant_search":
-            collections.append("restaurants")
-            # Menu inquiry thường đi kèm với restaurant search → thêm menus để có context
-            collections.append("menus")
-            # Layout/table info thường cần cho restaurant search → thêm image_url
-            collections.append("image_url")
-        
-        elif intent == "menu_inquiry":
-            collections.append("menus")
-            # Menu cần restaurant context → thêm restaurants
-            collections.append("restaurants")
-            # Có thể có table/layout info → thêm image_url
-            collections.append("image_url")
-        
-        elif intent == "table_inquiry":
-            collections.append("menus")  # Tables stored in menus collection
-            collections.append("restaurants")  # Need restaurant context
-            collections.append("image_url")  # Table layouts
-        
-        elif intent == "voucher_inquiry":
-            collections.append("restaurants")  # Vouchers associated with restaurants
-        
-        else:
-            # General query hoặc intent không rõ → search tất cả collections
-            # (Semantic search sẽ tự filter kết quả phù hợp)
-            collections = ["restaurants", "menus", "image_url"]
-        
         # ✅ FALLBACK: Nếu intent confidence quá thấp (<0.3) → search tất cả
-        if confidence < 0.3:
-            logger.debug(f"Low intent confidence ({confidence}), searching all collections")
-            collections = ["restaurants", "menus", "image_url"]
-        
-        # Đảm bảo có ít nhất 1 collection
-        if not collections:
-            collections.append("restaurants")
-        
-        # Remove duplicates và return
-        unique_collections = list(set(collections))
-        logger.debug(f"Detected collections (intent-based): {unique_collections} for intent: {intent} (confidence: {confidence})")
-        return unique_collections
+        if intent_result.get("confidence", 0.0) < 0.3:
+            return self._DEFAULT_COLLECTIONS
+        return self._INTENT_COLLECTIONS.get(intent_result.get("intent", ""), self._DEFAULT_COLLECTIONS)
     
     async def _multi_collection_search(
         self, 
         user_message: str, 
-        collections: List[str],
+        collections: Sequence[str],
         distance_threshold: float = 0.5,
         limit_per_collection: int = 5,
-        restaurant_id: int = None
+        restaurant_id: int = None,
+        query_vector: Optional[List[float]] = None
     ) -> Dict[str, List[Dict]]:
         """
         Search nhiều collections cùng lúc
@@ -518,6 +1013,10 @@ Your capabilities:
         """
         results = {}
         
+        # Encode query 1 lần rồi dùng chung cho mọi collection
+        if query_vector is None:
+            query_vector = await self.vector_service.aencode_query(user_message)
+        
         # Parallel search các collections
         search_tasks = []
         collection_names = []
@@ -527,35 +1026,27 @@ Your capabilities:
                 self.vector_service.search_restaurants(
                     user_message, 
                     limit=limit_per_collection,
-                    distance_threshold=distance_threshold
+                    distance_threshold=distance_threshold,
+                    query_vector=query_vector
                 )
             )
             collection_names.append("restaurants")
         
         if "menus" in collections:
-            # ✅ FIX: Pass restaurant_id để filter menus theo nhà hàng cụ thể
+            # Menus + tables cùng nằm trong menus collection (tables filter type=table)
+            # → 1 lần search Qdrant cho cả hai thay vì 2 query trùng vector
+            # ✅ FIX: Pass restaurant_id để filter menus/tables theo nhà hàng cụ thể
             search_tasks.append(
-                self.vector_service.search_menus(
+                self.vector_service.search_menus_and_tables(
                     user_message,
                     restaurant_id=restaurant_id,  # ✅ Filter by restaurant_id
-                    limit=limit_per_collection * 3,  # Menus có thể nhiều hơn - tăng multiplier
-                    distance_threshold=distance_threshold
+                    menu_limit=limit_per_collection * 3,  # Menus có thể nhiều hơn - tăng multiplier
+                    table_limit=limit_per_collection,
+                    distance_threshold=distance_threshold,
+                    query_vector=query_vector
                 )
             )
-            collection_names.append("menus")
-        
-        # Search tables (từ menus collection, nhưng filter type=table)
-        if "menus" in collections:
-            # ✅ FIX: Pass restaurant_id để filter tables theo nhà hàng cụ thể
-            search_tasks.append(
-                self.vector_service.search_tables(
-                    user_message,
-                    restaurant_id=restaurant_id,  # ✅ Filter by restaurant_id
-                    limit=limit_per_collection,
-                    distance_threshold=distance_threshold
-                )
-            )
-            collection_names.append("tables")
+            collection_names.append(("menus", "tables"))
         
         # Search table layouts/images
         if "image_url" in collections:
@@ -565,7 +1056,8 @@ Your capabilities:
                     user_message,
                     restaurant_id=restaurant_id,  # ✅ Filter by restaurant_id
                     limit=limit_per_collection,
-                    distance_threshold=distance_threshold
+                    distance_threshold=distance_threshold,
+                    query_vector=query_vector
                 )
             )
             collection_names.append("image_url")
@@ -574,47 +1066,47 @@ Your capabilities:
         if search_tasks:
             search_results = await asyncio.gather(*search_tasks, return_exceptions=True)
             
-            # Map results
-            for idx, collection_name in enumerate(collection_names):
-                if not isinstance(search_results[idx], Exception):
-                    results[collection_name] = search_results[idx]
+            # Map results (tuple name = 1 search trả về nhiều nhóm kết quả)
+            for collection_name, search_result in zip(collection_names, search_results):
+                names = collection_name if isinstance(collection_name, tuple) else (collection_name,)
+                if isinstance(search_result, Exception):
+                    logger.error("Error searching %s: %s", collection_name, search_result)
+                    for name in names:
+                        results[name] = []
+                elif isinstance(collection_name, tuple):
+                    results.update(zip(names, search_result))
                 else:
-                    logger.error(f"Error searching {collection_name}: {search_results[idx]}")
-                    results[collection_name] = []
+                    results[collection_name] = search_result
         
         return results
 
     def _extract_restaurant_id_from_metadata(self, metadata: Dict[str, Any]) -> Optional[Any]:
         if not metadata:
             return None
-        candidate_keys = [
-            "restaurant_id",
-            "restaurantId",
-            "restaurantID",
-            "id",
-        ]
-        for key in candidate_keys:
-            if key in metadata and metadata[key] not in (None, ""):
-                value = metadata[key]
-                if isinstance(value, str) and value.isdigit():
-                    try:
-                        return int(value)
-                    except Exception:
-                        return value
-                return value
+        for key in _RESTAURANT_ID_KEYS:
+            value = metadata.get(key)
+            if value is None or value == "":
+                continue
+            if isinstance(value, str) and value.isdigit():
+                try:
+                    return int(value)
+                except ValueError:
+                    return value
+            return value
         return None
 
     def _detect_collection_item_type(self, metadata: Dict[str, Any]) -> str:
         if not metadata:
             return "menu"
-        lowered_keys = {key.lower() for key in metadata.keys()}
-        service_indicators = {"serviceid", "servicename", "service_name", "servicecategory", "servicetype", "duration"}
-        table_indicators = {"tableid", "tablename", "table_name", "capacity", "tabletype", "tablelayout"}
-        if lowered_keys & service_indicators:
-            return "service"
-        if lowered_keys & table_indicators:
-            return "table"
-        return "menu"
+        # 1 lần duyệt keys; service ưu tiên hơn table nên chỉ return sớm khi gặp service key
+        is_table = False
+        for key in metadata:
+            lowered_key = _lc(key)
+            if lowered_key in _SERVICE_INDICATORS:
+                return "service"
+            if lowered_key in _TABLE_INDICATORS:
+                is_table = True
+        return "table" if is_table else "menu"
 
     def _extract_forbidden_tags(self, reasoning_profile: Dict[str, Any]) -> List[str]:
         """
@@ -632,135 +1124,53 @@ Your capabilities:
         Returns:
             List of forbidden tags (e.g., ["beef", "seafood", "tôm", "cua", ...])
         """
-        forbidden_tags = []
         constraints_text = reasoning_profile.get("constraints_text", [])
-        summary = (reasoning_profile.get("summary", "") or "").lower()
-        constraints_text_str = " ".join(str(c) for c in constraints_text).lower()
+        summary = _lc(reasoning_profile.get("summary", "") or "")
+        constraint_lowers = [_lc(str(c)) for c in constraints_text]
+        constraints_text_str = " ".join(constraint_lowers)
         
         # ✅ Detect condition từ summary và constraints để map đúng
-        is_scar_condition = any(keyword in summary for keyword in [
-            "sẹo", "vết mổ", "mới phẫu thuật", "phẫu thuật", "vết thương"
-        ]) or any(keyword in constraints_text_str for keyword in ["sẹo", "vết mổ"])
-        
-        is_vegetarian = any(keyword in summary for keyword in [
-            "ăn chay", "đồ chay", "vegetarian", "vegan"
-        ]) or any(keyword in constraints_text_str for keyword in [
-            "ăn chay", "đồ chay", "không ăn thịt"
-        ])
-        
-        is_gout = any(keyword in summary for keyword in ["gout", "đau khớp"]) or any(
-            keyword in constraints_text_str for keyword in ["gout", "đau khớp", "thịt đỏ"]
+        is_scar_condition = bool(
+            _SCAR_SUMMARY_RE.search(summary) or _SCAR_CONSTRAINT_RE.search(constraints_text_str)
+        )
+        is_vegetarian = bool(
+            _VEGETARIAN_SUMMARY_RE.search(summary) or _VEGETARIAN_CONSTRAINT_RE.search(constraints_text_str)
+        )
+        is_gout = bool(
+            _GOUT_SUMMARY_RE.search(summary) or _GOUT_CONSTRAINT_RE.search(constraints_text_str)
         )
         
+        # dict làm ordered set - giữ thứ tự tag, tự bỏ duplicate
+        forbidden_tags: Dict[str, None] = {}
+        
         # Map constraint text → tags (theo từng constraint cụ thể)
-        for constraint in constraints_text:
-            constraint_lower = str(constraint).lower()
-            
-            # ========== THỊT BÒ ==========
-            if any(keyword in constraint_lower for keyword in ["tránh thịt bò", "kiêng bò", "không bò", "tránh bò"]):
-                forbidden_tags.extend(["beef", "thịt bò", "bò"])
-            
-            # ========== HẢI SẢN (tổng quát) ==========
-            if any(keyword in constraint_lower for keyword in ["tránh hải sản", "kiêng hải sản", "không hải sản"]):
-                forbidden_tags.extend([
-                    "seafood", "hải sản",
-                    "shrimp", "tôm",
-                    "crab", "cua",
-                    "squid", "mực",
-                    "clam", "nghêu",
-                    "scallop", "sò", "sò điệp",
-                    "snail", "ốc",
-                    "oyster", "hàu"
-                ])
-            
-            # Tôm cụ thể
-            if "tránh tôm" in constraint_lower or "kiêng tôm" in constraint_lower:
-                forbidden_tags.extend(["shrimp", "tôm"])
-            
-            # Cua cụ thể
-            if "tránh cua" in constraint_lower or "kiêng cua" in constraint_lower:
-                forbidden_tags.extend(["crab", "cua"])
-            
-            # Mực cụ thể
-            if "tránh mực" in constraint_lower or "kiêng mực" in constraint_lower:
-                forbidden_tags.extend(["squid", "mực"])
-            
-            # ========== CAY ==========
-            if any(keyword in constraint_lower for keyword in [
-                "không cay", "tránh cay", "kiêng cay", "không quá cay", 
-                "ít cay", "hạn chế cay", "không ớt"
-            ]):
-                forbidden_tags.extend(["spicy", "cay", "ớt", "pepper", "chili"])
-            
-            # ========== ĐỒ CHIÊN XÀO ==========
-            if any(keyword in constraint_lower for keyword in [
-                "tránh đồ chiên", "tránh đồ xào", "kiêng chiên xào",
-                "hạn chế đồ chiên xào", "không chiên", "không xào"
-            ]):
-                forbidden_tags.extend(["fried", "deep_fried", "chiên", "xào", "pan_fried"])
-            
-            # ========== ĐƯỜNG / NGỌT (tiểu đường) ==========
-            if any(keyword in constraint_lower for keyword in [
-                "ít đường", "không đường", "tránh đường", "kiêng đường",
-                "tránh đồ ngọt", "ít ngọt", "không ngọt", "tiểu đường"
-            ]):
-                forbidden_tags.extend(["sweet", "dessert", "sugar", "đường", "ngọt", "caramel"])
-            
-            # ========== MUỐI / MẶN (huyết áp cao) ==========
-            if any(keyword in constraint_lower for keyword in [
-                "ít muối", "không muối", "tránh muối", "huyết áp cao",
-                "tăng huyết áp", "ít mặn", "không mặn"
-            ]):
-                forbidden_tags.extend(["mặn", "muối", "salty"])  # Fallback cho text matching
-            
-            # ========== RƯỢU ==========
-            if any(keyword in constraint_lower for keyword in [
-                "tránh rượu", "kiêng rượu", "không rượu", "gan yếu", "viêm gan"
-            ]):
-                forbidden_tags.extend(["alcohol", "rượu", "beer", "bia", "wine"])
+        for constraint_lower in constraint_lowers:
+            for pattern, tags in _CONSTRAINT_TAG_RULES:
+                if pattern.search(constraint_lower):
+                    forbidden_tags.update(dict.fromkeys(tags))
         
         # ========== ĐIỀU KIỆN ĐẶC BIỆT ==========
         # ✅ SẸO / VẾT MỔ: Chỉ kiêng bò + hải sản (KHÔNG kiêng tất cả thịt)
         if is_scar_condition:
-            # Chỉ add bò + hải sản nếu chưa có (tránh duplicate)
-            if "beef" not in forbidden_tags and "thịt bò" not in forbidden_tags:
-                forbidden_tags.extend(["beef", "thịt bò", "bò"])
-            if "seafood" not in forbidden_tags and "hải sản" not in forbidden_tags:
-                forbidden_tags.extend([
-                    "seafood", "hải sản",
-                    "shrimp", "tôm",
-                    "crab", "cua",
-                    "squid", "mực",
-                    "clam", "nghêu",
-                    "scallop", "sò", "sò điệp",
-                    "snail", "ốc",
-                    "oyster", "hàu"
-                ])
+            forbidden_tags.update(dict.fromkeys(_BEEF_TAGS))
+            forbidden_tags.update(dict.fromkeys(_SEAFOOD_TAGS))
             # ✅ QUAN TRỌNG: Không add "meat", "thịt", "pork", "chicken" cho sẹo
         
         # ✅ ĂN CHAY: Kiêng tất cả thịt
         if is_vegetarian:
-            forbidden_tags.extend([
-                "beef", "pork", "chicken", "meat",
-                "thịt bò", "thịt heo", "thịt gà", "thịt"
-            ])
+            forbidden_tags.update(dict.fromkeys(_ALL_MEAT_TAGS))
         
         # ✅ GOUT / ĐAU KHỚP: Chỉ kiêng thịt đỏ
         if is_gout:
-            forbidden_tags.extend(["beef", "thịt bò", "pork", "thịt heo", "lamb", "thịt cừu"])
+            forbidden_tags.update(dict.fromkeys(_RED_MEAT_TAGS))
         
         # ✅ Note: "tránh thịt" generic - chỉ apply nếu không phải sẹo/gout (để tránh conflict)
-        if not is_scar_condition and not is_gout:
-            for constraint in constraints_text:
-                constraint_lower = str(constraint).lower()
-                if any(keyword in constraint_lower for keyword in [
-                    "không thịt", "tránh thịt", "kiêng thịt", "không có thịt"
-                ]):
-                    if "meat" not in forbidden_tags and "thịt" not in forbidden_tags:
-                        forbidden_tags.extend(["beef", "pork", "chicken", "meat", "thịt bò", "thịt heo", "thịt gà", "thịt"])
-        
-        # Remove duplicates và return
-        return list(set(forbidden_tags))
+        if not is_scar_condition and not is_gout and any(
+            _GENERIC_MEAT_RE.search(constraint_lower) for constraint_lower in constraint_lowers
+        ):
+            forbidden_tags.update(dict.fromkeys(_ALL_MEAT_TAGS))
+        
+        return list(forbidden_tags)
     
     def _filter_by_forbidden_tags(
         self, search_results: Dict[str, List[Dict]], forbidden_tags: List[str]
@@ -780,91 +1190,59 @@ Your capabilities:
         Returns:
             Filtered search_results
         """
-        if not forbidden_tags:
+        if not forbidden_tags or not search_results.get("menus"):
             return search_results
         
-        filtered = {}
-        
-        for collection_name, results in search_results.items():
-            if collection_name == "menus":
-                # Filter menus - loại bỏ món có forbidden tags/keywords
-                filtered_items = []
-                
-                for item in results:
-                    metadata = item.get("metadata", {})
-                    
-                    # Get tags (ensure it's a list)
-                    tags = metadata.get("tags", [])
-                    if isinstance(tags, str):
-                        try:
-                            import ast
-                            tags = ast.literal_eval(tags) if tags.startswith("[") else [tags]
-                        except:
-                            tags = [tags] if tags else []
-                    if not isinstance(tags, list):
-                        tags = []
-                    
-                    # ✅ Get ingredient_tags (MỚI - dùng cho dị ứng/kiêng khem)
-                    ingredient_tags = metadata.get("ingredient_tags", [])
-                    if isinstance(ingredient_tags, str):
-                        try:
-                            import ast
-                            ingredient_tags = ast.literal_eval(ingredient_tags) if ingredient_tags.startswith("[") else [ingredient_tags]
-                        except:
-                            ingredient_tags = [ingredient_tags] if ingredient_tags else []
-                    if not isinstance(ingredient_tags, list):
-                        ingredient_tags = []
-                    
-                    # Get text fields để check (fallback nếu không có tags)
-                    name = (metadata.get("name") or "").lower()
-                    description = (metadata.get("description") or "").lower()
-                    ingredients = metadata.get("ingredients", "")
-                    if isinstance(ingredients, str):
-                        ingredients = ingredients.lower()
-                    elif isinstance(ingredients, list):
-                        ingredients = " ".join(str(i) for i in ingredients).lower()
-                    else:
-                        ingredients = ""
-                    
-                    # Check nếu có forbidden tag/keyword
-                    has_forbidden = False
-                    for forbidden in forbidden_tags:
-                        forbidden_lower = forbidden.lower()
-                        
-                        # ✅ Priority 1: Check trong ingredient_tags (CHÍNH XÁC NHẤT)
-                        if any(forbidden_lower == tag.lower() for tag in ingredient_tags):
-                            has_forbidden = True
-                            break
-                        
-                        # ✅ Priority 2: Check trong tags (health/lifestyle tags)
-                        if any(forbidden_lower == tag.lower() for tag in tags):
-                            has_forbidden = True
-                            break
-                        
-                        # ✅ Priority 3: Check trong name, description, ingredients (fallback)
-                        if forbidden_lower in name or forbidden_lower in description or forbidden_lower in ingredients:
-                            has_forbidden = True
-                            break
-                    
-                    # Chỉ giữ món không có forbidden tags
-                    if not has_forbidden:
-                        filtered_items.append(item)
-                    else:
-                        logger.debug(
-                            f"Filtered out menu item '{metadata.get('name', 'N/A')}' "
-                            f"due to forbidden tags: {forbidden_tags}"
-                        )
-                
-                filtered[collection_name] = filtered_items
-                logger.info(
-                    f"Filtered menus: {len(results)} → {len(filtered_items)} "
-                    f"(removed {len(results) - len(filtered_items)} items with forbidden tags)"
+        # Giữ nguyên restaurants, services, và các collections khác
+        filtered = dict(search_results)
+        filtered["menus"] = self._filter_menus_by_forbidden_tags(search_results["menus"], forbidden_tags)
+        return filtered
+    
+    def _filter_menus_by_forbidden_tags(
+        self, menus: List[Dict], forbidden_tags: Sequence[str]
+    ) -> List[Dict]:
+        """Loại bỏ món có forbidden tags/keywords, lọc trực tiếp trên list menu"""
+        if not forbidden_tags or not menus:
+            return menus
+        
+        # Lowercase forbidden tags 1 lần cho mọi item
+        forbidden_lower_set = frozenset(_lc(tag) for tag in forbidden_tags)
+        forbidden_text_re = _keyword_pattern(forbidden_lower_set)
+        
+        filtered_items = []
+        for item in menus:
+            norm = _ensure_normalized(item)
+            
+            # Check nếu có forbidden tag/keyword
+            # ✅ Priority 1 + 2: exact match trong ingredient_tags (chính xác nhất) và tags
+            has_forbidden = not (
+                forbidden_lower_set.isdisjoint(norm["ingredient_tags_lc"])
+                and forbidden_lower_set.isdisjoint(norm["tags_lc"])
+            )
+            
+            # ✅ Priority 3: Check trong name, description, ingredients (fallback)
+            if not has_forbidden:
+                has_forbidden = bool(
+                    forbidden_text_re.search(f"{norm['name_lc']}\n{norm['desc_lc']}\n{norm['ing_lc']}")
                 )
+            
+            # Chỉ giữ món không có forbidden tags
+            if not has_forbidden:
+                filtered_items.append(item)
             else:
-                # Giữ nguyên restaurants, services, và các collections khác
-                filtered[collection_name] = results
+                logger.debug(
+                    "Filtered out menu item '%s' due to forbidden tags: %s",
+                    item.get("metadata", {}).get('name', 'N/A'),
+                    forbidden_tags,
+                )
         
-        return filtered
+        logger.info(
+            "Filtered menus: %d → %d (removed %d items with forbidden tags)",
+            len(menus),
+            len(filtered_items),
+            len(menus) - len(filtered_items),
+        )
+        return filtered_items
     
     def _normalize_menu_item(self, dish: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -878,6 +1256,13 @@ Your capabilities:
         Returns:
             Normalized dict với tất cả fields ở root level
         """
+        if dish.get(_NORMALIZED_KEY):
+            return dish
+        # Cùng search result được format nhiều lần (LLM prompt rồi fallback) → normalize 1 lần
+        cached = dish.get("_flat")
+        if cached is not None:
+            return cached
+        
         # Extract metadata nếu có (search result format)
         if "metadata" in dish and isinstance(dish.get("metadata"), dict):
             metadata = dish.get("metadata", {})
@@ -885,13 +1270,15 @@ Your capabilities:
             # Preserve enriched fields từ aggregation (như _restaurantName, _restaurantId, distance, score)
             normalized.update({
                 k: v for k, v in dish.items() 
-                if k not in ["metadata", "document", "id"] and k.startswith("_")
+                if k.startswith("_") and k not in _MENU_ITEM_SKIP_KEYS
             })
             # Preserve distance, score nếu có
             if "distance" in dish:
                 normalized["distance"] = dish["distance"]
             if "score" in dish:
                 normalized["score"] = dish["score"]
+            normalized[_NORMALIZED_KEY] = True
+            dish["_flat"] = normalized
             return normalized
         
         # Nếu không có metadata → dùng dish trực tiếp (đã là flat format)
@@ -899,164 +1286,129 @@ Your capabilities:
 
     def _simplify_matched_item(self, metadata: Dict[str, Any], distance: float, item_type: str) -> Dict[str, Any]:
         meta_copy = dict(metadata or {})
-        name = (
-            meta_copy.get("name")
-            or meta_copy.get("dishName")
-            or meta_copy.get("serviceName")
-            or meta_copy.get("tableName")
-            or meta_copy.get("title")
-            or "N/A"
-        )
-        description = (
-            meta_copy.get("description")
-            or meta_copy.get("serviceDescription")
-            or meta_copy.get("details")
-            or meta_copy.get("note")
-        )
-        price = meta_copy.get("price") or meta_copy.get("cost") or meta_copy.get("amount")
         return {
-            "name": name,
-            "description": description,
-            "price": price,
+            "name": _first_value(meta_copy, _ITEM_NAME_KEYS) or "N/A",
+            "description": _first_value(meta_copy, _ITEM_DESCRIPTION_KEYS),
+            "price": _first_value(meta_copy, _ITEM_PRICE_KEYS),
             "distance": distance,
             "type": item_type,
             "metadata": meta_copy,
         }
 
+    @staticmethod
+    def _new_aggregator() -> Dict[str, Any]:
+        """Aggregator rỗng cho 1 nhà hàng (restaurant_id set khi chạm lần đầu)"""
+        return {
+            "restaurant_id": None,
+            "restaurant": None,
+            "matched_menus": [],
+            "matched_services": [],
+            "matched_tables": [],
+            "matched_images": [],
+            "menu_index": {},  # tên món (lowercase) → vị trí trong matched_menus
+            "score": 0.0,
+            "sources": 0,  # bitmask _SRC_*
+        }
+
     async def _aggregate_search_results(
         self,
         search_results: Dict[str, List[Dict]]
     ) -> Dict[str, List[Dict]]:
-        aggregated: Dict[str, Dict[str, Any]] = {}
-        missing_restaurant_ids: set[Any] = set()
-
         restaurant_entries = search_results.get("restaurants", []) or []
         menu_entries = search_results.get("menus", []) or []
-        table_entries = search_results.get("tables", []) or []
-        image_entries = search_results.get("image_url", []) or []
+        sources = (
+            ("restaurants", restaurant_entries),
+            ("menus", menu_entries),
+            # Tables search results xử lý riêng
+            ("tables", search_results.get("tables", []) or []),
+            ("image_url", search_results.get("image_url", []) or []),
+        )
+        if not any(entries for _, entries in sources):
+            return {"restaurants": [], "menus": [], "services": [], "tables": [], "images": []}
 
-        for entry in restaurant_entries:
-            metadata = entry.get("metadata") or {}
-            restaurant_id = self._extract_restaurant_id_from_metadata(metadata)
-            if restaurant_id is None:
-                continue
-            key = str(restaurant_id)
-            aggregator = aggregated.get(key)
-            if not aggregator:
-                aggregator = {
-                    "restaurant_id": restaurant_id,
-                    "restaurant": dict(metadata),
-                    "matched_menus": [],
-                    "matched_services": [],
-                    "matched_tables": [],
-                    "matched_images": [],
-                    "score": 0.0,
-                    "sources": set(["restaurants"]),
-                }
-                aggregated[key] = aggregator
-            else:
-                if not aggregator.get("restaurant"):
-                    aggregator["restaurant"] = dict(metadata)
-                aggregator["sources"].add("restaurants")
-            aggregator["score"] += max(0.0, 1.0 - entry.get("distance", 1.0))
+        aggregated: Dict[str, Dict[str, Any]] = defaultdict(self._new_aggregator)
 
+        # Nhà hàng chỉ xuất hiện qua menus (không có trong restaurants results) cần fetch metadata.
+        # Xác định trước để fetch chạy song song với phần aggregate bên dưới.
+        known_restaurant_keys = set()
+        for entry in restaurant_entries:
+            restaurant_id = self._extract_restaurant_id_from_metadata(entry.get("metadata") or {})
+            if restaurant_id is not None:
+                known_restaurant_keys.add(str(restaurant_id))
+        missing_restaurant_ids: set[Any] = set()
         for entry in menu_entries:
-            metadata = entry.get("metadata") or {}
-            restaurant_id = self._extract_restaurant_id_from_metadata(metadata)
-            if restaurant_id is None:
-                continue
-            key = str(restaurant_id)
-            aggregator = aggregated.get(key)
-            if not aggregator:
-                aggregator = {
-                    "restaurant_id": restaurant_id,
-                    "restaurant": None,
-                    "matched_menus": [],
-                    "matched_services": [],
-                    "matched_tables": [],
-                    "matched_images": [],
-                    "score": 0.0,
-                    "sources": set(),
-                }
-                aggregated[key] = aggregator
-            if aggregator.get("restaurant") is None:
+            restaurant_id = self._extract_restaurant_id_from_metadata(entry.get("metadata") or {})
+            if restaurant_id is not None and str(restaurant_id) not in known_restaurant_keys:
                 missing_restaurant_ids.add(restaurant_id)
+        fetch_task = (
+            asyncio.create_task(self.vector_service.get_restaurants_by_ids(list(missing_restaurant_ids)))
+            if missing_restaurant_ids
+            else None
+        )
 
-            item_type = self._detect_collection_item_type(metadata)
-            simplified_item = self._simplify_matched_item(
-                metadata, entry.get("distance", 1.0), item_type
-            )
-            if item_type == "service":
-                aggregator["matched_services"].append(simplified_item)
-                aggregator["sources"].add("services")
-            elif item_type == "table":
-                aggregator["matched_tables"].append(simplified_item)
-                aggregator["sources"].add("tables")
-            else:
-                aggregator["matched_menus"].append(simplified_item)
-                aggregator["sources"].add("menus")
-            aggregator["score"] += max(0.0, 1.0 - entry.get("distance", 1.0))
-
-        # Xử lý tables search results riêng
-        for entry in table_entries:
-            metadata = entry.get("metadata") or {}
-            restaurant_id = self._extract_restaurant_id_from_metadata(metadata)
-            if restaurant_id is None:
-                continue
-            key = str(restaurant_id)
-            aggregator = aggregated.get(key)
-            if not aggregator:
-                aggregator = {
-                    "restaurant_id": restaurant_id,
-                    "restaurant": None,
-                    "matched_menus": [],
-                    "matched_services": [],
-                    "matched_tables": [],
-                    "matched_images": [],
-                    "score": 0.0,
-                    "sources": set(),
-                }
-                aggregated[key] = aggregator
-            simplified_item = self._simplify_matched_item(
-                metadata, entry.get("distance", 1.0), "table"
-            )
-            aggregator["matched_tables"].append(simplified_item)
-            aggregator["sources"].add("tables")
-            aggregator["score"] += max(0.0, 1.0 - entry.get("distance", 1.0))
-
-        # Xử lý image_url search results
-        for entry in image_entries:
-            metadata = entry.get("metadata") or {}
-            restaurant_id = metadata.get("restaurant_id")
-            if restaurant_id is None:
-                continue
-            key = str(restaurant_id)
-            aggregator = aggregated.get(key)
-            if not aggregator:
-                aggregator = {
-                    "restaurant_id": restaurant_id,
-                    "restaurant": None,
-                    "matched_menus": [],
-                    "matched_services": [],
-                    "matched_tables": [],
-                    "matched_images": [],
-                    "score": 0.0,
-                    "sources": set(),
-                }
-                aggregated[key] = aggregator
-            image_item = {
-                "url": metadata.get("url"),
-                "mediaId": metadata.get("mediaId"),
-                "type": metadata.get("type", "table_layout"),
-                "distance": entry.get("distance", 1.0),
-                "metadata": metadata,
-            }
-            aggregator["matched_images"].append(image_item)
-            aggregator["sources"].add("image_url")
-            aggregator["score"] += max(0.0, 1.0 - entry.get("distance", 1.0))
+        for source, entries in sources:
+            for entry in entries:
+                metadata = entry.get("metadata") or {}
+                if source == "image_url":
+                    restaurant_id = metadata.get("restaurant_id")
+                else:
+                    restaurant_id = self._extract_restaurant_id_from_metadata(metadata)
+                if restaurant_id is None:
+                    continue
+
+                distance = entry.get("distance", 1.0)
+                aggregator = aggregated[str(restaurant_id)]
+                if aggregator["restaurant_id"] is None:
+                    aggregator["restaurant_id"] = restaurant_id
+                aggregator["score"] += max(0.0, 1.0 - distance)
+
+                if source == "restaurants":
+                    if not aggregator["restaurant"]:
+                        aggregator["restaurant"] = dict(metadata)
+                    aggregator["sources"] |= _SRC_RESTAURANTS
+                elif source == "menus":
+                    item_type = self._detect_collection_item_type(metadata)
+                    simplified_item = self._simplify_matched_item(metadata, distance, item_type)
+                    if item_type == "service":
+                        aggregator["matched_services"].append(simplified_item)
+                        aggregator["sources"] |= _SRC_SERVICES
+                    elif item_type == "table":
+                        aggregator["matched_tables"].append(simplified_item)
+                        aggregator["sources"] |= _SRC_TABLES
+                    else:
+                        # Cùng 1 món bị index nhiều lần → giữ hit gần nhất, không cộng điểm trùng
+                        # (tránh 1 nhà hàng chiếm top chỉ vì nhiều bản ghi gần giống nhau)
+                        name_key = str(simplified_item["name"]).strip().lower()
+                        menu_index = aggregator["menu_index"]
+                        position = menu_index.get(name_key) if name_key != "n/a" else None
+                        if position is not None:
+                            previous = aggregator["matched_menus"][position]
+                            previous_delta = max(0.0, 1.0 - previous["distance"])
+                            aggregator["score"] -= min(previous_delta, max(0.0, 1.0 - distance))
+                            if distance < previous["distance"]:
+                                aggregator["matched_menus"][position] = simplified_item
+                            continue
+                        if name_key != "n/a":
+                            menu_index[name_key] = len(aggregator["matched_menus"])
+                        aggregator["matched_menus"].append(simplified_item)
+                        aggregator["sources"] |= _SRC_MENUS
+                elif source == "tables":
+                    aggregator["matched_tables"].append(
+                        self._simplify_matched_item(metadata, distance, "table")
+                    )
+                    aggregator["sources"] |= _SRC_TABLES
+                else:
+                    aggregator["matched_images"].append({
+                        "url": metadata.get("url"),
+                        "mediaId": metadata.get("mediaId"),
+                        "type": metadata.get("type", "table_layout"),
+                        "distance": distance,
+                        "metadata": metadata,
+                    })
+                    aggregator["sources"] |= _SRC_IMAGES
 
-        if missing_restaurant_ids:
-            fetched = await self.vector_service.get_restaurants_by_ids(list(missing_restaurant_ids))
+        if fetch_task is not None:
+            fetched = await fetch_task
             for fetched_id, payload in fetched.items():
                 key = str(fetched_id)
                 if key in aggregated and payload:
@@ -1077,7 +1429,8 @@ Your capabilities:
             restaurant_copy["_matchedTables"] = aggregator.get("matched_tables", [])
             restaurant_copy["_matchedImages"] = aggregator.get("matched_images", [])
             restaurant_copy["_matchScore"] = round(aggregator.get("score", 0.0), 4)
-            restaurant_copy["_matchSources"] = list(aggregator.get("sources", set()))
+            sources_mask = aggregator["sources"]
+            restaurant_copy["_matchSources"] = [name for bit, name in _SRC_NAMES if sources_mask & bit]
             aggregated_restaurants.append(restaurant_copy)
 
             restaurant_name = (
@@ -1093,33 +1446,21 @@ Your capabilities:
                 or aggregator.get("restaurant_id")
             )
 
-            for item in aggregator.get("matched_menus", []):
-                meta = dict(item.get("metadata") or {})
-                meta["_restaurantName"] = restaurant_name
-                meta["_restaurantId"] = restaurant_identifier
-                meta["_matchDistance"] = item.get("distance")
-                aggregated_menus.append(meta)
-
-            for item in aggregator.get("matched_services", []):
-                meta = dict(item.get("metadata") or {})
-                meta["_restaurantName"] = restaurant_name
-                meta["_restaurantId"] = restaurant_identifier
-                meta["_matchDistance"] = item.get("distance")
-                aggregated_services.append(meta)
-
-            for item in aggregator.get("matched_tables", []):
-                meta = dict(item.get("metadata") or {})
-                meta["_restaurantName"] = restaurant_name
-                meta["_restaurantId"] = restaurant_identifier
-                meta["_matchDistance"] = item.get("distance")
-                aggregated_tables.append(meta)
-
-            for item in aggregator.get("matched_images", []):
-                image_meta = dict(item.get("metadata") or {})
-                image_meta["_restaurantName"] = restaurant_name
-                image_meta["_restaurantId"] = restaurant_identifier
-                image_meta["_matchDistance"] = item.get("distance")
-                aggregated_images.append(image_meta)
+            for kind, target in (
+                ("matched_menus", aggregated_menus),
+                ("matched_services", aggregated_services),
+                ("matched_tables", aggregated_tables),
+                ("matched_images", aggregated_images),
+            ):
+                target.extend(
+                    {
+                        **(item.get("metadata") or {}),
+                        "_restaurantName": restaurant_name,
+                        "_restaurantId": restaurant_identifier,
+                        "_matchDistance": item.get("distance"),
+                    }
+                    for item in aggregator[kind]
+                )
 
         aggregated_restaurants.sort(key=lambda r: r.get("_matchScore", 0.0), reverse=True)
 
@@ -1151,10 +1492,7 @@ Your capabilities:
                     price_str += " VNĐ"
                 bullet_parts.append(f"- {price_str}")
             if description:
-                trimmed = description.strip()
-                if len(trimmed) > 60:
-                    trimmed = trimmed[:60].rstrip() + "..."
-                bullet_parts.append(f"- {trimmed}")
+                bullet_parts.append(f"- {_trim_text(description, 60)}")
             lines.append(" ".join(bullet_parts))
         if len(items) > max_items:
             lines.append(f"  • ... và {len(items) - max_items} {label.lower()} khác")
@@ -1172,23 +1510,12 @@ Your capabilities:
             # Lấy recent conversations
             conversations = await self.vector_service.get_user_conversations_recent(user_id, limit=10)
             if not conversations:
-                logger.info(f"No conversation history found for user {user_id}")
+                logger.info("No conversation history found for user %s", user_id)
                 return []
             
             restaurants = []
             seen_names = set()
             
-            # Patterns để extract restaurant names từ assistant responses
-            # ✅ FIX: Chỉ extract từ list restaurants (có số thứ tự), không extract món ăn
-            patterns = [
-                # Format: "1. **Seoul BBQ Premium**" (có số thứ tự ở đầu)
-                r"\n\s*\d+\.\s+\*\*([^*]+?)\*\*",
-                # Format: "**Seoul BBQ Premium**" (không có "- " hoặc "( " phía trước, không có VNĐ sau)
-                r"(?<![-(\s])\*\*([A-Za-z0-9\s\-]+(?:Restaurant|BBQ|Premium|Restaurants|Cafe|Café|Bar|Bistro)?)\*\*(?!\s*[-\()]|\s*-\s*\d+\.?\d*\s*VN?Đ)",
-                # Format: "NHÀ HÀNG - Tên: Seoul BBQ Premium"
-                r"NHÀ HÀNG\s*-\s*Tên:\s*([A-Za-z0-9\s\-]+?)(?:\s|,|$|Địa)",
-            ]
-            
             # Tìm trong assistant messages (những message có format list restaurants)
             for conv in conversations:
                 document = conv.get("document", "")
@@ -1199,53 +1526,50 @@ Your capabilities:
                 if "**" not in document and "NHÀ HÀNG" not in document:
                     continue
                 
-                # Extract restaurant names
-                for pattern in patterns:
-                    matches = re.finditer(pattern, document, re.IGNORECASE | re.MULTILINE)
-                    for match in matches:
-                        name = match.group(1).strip()
-                        
-                        # ✅ FIX: Validate để loại bỏ món ăn
-                        # 1. Check context xung quanh để loại bỏ món ăn (có VNĐ, giá, "- 50.000")
-                        match_start = match.start()
-                        match_end = match.end()
-                        context_before = document[max(0, match_start - 30):match_start].lower()
-                        context_after = document[match_end:min(len(document), match_end + 50)].lower()
-                        
-                        # Loại bỏ nếu có pattern giá cả (VNĐ, đồng, giá, price) trong context
-                        if any(keyword in context_before or keyword in context_after for keyword in [
-                            "vnđ", "đồng", "giá", "price", "- 50", "- 100", "000", "triệu", "k"
-                        ]):
-                            # Nhưng giữ lại nếu có pattern nhà hàng (Restaurant, BBQ, Premium)
-                            if not any(keyword in name.lower() for keyword in [
-                                "restaurant", "bbq", "premium", "cafe", "café", "bar", "bistro"
-                            ]):
-                                logger.debug(f"Skipping '{name}' - looks like a dish (has price context)")
-                                continue
-                        
-                        # 2. Filter out common words và validate
-                        if (len(name) > 3 and 
-                            name.lower() not in ['có', 'là', 'nào', 'và', 'cho', 'món', 'địa chỉ', 'loại', 'rating', 
-                                                  'canh', 'cá', 'cơm', 'bánh', 'lẩu', 'gỏi', 'chả', 'súp', 'salad'] and
-                            # ✅ Loại bỏ tên món ăn phổ biến (thường ngắn và có từ khóa món ăn)
-                            not any(dish_keyword in name.lower() for dish_keyword in [
-                                'canh', 'súp', 'gỏi', 'chả', 'nem', 'bánh', 'cơm', 'lẩu', 'salad'
-                            ]) and
-                            name not in seen_names):
-                            seen_names.add(name)
-                            restaurants.append({
-                                "name": name,
-                                "id": None  # ID sẽ được tìm sau
-                            })
-                            logger.debug(f"Extracted restaurant name from history: {name}")
+                # Extract restaurant names (1 lần quét document cho cả 3 format)
+                for match in _HISTORY_NAME_RE.finditer(document):
+                    name = (match.group("numlist") or match.group("bold") or match.group("label")).strip()
+                    
+                    # Tên quá ngắn hoặc đã lấy rồi → bỏ qua trước khi check context
+                    if len(name) <= 3 or name in seen_names:
+                        continue
+                    
+                    # ✅ FIX: Validate để loại bỏ món ăn
+                    # 1. Check context xung quanh để loại bỏ món ăn (có VNĐ, giá, "- 50.000")
+                    match_start = match.start()
+                    match_end = match.end()
+                    context_before = document[max(0, match_start - 30):match_start].lower()
+                    context_after = document[match_end:min(len(document), match_end + 50)].lower()
+                    
+                    # Loại bỏ nếu có pattern giá cả (VNĐ, đồng, giá, price) trong context
+                    if _PRICE_CONTEXT_RE.search(context_before) or _PRICE_CONTEXT_RE.search(context_after):
+                        # Nhưng giữ lại nếu có pattern nhà hàng (Restaurant, BBQ, Premium)
+                        if not _VENUE_KEYWORD_RE.search(name):
+                            logger.debug("Skipping '%s' - looks like a dish (has price context)", name)
+                            continue
+                    
+                    # 2. Filter out common words + tên món ăn phổ biến (thường ngắn và có từ khóa món ăn)
+                    # Tên dài hơn _MAX_DISH_NAME_LEN gần như chắc chắn là tên nhà hàng → bỏ qua check
+                    if len(name) <= _MAX_DISH_NAME_LEN:
+                        name_lc = name.lower()
+                        if name_lc in _HISTORY_NAME_STOPWORDS or _DISH_KEYWORD_RE.search(name_lc):
+                            continue
+                    
+                    seen_names.add(name)
+                    restaurants.append({
+                        "name": name,
+                        "id": None  # ID sẽ được tìm sau
+                    })
+                    logger.debug("Extracted restaurant name from history: %s", name)
             
             # Limit to top 5 restaurants (thường user chỉ hỏi về 2-3 restaurants)
             restaurants = restaurants[:5]
-            logger.info(f"Extracted {len(restaurants)} restaurants from history: {[r['name'] for r in restaurants]}")
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("Extracted %s restaurants from history: %s", len(restaurants), [r['name'] for r in restaurants])
             return restaurants
             
         except Exception as e:
-            logger.error(f"Error extracting restaurants from history: {e}", exc_info=True)
+            logger.error("Error extracting restaurants from history: %s", e, exc_info=True)
             return []
     
     async def _search_restaurants_by_names_or_ids(
@@ -1262,54 +1586,51 @@ Your capabilities:
             List of restaurant dicts
         """
         try:
-            restaurants = []
+            # 1 set seen_ids dùng chung cho cả 2 phase → không cần pass dedup riêng ở cuối
+            unique_restaurants = []
+            seen_ids = set()
             
             # 1. Search by IDs nếu có
             if restaurant_ids:
                 restaurant_ids = [rid for rid in restaurant_ids if rid is not None]
                 if restaurant_ids:
                     restaurants_by_ids = await self.vector_service.get_restaurants_by_ids(restaurant_ids)
-                    restaurants.extend(restaurants_by_ids.values())
-                    logger.info(f"Found {len(restaurants_by_ids)} restaurants by IDs")
+                    for r in restaurants_by_ids.values():
+                        r_id = self._extract_restaurant_id_from_metadata(r)
+                        if r_id and r_id not in seen_ids:
+                            seen_ids.add(r_id)
+                            unique_restaurants.append(r)
+                    logger.info("Found %s restaurants by IDs", len(restaurants_by_ids))
             
             # 2. Search by names nếu có
             if restaurant_names:
                 restaurant_names = [name for name in restaurant_names if name and name.strip()]
-                if restaurant_names:
-                    # Search từng name với threshold cao hơn (0.6) để catch variations
-                    seen_ids = {self._extract_restaurant_id_from_metadata(r) for r in restaurants}
+                # Search từng name với threshold cao hơn (0.6) để catch variations
+                for name in restaurant_names:
+                    name_lower = name.lower()
+                    # Search với name + keywords để tăng accuracy
+                    query = f"{name} nhà hàng restaurant"
+                    results = await self.vector_service.search_restaurants(
+                        query, limit=3, distance_threshold=0.6
+                    )
                     
-                    for name in restaurant_names:
-                        # Search với name + keywords để tăng accuracy
-                        query = f"{name} nhà hàng restaurant"
-                        results = await self.vector_service.search_restaurants(
-                            query, limit=3, distance_threshold=0.6
-                        )
-                        
-                        for result in results:
-                            result_id = self._extract_restaurant_id_from_metadata(result)
-                            # Check nếu name match (fuzzy)
-                            result_name = result.get("restaurantName") or result.get("name", "")
-                            if (result_id and result_id not in seen_ids and
-                                (name.lower() in result_name.lower() or result_name.lower() in name.lower())):
-                                seen_ids.add(result_id)
-                                restaurants.append(result)
-                                logger.debug(f"Found restaurant by name '{name}': {result_name} (ID: {result_id})")
-            
-            # Remove duplicates
-            seen_ids = set()
-            unique_restaurants = []
-            for r in restaurants:
-                r_id = self._extract_restaurant_id_from_metadata(r)
-                if r_id and r_id not in seen_ids:
-                    seen_ids.add(r_id)
-                    unique_restaurants.append(r)
-            
-            logger.info(f"Found {len(unique_restaurants)} unique restaurants by names/IDs")
+                    for result in results:
+                        result_id = self._extract_restaurant_id_from_metadata(result)
+                        if not result_id or result_id in seen_ids:
+                            continue
+                        # Check nếu name match (fuzzy)
+                        result_name = result.get("restaurantName") or result.get("name", "")
+                        result_name_lower = result_name.lower()
+                        if name_lower in result_name_lower or result_name_lower in name_lower:
+                            seen_ids.add(result_id)
+                            unique_restaurants.append(result)
+                            logger.debug("Found restaurant by name '%s': %s (ID: %s)", name, result_name, result_id)
+            
+            logger.info("Found %s unique restaurants by names/IDs", len(unique_restaurants))
             return unique_restaurants
             
         except Exception as e:
-            logger.error(f"Error searching restaurants by names/IDs: {e}", exc_info=True)
+            logger.error("Error searching restaurants by names/IDs: %s", e, exc_info=True)
             return []
     
     def _normalize_restaurant_item(self, restaurant: Dict) -> Dict:
@@ -1318,7 +1639,7 @@ Your capabilities:
         
         Tương tự _normalize_menu_item, flatten metadata và ensure fields accessible
         """
-        if not restaurant:
+        if not restaurant or restaurant.get(_NORMALIZED_KEY):
             return restaurant
         
         # Nếu đã có fields ở top level → return as is
@@ -1367,6 +1688,7 @@ Your capabilities:
             
             # Preserve metadata for other uses
             restaurant_normalized["metadata"] = metadata
+            restaurant_normalized[_NORMALIZED_KEY] = True
             
             return restaurant_normalized
         
@@ -1397,23 +1719,20 @@ Your capabilities:
                 restaurants_to_compare.append(normalized)
             
             # Get menus cho các restaurants này
-            restaurant_ids = [
-                self._extract_restaurant_id_from_metadata(r) 
+            # Extract id 1 lần cho mỗi restaurant, dùng lại khi gắn menus
+            restaurant_id_pairs = [
+                (r, self._extract_restaurant_id_from_metadata(r))
                 for r in restaurants_to_compare
             ]
-            restaurant_ids = [rid for rid in restaurant_ids if rid is not None]
+            restaurant_ids = [rid for _, rid in restaurant_id_pairs if rid is not None]
             
-            # Get menus for each restaurant
-            menus_by_restaurant = {}
-            for rid in restaurant_ids:
-                menus = await self.vector_service.search_menus(
-                    "", restaurant_id=rid, limit=10, distance_threshold=1.0  # High threshold để lấy tất cả
-                )
-                menus_by_restaurant[rid] = menus
+            # Get menus cho tất cả restaurants trong 1 lần search
+            menus_by_restaurant = await self.vector_service.search_menus_batch(
+                restaurant_ids, limit_per_restaurant=10, distance_threshold=1.0  # High threshold để lấy tất cả
+            )
             
             # Aggregate menus into restaurants
-            for r in restaurants_to_compare:
-                rid = self._extract_restaurant_id_from_metadata(r)
+            for r, rid in restaurant_id_pairs:
                 if rid and rid in menus_by_restaurant:
                     r["_matchedMenus"] = menus_by_restaurant[rid]
             
@@ -1423,16 +1742,18 @@ Your capabilities:
                 restaurants=restaurants_to_compare,
                 menus=[],  # Menus đã được aggregate vào restaurants
                 services=[],
-                user_id=user_id
+                user_id=user_id,
+                allow_direct=False,  # Template chỉ liệt kê, không so sánh
             )
             
         except Exception as e:
-            logger.error(f"Error formatting comparison response: {e}", exc_info=True)
+            logger.error("Error formatting comparison response: %s", e, exc_info=True)
             # Fallback to simple format
             return self._format_multi_data_fallback(restaurants, [], [])
     
     async def _handle_restaurant_search(
-        self, user_message: str, entities: Dict, user_id: str
+        self, user_message: str, entities: Dict, user_id: str,
+        query_vector: Optional[List[float]] = None
     ) -> str:
         """
         Restaurant search với reasoning layer
@@ -1446,18 +1767,22 @@ Your capabilities:
         """
         try:
             # ✅ STEP 0: Detect follow-up questions (so sánh, bạn vừa gợi ý, etc.)
-            message_lower = user_message.lower()
-            is_follow_up = any(keyword in message_lower for keyword in [
-                "so sánh", "bạn vừa gợi ý", "những nhà hàng trên", "nhà hàng trên",
-                "2 nhà hàng", "hai nhà hàng", "các nhà hàng", "những nhà hàng"
-            ])
+            is_follow_up = bool(self._FOLLOW_UP_RE.search(user_message))
             
             if is_follow_up:
-                logger.info(f"Detected follow-up question: {user_message[:100]}...")
+                logger.info("Detected follow-up question: %.100s...", user_message)
+                # Nhà hàng vừa gợi ý còn trong turn state → so sánh luôn, bỏ qua history + name lookup
+                last_suggested = self._get_last_suggested(user_id)
+                if last_suggested:
+                    logger.info("Using %s restaurants suggested in previous turn", len(last_suggested))
+                    return await self._format_comparison_response(
+                        user_message, last_suggested, user_id
+                    )
                 # Extract restaurants từ conversation history
                 restaurants_from_history = await self._extract_restaurants_from_history(user_id)
                 if restaurants_from_history:
-                    logger.info(f"Found {len(restaurants_from_history)} restaurants from history: {[r.get('name', 'N/A') for r in restaurants_from_history]}")
+                    if logger.isEnabledFor(logging.INFO):
+                        logger.info("Found %s restaurants from history: %s", len(restaurants_from_history), [r.get('name', 'N/A') for r in restaurants_from_history])
                     # Search restaurants theo names/IDs từ history
                     restaurants = await self._search_restaurants_by_names_or_ids(
                         [r.get("name") for r in restaurants_from_history if r.get("name")],
@@ -1469,15 +1794,18 @@ Your capabilities:
                             user_message, restaurants, user_id
                         )
                     else:
-                        logger.warning(f"Could not find restaurants by names/IDs from history")
+                        logger.warning("Could not find restaurants by names/IDs from history")
                         # Fallback to normal search
             
             # ✅ STEP 1: LLM Reasoning - Phân tích nhu cầu ăn uống
-            reasoning_profile = await menu_reasoning_service.universal_query_reasoning(user_message)
+            reasoning_profile = await menu_reasoning_service.universal_query_reasoning(
+                user_message, query_vector=query_vector
+            )
             logger.info(
-                f"Restaurant search reasoning: summary='{reasoning_profile.get('summary', 'N/A')}', "
-                f"constraints_text={reasoning_profile.get('constraints_text', [])}, "
-                f"diet_profile={reasoning_profile.get('diet_profile', {})}"
+                "Restaurant search reasoning: summary='%s', constraints_text=%s, diet_profile=%s",
+                reasoning_profile.get('summary', 'N/A'),
+                reasoning_profile.get('constraints_text', []),
+                reasoning_profile.get('diet_profile', {}),
             )
             
             # ✅ STEP 2: Tạo enhanced query từ reasoning
@@ -1495,14 +1823,14 @@ Your capabilities:
             else:
                 enhanced_query = user_message
             
-            logger.debug(f"Restaurant search enhanced query: {enhanced_query[:100]}...")
+            logger.debug("Restaurant search enhanced query: %.100s...", enhanced_query)
             
             # ✅ STEP 3: Extract restaurant_id nếu có
             restaurant_id = entities.get("restaurant_id")
             
             # ✅ STEP 4: Detect collections cần query
             intent_result = {"intent": "restaurant_search"}
-            collections = await self._detect_required_collections(
+            collections = self._detect_required_collections(
                 user_message, intent_result
             )
             
@@ -1512,13 +1840,15 @@ Your capabilities:
                 collections,
                 distance_threshold=0.5,  # CHỈ lấy results gần
                 limit_per_collection=20,
-                restaurant_id=restaurant_id  # ✅ Pass restaurant_id để filter (None nếu generic search)
+                restaurant_id=restaurant_id,  # ✅ Pass restaurant_id để filter (None nếu generic search)
+                # Embedding của message chỉ dùng lại được khi không có enhanced query
+                query_vector=query_vector if enhanced_query == user_message else None
             )
             
             # ✅ STEP 6: Filter theo forbidden_tags (nếu có từ reasoning)
             forbidden_tags = self._extract_forbidden_tags(reasoning_profile)
             if forbidden_tags:
-                logger.info(f"Filtering by forbidden_tags: {forbidden_tags}")
+                logger.info("Filtering by forbidden_tags: %s", forbidden_tags)
                 search_results = self._filter_by_forbidden_tags(search_results, forbidden_tags)
             
             # ✅ STEP 7: Aggregate cross-collection data để liên kết món ăn/dịch vụ ↔ nhà hàng
@@ -1532,7 +1862,7 @@ Your capabilities:
                 cuisine = entities["cuisine_type"].lower()
                 restaurants_enriched = [
                     r for r in restaurants_enriched
-                    if cuisine in (r.get("cuisineType", "") or "").lower()
+                    if cuisine in _lc(r.get("cuisineType", "") or "")
                 ]
 
             if entities.get("restaurant_id") is not None:
@@ -1541,12 +1871,14 @@ Your capabilities:
                     r for r in restaurants_enriched
                     if self._extract_restaurant_id_from_metadata(r) == target_id
                 ]
-
-            allowed_ids = {
-                self._extract_restaurant_id_from_metadata(r)
-                for r in restaurants_enriched
-            }
-            allowed_ids.discard(None)
+                # Còn lại đều có id == target_id → không cần extract lại
+                allowed_ids = {target_id} if restaurants_enriched else set()
+            else:
+                allowed_ids = {
+                    self._extract_restaurant_id_from_metadata(r)
+                    for r in restaurants_enriched
+                }
+                allowed_ids.discard(None)
 
             if allowed_ids:
                 menus_enriched = [
@@ -1572,11 +1904,12 @@ Your capabilities:
             )
             
         except Exception as e:
-            logger.error(f"Error in _handle_restaurant_search: {e}", exc_info=True)
+            logger.error("Error in _handle_restaurant_search: %s", e, exc_info=True)
             return "Xin lỗi, không thể tìm kiếm. Vui lòng thử lại sau."
     
     async def _handle_menu_inquiry(
-        self, user_message: str, entities: Dict, user_id: str
+        self, user_message: str, entities: Dict, user_id: str,
+        query_vector: Optional[List[float]] = None
     ) -> str:
         """
         Menu inquiry với SEMANTIC REASONING
@@ -1586,16 +1919,14 @@ Your capabilities:
         """
         try:
             # ✅ STEP 1: LLM Reasoning - Sinh structured profile (thay vì keywords)
-            reasoning_profile = await menu_reasoning_service.universal_query_reasoning(user_message)
-            logger.info(
-                f"Menu reasoning profile: summary='{reasoning_profile.get('summary', 'N/A')}', "
-                f"constraints_text={reasoning_profile.get('constraints_text', [])}, "
-                f"diet_profile={reasoning_profile.get('diet_profile', {})}, "
-                f"search_query='{reasoning_profile.get('search_query', '')[:80]}...'"
+            # Chạy nền trong lúc tìm restaurant_id ở STEP 2 (2 bước không phụ thuộc nhau)
+            reasoning_task = asyncio.create_task(
+                menu_reasoning_service.universal_query_reasoning(user_message, query_vector=query_vector)
             )
             
             # ✅ STEP 2: Find restaurant first to get restaurant_id
             restaurant_id = None
+            restaurant_task = None
             
             if entities.get("restaurant_id"):
                 restaurant_id = entities["restaurant_id"]
@@ -1609,6 +1940,21 @@ Your capabilities:
                         restaurant_results[0]["metadata"]
                     )
             
+            # Đã biết restaurant_id → lấy chi tiết nhà hàng song song với menu search
+            if restaurant_id:
+                restaurant_task = asyncio.create_task(
+                    self.vector_service.get_restaurants_by_ids([restaurant_id])
+                )
+            
+            reasoning_profile = await reasoning_task
+            logger.info(
+                "Menu reasoning profile: summary='%s', constraints_text=%s, diet_profile=%s, search_query='%.80s...'",
+                reasoning_profile.get('summary', 'N/A'),
+                reasoning_profile.get('constraints_text', []),
+                reasoning_profile.get('diet_profile', {}),
+                reasoning_profile.get('search_query', ''),
+            )
+            
             # ✅ STEP 3: Semantic menu search với reasoning (PRIMARY METHOD)
             menus_enriched = await self.vector_service.semantic_menu_search_with_reasoning(
                 user_message,
@@ -1618,41 +1964,48 @@ Your capabilities:
                 distance_threshold=0.6
             )
             
+            # Chưa có restaurant_id → prefetch nhà hàng của mọi menu hit trong lúc filter
+            # (tập id sau filter là tập con, lọc lại khi ghép kết quả ở STEP 4)
+            if restaurant_task is None and menus_enriched:
+                prefetch_ids = {
+                    rid for rid in (menu.get("metadata", {}).get("restaurant_id") for menu in menus_enriched)
+                    if rid
+                }
+                if prefetch_ids:
+                    restaurant_task = asyncio.create_task(
+                        self.vector_service.get_restaurants_by_ids(list(prefetch_ids))
+                    )
+            
             # ✅ STEP 3.5: Filter theo forbidden_tags (nếu có từ reasoning)
             forbidden_tags = self._extract_forbidden_tags(reasoning_profile)
             if forbidden_tags:
-                logger.info(f"Menu inquiry: Filtering by forbidden_tags: {forbidden_tags}")
-                # Convert menus_enriched to search_results format để dùng filter
-                filtered_search_results = {"menus": menus_enriched}
-                filtered_search_results = self._filter_by_forbidden_tags(filtered_search_results, forbidden_tags)
-                menus_enriched = filtered_search_results.get("menus", menus_enriched)
-                logger.info(f"Menu inquiry: Filtered results: {len(menus_enriched)} menu items after filtering")
+                logger.info("Menu inquiry: Filtering by forbidden_tags: %s", forbidden_tags)
+                menus_enriched = self._filter_menus_by_forbidden_tags(menus_enriched, forbidden_tags)
+                logger.info("Menu inquiry: Filtered results: %s menu items after filtering", len(menus_enriched))
             
             # ✅ STEP 4: Get restaurant context nếu cần
             restaurants_enriched = []
+            restaurants = await restaurant_task if restaurant_task is not None else {}
             if restaurant_id:
                 # Get restaurant details
-                restaurants = await self.vector_service.get_restaurants_by_ids([restaurant_id])
                 if restaurant_id in restaurants:
                     restaurants_enriched.append(restaurants[restaurant_id])
             elif menus_enriched:
-                # Extract restaurant IDs từ menu results
-                restaurant_ids = set()
-                for menu in menus_enriched:
-                    rid = menu.get("metadata", {}).get("restaurant_id")
-                    if rid:
-                        restaurant_ids.add(rid)
-                
-                if restaurant_ids:
-                    restaurants = await self.vector_service.get_restaurants_by_ids(list(restaurant_ids))
-                    restaurants_enriched = list(restaurants.values())
+                # Chỉ giữ nhà hàng còn món sau khi filter (so theo str: id trong payload có thể khác kiểu)
+                restaurant_keys = {
+                    str(rid) for rid in (menu.get("metadata", {}).get("restaurant_id") for menu in menus_enriched)
+                    if rid
+                }
+                restaurants_enriched = [
+                    restaurant for rid, restaurant in restaurants.items() if str(rid) in restaurant_keys
+                ]
             
             # ✅ STEP 5: Format response với enriched data
             # ✅ FIX: Log để debug
-            logger.info(f"Menu inquiry: Final menus_enriched count: {len(menus_enriched)}")
+            logger.info("Menu inquiry: Final menus_enriched count: %s", len(menus_enriched))
             
             if not menus_enriched:
-                logger.warning(f"Menu inquiry: No menus found after reasoning and filtering")
+                logger.warning("Menu inquiry: No menus found after reasoning and filtering")
                 return "Xin lỗi, tôi không tìm thấy món ăn phù hợp với yêu cầu của bạn. Bạn có thể thử tìm kiếm với tiêu chí khác không?"
 
             # ✅ FIX: Ưu tiên dùng kết quả reasoning (menus_enriched đã có 16 món theo log)
@@ -1665,7 +2018,7 @@ Your capabilities:
                     user_id=user_id
                 )
             except Exception as format_error:
-                logger.error(f"Error formatting response with reasoning results: {format_error}", exc_info=True)
+                logger.error("Error formatting response with reasoning results: %s", format_error, exc_info=True)
                 # ✅ FIX: Nếu format fail nhưng vẫn có menus_enriched → thử format lại với fallback formatter
                 return await self._format_multi_data_fallback(
                     restaurants=restaurants_enriched,
@@ -1674,7 +2027,7 @@ Your capabilities:
                 )
             
         except Exception as e:
-            logger.error(f"Error in _handle_menu_inquiry: {e}", exc_info=True)
+            logger.error("Error in _handle_menu_inquiry: %s", e, exc_info=True)
             # ✅ FIX: Không fallback sang basic search nếu đã có kết quả reasoning
             # Chỉ fallback nếu thực sự không có gì
             # Fallback to old method nếu có lỗi nghiêm trọng (không phải lỗi format)
@@ -1682,15 +2035,16 @@ Your capabilities:
                 # Fallback: Regular search không có reasoning (chỉ khi thực sự cần)
                 restaurant_id = entities.get("restaurant_id")
                 if restaurant_id:
-                    logger.warning(f"Menu inquiry: Falling back to basic search for restaurant_id={restaurant_id}")
+                    logger.warning("Menu inquiry: Falling back to basic search for restaurant_id=%s", restaurant_id)
                     menus_enriched = await self.vector_service.search_menus(
                         user_message,
                         restaurant_id=restaurant_id,
                         limit=30,
-                        distance_threshold=0.6
+                        distance_threshold=0.6,
+                        query_vector=query_vector
                     )
                     if menus_enriched:
-                        logger.info(f"Menu inquiry: Fallback search found {len(menus_enriched)} menus")
+                        logger.info("Menu inquiry: Fallback search found %s menus", len(menus_enriched))
                         return await self._format_multi_data_with_ai(
                             user_message,
                             restaurants=[],
@@ -1699,12 +2053,15 @@ Your capabilities:
                             user_id=user_id
                         )
             except Exception as fallback_error:
-                logger.error(f"Fallback search also failed: {fallback_error}")
+                logger.error("Fallback search also failed: %s", fallback_error)
             
             return "Xin lỗi, không thể lấy thực đơn. Vui lòng thử lại sau."
     
     
-    async def _handle_general_inquiry(self, user_message: str, user_id: str) -> str:
+    async def _handle_general_inquiry(
+        self, user_message: str, user_id: str,
+        query_vector: Optional[List[float]] = None
+    ) -> str:
         """General inquiry - Two-Step Search: Find Restaurant → Search Related Data by Restaurant ID"""
         try:
             # ✅ STEP 1: Try to extract restaurant_id from context or previous turn state
@@ -1712,12 +2069,12 @@ Your capabilities:
             
             # Check turn state (follow-up questions)
             turn_state = self.turn_states.get(user_id)
-            if turn_state and turn_state.get("last_restaurant_id"):
-                restaurant_id = turn_state["last_restaurant_id"]
+            if turn_state and turn_state.last_restaurant_id:
+                restaurant_id = turn_state.last_restaurant_id
             
             # ✅ STEP 2: Detect collections
             intent_result = {"intent": "general_inquiry"}
-            collections = await self._detect_required_collections(
+            collections = self._detect_required_collections(
                 user_message, intent_result
             )
             
@@ -1727,7 +2084,8 @@ Your capabilities:
                 collections,
                 distance_threshold=0.5,
                 limit_per_collection=10,
-                restaurant_id=restaurant_id  # ✅ Pass restaurant_id để filter
+                restaurant_id=restaurant_id,  # ✅ Pass restaurant_id để filter
+                query_vector=query_vector
             )
             
             aggregated = await self._aggregate_search_results(search_results)
@@ -1747,7 +2105,7 @@ Your capabilities:
             )
             
         except Exception as e:
-            logger.error(f"Error in _handle_general_inquiry: {e}", exc_info=True)
+            logger.error("Error in _handle_general_inquiry: %s", e, exc_info=True)
             return self._get_fallback_response(user_message)
     
     async def _format_multi_data_with_ai(
@@ -1756,19 +2114,36 @@ Your capabilities:
         restaurants: List[Dict] = None,
         menus: List[Dict] = None,
         services: List[Dict] = None,
-        user_id: str = None
+        user_id: str = None,
+        allow_direct: bool = True
     ) -> str:
-        """Format nhiều loại data với AI - STRICT DATA INJECTION"""
+        """Format nhiều loại data với AI - STRICT DATA INJECTION
+
+        allow_direct=False: luôn cần LLM (vd so sánh), không lấy shortcut template cho ít kết quả
+        """
         
         restaurants = restaurants or []
         menus = menus or []
         services = services or []
         
         # ✅ FIX: Log để debug
-        logger.info(f"_format_multi_data_with_ai: restaurants={len(restaurants)}, menus={len(menus)}, services={len(services)}")
+        logger.info("_format_multi_data_with_ai: restaurants=%s, menus=%s, services=%s", len(restaurants), len(menus), len(services))
+        
+        # Ít kết quả → template đã đủ, bỏ qua LLM round-trip.
+        # USE_LLM_FORMATTER=false để tắt hẳn LLM formatter khi có sự cố
+        item_count = len(restaurants) + len(menus) + len(services)
+        if item_count and (
+            not settings.USE_LLM_FORMATTER
+            or (allow_direct and item_count <= settings.DIRECT_FORMAT_MAX_ITEMS)
+        ):
+            logger.info("_format_multi_data_with_ai: %s items, using direct formatter", item_count)
+            return self._remember_suggested(
+                user_id, restaurants, self._format_multi_data_fallback(restaurants, menus, services)
+            )
         
         # Build STRICT data context cho TẤT CẢ loại data
-        data_context_parts = []
+        # (title, item_lines, total, noun, separator) - cắt theo token budget ở cuối
+        data_sections = []
         
         if restaurants:
             restaurants_to_show = restaurants[:20] if len(restaurants) > 20 else restaurants
@@ -1798,9 +2173,9 @@ Your capabilities:
                     info_lines.append(table_summary)
                 restaurant_block = "\n".join([header_line] + info_lines)
                 restaurant_lines.append(restaurant_block)
-            if len(restaurants) > 20:
-                restaurant_lines.append(f"... và {len(restaurants) - 20} nhà hàng khác.")
-            data_context_parts.append("DANH SÁCH NHÀ HÀNG:\n" + "\n\n".join(restaurant_lines))
+            data_sections.append(
+                ("DANH SÁCH NHÀ HÀNG:\n", restaurant_lines, len(restaurants), "nhà hàng", "\n\n")
+            )
         
         if menus:
             menus_to_show = menus[:30] if len(menus) > 30 else menus
@@ -1829,14 +2204,9 @@ Your capabilities:
                         price_str += " VNĐ"
                     block_lines.append(f"  💰 Giá: {price_str}")
                 if description:
-                    trimmed_desc = description.strip()
-                    if len(trimmed_desc) > 80:
-                        trimmed_desc = trimmed_desc[:80].rstrip() + "..."
-                    block_lines.append(f"  📝 {trimmed_desc}")
+                    block_lines.append(f"  📝 {_trim_text(description, 80)}")
                 menu_lines.append("\n".join(block_lines))
-            if len(menus) > 30:
-                menu_lines.append(f"... và {len(menus) - 30} món khác.")
-            data_context_parts.append("DANH SÁCH MÓN ĂN:\n" + "\n\n".join(menu_lines))
+            data_sections.append(("DANH SÁCH MÓN ĂN:\n", menu_lines, len(menus), "món", "\n\n"))
         
         if services:
             # Không limit vì đã filter theo distance - chỉ giới hạn token (max 15 services)
@@ -1846,126 +2216,86 @@ Your capabilities:
                 service_name = service.get("name") or service.get("serviceName") or "N/A"
                 description = service.get("description") or service.get("serviceDescription") or "N/A"
                 restaurant_name = service.get("_restaurantName") or service.get("restaurantName")
-                line = f"- DỊCH VỤ - {service_name}"
+                line_parts = [f"- DỊCH VỤ - {service_name}"]
                 if restaurant_name:
-                    line += f" (Nhà hàng: {restaurant_name})"
-                line += f": {description}"
-                service_lines.append(line)
-            if len(services) > 15:
-                service_lines.append(f"... và {len(services) - 15} dịch vụ khác.")
-            data_context_parts.append("DANH SÁCH DỊCH VỤ:\n" + "\n".join(service_lines))
+                    line_parts.append(f" (Nhà hàng: {restaurant_name})")
+                line_parts.append(f": {description}")
+                service_lines.append("".join(line_parts))
+            data_sections.append(("DANH SÁCH DỊCH VỤ:\n", service_lines, len(services), "dịch vụ", "\n"))
         
+        # Giới hạn token của prompt → latency/cost mỗi turn có trần cố định
+        data_context_parts = _fit_to_token_budget(data_sections, settings.LLM_CONTEXT_TOKEN_BUDGET)
         data_context = "\n\n".join(data_context_parts)
         
         # ✅ FIX: Log để debug
-        logger.info(f"_format_multi_data_with_ai: data_context length={len(data_context)}, parts={len(data_context_parts)}")
+        logger.info("_format_multi_data_with_ai: data_context length=%s, parts=%s", len(data_context), len(data_context_parts))
         
         if not data_context:
-            logger.warning(f"_format_multi_data_with_ai: No data_context generated (restaurants={len(restaurants)}, menus={len(menus)}, services={len(services)})")
+            logger.warning("_format_multi_data_with_ai: No data_context generated (restaurants=%s, menus=%s, services=%s)", len(restaurants), len(menus), len(services))
             return "Không tìm thấy thông tin phù hợp."
         
-        # STRICT System Prompt
-        has_data_prefix = "ĐÃ " if (restaurants or menus or services) else ""
-        strict_prompt = f"""{self.strict_system_prompt}
-
-DỮ LIỆU THỰC TẾ (CHỈ ĐƯỢC ĐỀ CẬP ĐẾN CÁC THÔNG TIN NÀY):
-{data_context}
-
-HƯỚNG DẪN FORMAT RESPONSE:
-
-- Luôn trả lời bằng tiếng Việt (trừ khi user dùng tiếng Anh).
-
-- Mở đầu bằng 1–2 câu tóm tắt ngắn gọn bối cảnh của user 
-
-  (ví dụ: tập gym, bị cảm, bị sẹo, huyết áp cao...) dựa trên nội dung câu hỏi.
-
-- BẮT BUỘC: Mỗi món ăn/nhà hàng phải được format trên NHIỀU DÒNG, KHÔNG được gộp vào 1 dòng.
-
-- Format MÓN ĂN theo mẫu sau (MỖI THÔNG TIN MỘT DÒNG):
-
-  • **Tên món**
-    🏠 Nhà hàng: Tên nhà hàng
-    💰 Giá: X VNĐ
-    📝 Mô tả ngắn gọn
-
-  Ví dụ cụ thể:
-  • **Canh chua cá lóc**
-    🏠 Nhà hàng: Hải Sản Bà Cường
-    💰 Giá: 50.000 VNĐ
-    📝 Canh chua ngọt với cá lóc tươi, rau thơm
-
-- Format NHÀ HÀNG theo mẫu sau (MỖI THÔNG TIN MỘT DÒNG):
-
-  **Tên nhà hàng**
-  📍 Địa chỉ: ...
-  🍽️ Loại: ...
-  ⭐ Rating: ... (chỉ nếu có)
-
-- SỬ DỤNG XUỐNG DÒNG (\\n) giữa mỗi thông tin. KHÔNG BAO GIỜ gộp tất cả vào 1 dòng dài.
-
-- Sử dụng markdown: **bold**, emoji (🍽️ 📍 ⭐ 💰 🏠 🩹 💪 🤒) để giúp dễ đọc.
-
-QUAN TRỌNG:
-
-- CHỈ được đề cập đến thông tin trong danh sách trên.
-
-- KHÔNG được tự tạo tên nhà hàng, món ăn, dịch vụ, hoặc thông tin nào khác.
-
-- ✅ KHI ĐÃ CÓ DỮ LIỆU trong danh sách → BẮT BUỘC phải gợi ý ít nhất một số món/nhà hàng phù hợp với câu hỏi.
-
-- KHÔNG được trả "Không tìm thấy" nếu {has_data_prefix}có dữ liệu trong danh sách.
-
-- Nếu user hỏi về thông tin không có trong danh sách → trả lời theo dạng:
-
-  "Trong danh sách hiện tại, tôi có thể gợi ý cho bạn những lựa chọn sau..." 
-
-  và dùng các item có sẵn trong dữ liệu.
-
-- Format response tự nhiên, dễ đọc, có xuống dòng hợp lý.
-
-LƯU Ý CUỐI CÙNG - RẤT QUAN TRỌNG:
-- MỖI món ăn phải có TÊN MÓN trên 1 dòng, NHÀ HÀNG trên 1 dòng, GIÁ trên 1 dòng, MÔ TẢ trên 1 dòng.
-- KHÔNG BAO GIỜ viết kiểu: "• **Tên món** 🏠 Nhà hàng: ... 💰 Giá: ... 📝 ..." trên cùng 1 dòng.
-- PHẢI viết:
-  • **Tên món**
-    🏠 Nhà hàng: ...
-    💰 Giá: ...
-    📝 Mô tả
-
-"""
+        # Tới đây luôn có data (data_context rỗng đã return ở trên) → dùng prefix/suffix tĩnh
+        strict_prompt = self._strict_prompt_prefix + data_context + self._strict_prompt_suffix
         
         messages = [
             {"role": "system", "content": strict_prompt},
             {"role": "user", "content": user_message}
         ]
         
-        history = self.conversations.get(user_id, [])
+        history = self.conversations.get(user_id)
         if history:
-            messages = [messages[0]] + history[-4:] + [messages[1]]
+            messages = [messages[0], *_recent_history(history, _FORMATTER_HISTORY_LEN), messages[1]]
         
-        response = await self._call_openai(messages)
+        # Bước format cuối → stream ra client nếu request đang ở chế độ stream
+        response = await self._call_openai(messages, stream=True)
         
         # ✅ FIX: Log response để debug
-        logger.info(f"_format_multi_data_with_ai: LLM response length={len(response) if response else 0}")
+        logger.info("_format_multi_data_with_ai: LLM response length=%s", len(response) if response else 0)
         if response:
-            logger.debug(f"_format_multi_data_with_ai: LLM response preview={response[:200]}...")
+            logger.debug("_format_multi_data_with_ai: LLM response preview=%.200s...", response)
         
         # Fallback nếu AI không hoạt động
         if not response:
-            logger.warning(f"_format_multi_data_with_ai: LLM returned None, using fallback formatter")
-            return self._format_multi_data_fallback(restaurants, menus, services)
+            logger.warning("_format_multi_data_with_ai: LLM returned None, using fallback formatter")
+            return self._remember_suggested(
+                user_id, restaurants, self._format_multi_data_fallback(restaurants, menus, services)
+            )
         
         # ✅ FIX: Nếu LLM trả "Không tìm thấy" nhưng có data → dùng fallback thay vì tin LLM
         if "không tìm thấy" in response.lower() and (restaurants or menus or services):
             logger.warning(
-                f"_format_multi_data_with_ai: LLM returned 'Không tìm thấy' but have data "
-                f"(restaurants={len(restaurants)}, menus={len(menus)}, services={len(services)}), "
-                f"using fallback formatter"
+                "_format_multi_data_with_ai: LLM returned 'Không tìm thấy' but have data "
+                "(restaurants=%d, menus=%d, services=%d), using fallback formatter",
+                len(restaurants),
+                len(menus),
+                len(services),
+            )
+            return self._remember_suggested(
+                user_id, restaurants, self._format_multi_data_fallback(restaurants, menus, services)
             )
-            return self._format_multi_data_fallback(restaurants, menus, services)
         
+        return self._remember_suggested(user_id, restaurants, response)
+    
+    def _remember_suggested(self, user_id: Optional[str], restaurants: List[Dict], response: str) -> str:
+        """Lưu nhà hàng vừa gợi ý vào turn state (top 5, đủ cho so sánh), trả lại response"""
+        if user_id and restaurants:
+            turn_state = self.turn_states.get(user_id)
+            if turn_state is not None:
+                turn_state.last_suggested = restaurants[:5]
+                turn_state.last_suggested_response = response
         return response
     
+    def _get_last_suggested(self, user_id: str) -> Optional[List[Dict]]:
+        """Nhà hàng gợi ý ở turn trước, chỉ khi response cuối trong history đúng là response đó"""
+        turn_state = self.turn_states.get(user_id)
+        if turn_state is None or not turn_state.last_suggested:
+            return None
+        # Turn trước trả lời bằng đường khác (cache hit, availability...) → dữ liệu đã cũ
+        history = self.conversations.get(user_id)
+        if not history or history[-1]["content"] != turn_state.last_suggested_response:
+            return None
+        return turn_state.last_suggested
+    
     async def _format_api_response_with_ai(
         self, user_message: str, api_response: str, response_type: str, user_id: str
     ) -> str:
@@ -1980,9 +2310,11 @@ QUAN TRỌNG:
 - GIỮ NGUYÊN thông tin từ API response
 - KHÔNG được thay đổi hoặc thêm thông tin không có trong API response"""
         
+        # Dữ liệu API đã nằm trong system prompt → user message chỉ mang câu hỏi gốc,
+        # model trả lời thẳng trong 1 lần gọi thay vì nhận payload 2 lần rồi "format lại"
         messages = [
             {"role": "system", "content": strict_prompt},
-            {"role": "user", "content": f"Format lại response này một cách tự nhiên: {api_response}"}
+            {"role": "user", "content": user_message or "Hãy trả lời người dùng một cách tự nhiên."}
         ]
         
         response = await self._call_openai(messages)
@@ -1992,17 +2324,16 @@ QUAN TRỌNG:
         self, restaurants: List[Dict], menus: List[Dict], services: List[Dict]
     ) -> str:
         """Fallback formatting nếu AI không hoạt động"""
-        response_parts = []
+        buf = io.StringIO()
         
         if restaurants:
-            response_parts.append(f"🍽️ **Tìm thấy {len(restaurants)} nhà hàng:**\n\n")
+            buf.write(f"🍽️ **Tìm thấy {len(restaurants)} nhà hàng:**\n\n")
             # Show tất cả restaurants (đã filter theo distance)
             restaurants_to_show = restaurants[:20] if len(restaurants) > 20 else restaurants
             for i, r in enumerate(restaurants_to_show, 1):
                 lines = [
                     f"**{i}. {r.get('restaurantName', r.get('name', 'N/A'))}**",
-                    f"📍 {r.get('address', 'N/A')}",
-                    f"🍽️ {r.get('cuisineType', 'N/A')}"
+                    _restaurant_card_details(str(r.get('address', 'N/A')), str(r.get('cuisineType', 'N/A')))
                 ]
                 menu_summary = self._render_match_summary(r.get("_matchedMenus", []), "Món phù hợp")
                 if menu_summary:
@@ -2010,12 +2341,13 @@ QUAN TRỌNG:
                 service_summary = self._render_match_summary(r.get("_matchedServices", []), "Dịch vụ nổi bật")
                 if service_summary:
                     lines.append(f"• {service_summary}")
-                response_parts.append("\n".join(lines) + "\n\n")
+                buf.write("\n".join(lines))
+                buf.write("\n\n")
             if len(restaurants) > 20:
-                response_parts.append(f"... và {len(restaurants) - 20} nhà hàng khác.\n\n")
+                buf.write(f"... và {len(restaurants) - 20} nhà hàng khác.\n\n")
         
         if menus:
-            response_parts.append(f"🍽️ **Thực đơn:**\n\n")
+            buf.write("🍽️ **Thực đơn:**\n\n")
             # Show tất cả menus (đã filter theo distance)
             menus_to_show = menus[:30] if len(menus) > 30 else menus
             for dish in menus_to_show:
@@ -2036,33 +2368,61 @@ QUAN TRỌNG:
                 )
                 description = dish.get("description")
                 
-                line = f"• **{dish_name}**"
+                buf.write("• **")
+                buf.write(str(dish_name))
+                buf.write("**")
                 if restaurant_name:
-                    line += f" (Nhà hàng: {restaurant_name})"
+                    buf.write(" (Nhà hàng: ")
+                    buf.write(str(restaurant_name))
+                    buf.write(")")
                 if price in (None, "", "N/A"):
-                    line += " - N/A"
+                    buf.write(" - N/A")
                 else:
                     price_str = str(price)
                     if "vnđ" not in price_str.lower() and "đ" not in price_str.lower() and price_str.strip():
                         price_str += " VNĐ"
-                    line += f" - {price_str}"
+                    buf.write(" - ")
+                    buf.write(price_str)
                 if description:
-                    trimmed_desc = description.strip()
-                    if len(trimmed_desc) > 80:
-                        trimmed_desc = trimmed_desc[:80].rstrip() + "..."
-                    line += f" - {trimmed_desc}"
-                response_parts.append(line + "\n")
+                    buf.write(" - ")
+                    buf.write(_trim_text(description, 80))
+                buf.write("\n")
             if len(menus) > 30:
-                response_parts.append(f"... và {len(menus) - 30} món khác.\n")
+                buf.write(f"... và {len(menus) - 30} món khác.\n")
+        
+        if services:
+            if menus:
+                buf.write("\n")
+            buf.write("🛎️ **Dịch vụ:**\n\n")
+            # Cùng giới hạn 15 services như LLM context
+            services_to_show = services[:15] if len(services) > 15 else services
+            for service in services_to_show:
+                service_name = service.get("name") or service.get("serviceName") or "N/A"
+                description = service.get("description") or service.get("serviceDescription")
+                restaurant_name = service.get("_restaurantName") or service.get("restaurantName")
+                
+                buf.write("• **")
+                buf.write(str(service_name))
+                buf.write("**")
+                if restaurant_name:
+                    buf.write(" (Nhà hàng: ")
+                    buf.write(str(restaurant_name))
+                    buf.write(")")
+                if description:
+                    buf.write(" - ")
+                    buf.write(_trim_text(description, 80))
+                buf.write("\n")
+            if len(services) > 15:
+                buf.write(f"... và {len(services) - 15} dịch vụ khác.\n")
         
-        return "".join(response_parts) if response_parts else "Không tìm thấy thông tin."
+        return buf.getvalue() or "Không tìm thấy thông tin."
     
     def _build_messages(self, conversation_id: str, user_message: str) -> List[Dict[str, str]]:
         """Build conversation messages with context"""
-        history = self.conversations.get(conversation_id, [])
+        history = self.conversations.get(conversation_id)
         
         # Keep only last 10 messages for context
-        recent_history = history[-10:] if history else []
+        recent_history = _recent_history(history, 10) if history else []
         
         messages = [
             {"role": "system", "content": self.strict_system_prompt}
@@ -2078,19 +2438,19 @@ QUAN TRỌNG:
     
     def _build_enhanced_messages(self, conversation_id: str, user_message: str, context: str) -> List[Dict[str, str]]:
         """Build enhanced conversation messages với Vector Database context"""
-        history = self.conversations.get(conversation_id, [])
+        history = self.conversations.get(conversation_id)
         
         # Keep only last 10 messages for context
-        recent_history = history[-10:] if history else []
-        
-        # Enhanced system prompt với context
-        enhanced_system_prompt = self.strict_system_prompt
-        if context:
-            enhanced_system_prompt += f"\n\nRelevant context from previous conversations:\n{context}"
+        recent_history = _recent_history(history, 10) if history else []
         
+        # System prompt giữ nguyên từng byte (prefix cache của OpenAI), context đi message riêng
         messages = [
-            {"role": "system", "content": enhanced_system_prompt}
+            {"role": "system", "content": self.strict_system_prompt}
         ]
+        if context:
+            messages.append(
+                {"role": "system", "content": f"Relevant context from previous conversations:\n{context}"}
+            )
         
         # Add conversation history
         messages.extend(recent_history)
@@ -2100,17 +2460,57 @@ QUAN TRỌNG:
         
         return messages
     
-    async def _call_openai(self, messages: List[Dict[str, str]]) -> Optional[str]:
-        """Call OpenAI API với strict settings để giảm hallucination"""
+    async def _call_openai(self, messages: List[Dict[str, str]], stream: bool = False) -> Optional[str]:
+        """Call OpenAI API với strict settings để giảm hallucination
+
+        ``stream=True`` chỉ có tác dụng khi request đang chạy qua ``handle_message_stream``:
+        chunk được đẩy ra client ngay khi có, kết quả trả về vẫn là full text.
+        """
         if not self.openai_client:
             if settings.OPENAI_API_KEY:
-                self.openai_client = OpenAI(api_key=settings.OPENAI_API_KEY)
+                # AsyncOpenAI tạo 1 lần, reuse connection pool cho mọi request
+                self.openai_client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
             else:
                 return None
 
+        cache_key = self._llm_cache_key(messages)
+        cached = self._llm_cache.get(cache_key)
+        sink = _stream_sink.get() if stream else None
+        if cached is not None:
+            logger.info("_call_openai: cache hit, length=%s", len(cached))
+            if sink is not None:
+                sink(cached)
+            return cached
+
+        # Single-flight: prompt y hệt đang chờ API → đợi chung kết quả, không gọi thêm lần nữa
+        inflight = self._llm_inflight.get(cache_key)
+        if inflight is not None:
+            logger.info("_call_openai: joining in-flight request")
+            # shield: request này bị huỷ không được huỷ future dùng chung
+            response = await asyncio.shield(inflight)
+            if response and sink is not None:
+                sink(response)
+            return response
+
+        future = asyncio.get_running_loop().create_future()
+        self._llm_inflight[cache_key] = future
+        response = None
         try:
-            completion = await asyncio.to_thread(
-                self.openai_client.chat.completions.create,
+            if sink is not None:
+                response = await self._stream_openai(messages, sink)
+            else:
+                response = await self._complete_openai(messages)
+            if response:
+                self._llm_cache[cache_key] = response
+            return response
+        finally:
+            del self._llm_inflight[cache_key]
+            future.set_result(response)
+
+    async def _complete_openai(self, messages: List[Dict[str, str]]) -> Optional[str]:
+        """Non-streaming completion, trả text đã strip hoặc None nếu lỗi"""
+        try:
+            completion = await self.openai_client.chat.completions.create(
                 model=settings.OPENAI_MODEL,
                 messages=messages,
                 temperature=0.3,  # Lower temperature để giảm hallucination
@@ -2120,46 +2520,109 @@ QUAN TRỌNG:
             if completion.choices:
                 response = completion.choices[0].message.content.strip()
                 # ✅ FIX: Log response để debug
-                logger.info(f"_call_openai: Response length={len(response)}, preview={response[:150]}...")
+                logger.info("_call_openai: Response length=%s, preview=%.150s...", len(response), response)
                 return response
             logger.warning("_call_openai: No choices in completion")
             return None
 
         except Exception as e:
-            logger.error(f"OpenAI API error: {e}", exc_info=True)
+            logger.error("OpenAI API error: %s", e, exc_info=True)
+            return None
+
+    @staticmethod
+    def _llm_cache_key(messages: List[Dict[str, str]]) -> str:
+        """Hash ổn định của toàn bộ messages (system prompt + history + user message)"""
+        payload = orjson.dumps(messages, option=orjson.OPT_SORT_KEYS)
+        return blake2b(payload, digest_size=16).hexdigest()
+
+    async def _stream_openai(
+        self, messages: List[Dict[str, str]], sink: Callable[[str], None]
+    ) -> Optional[str]:
+        """Streaming completion: đẩy từng delta ra sink, trả full text giống _call_openai"""
+        try:
+            stream = await self.openai_client.chat.completions.create(
+                model=settings.OPENAI_MODEL,
+                messages=messages,
+                temperature=0.3,
+                max_tokens=500,
+                stream=True,
+            )
+            parts = []
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    sink(delta)
+            
+            response = "".join(parts).strip()
+            logger.info("_stream_openai: Response length=%s, chunks=%s", len(response), len(parts))
+            return response or None
+
+        except Exception as e:
+            logger.error("OpenAI streaming API error: %s", e, exc_info=True)
             return None
 
+    async def aclose(self):
+        """Chờ background tasks (lưu conversation, learn) xong rồi đóng OpenAI client (gọi khi app shutdown)"""
+        if self._background_tasks:
+            # Có trần thời gian để shutdown không bị treo nếu vector DB/LLM chậm
+            _, pending = await asyncio.wait(
+                set(self._background_tasks), timeout=self.BACKGROUND_DRAIN_TIMEOUT
+            )
+            for task in pending:
+                task.cancel()
+            if pending:
+                logger.warning("Cancelled %s background tasks on shutdown", len(pending))
+        if self.openai_client is not None:
+            await self.openai_client.close()
+            self.openai_client = None
+
     def _store_conversation(self, conversation_id: str, user_message: str, response: str):
         """Store conversation history"""
-        if conversation_id not in self.conversations:
-            self.conversations[conversation_id] = []
-        
-        self.conversations[conversation_id].extend([
-            {"role": "user", "content": user_message},
-            {"role": "assistant", "content": response}
-        ])
-        # Keep conversation history bounded to avoid unbounded memory growth.
-        if len(self.conversations[conversation_id]) > 20:
-            self.conversations[conversation_id] = self.conversations[conversation_id][-20:]
+        # deque(maxlen) tự bỏ message cũ nhất, không cần slice/copy mỗi turn
+        history = self.conversations.get(conversation_id)
+        if history is None:
+            history = self.conversations[conversation_id] = deque(maxlen=_HISTORY_MAXLEN)
+        
+        history.append({"role": "user", "content": user_message})
+        history.append({"role": "assistant", "content": response})
     
     def _get_fallback_response(self, user_message: str) -> str:
         """Fallback responses for common queries"""
         message_lower = user_message.lower()
-        
-        if any(keyword in message_lower for keyword in ["giờ", "open", "hour"]):
-            return "Nhà hàng mở cửa từ 10:00 đến 22:00 mỗi ngày. Bạn muốn đặt bàn khung giờ nào?"
-        
-        elif any(keyword in message_lower for keyword in ["địa chỉ", "address", "ở đâu"]):
-            return "Nhà hàng nằm tại trung tâm thành phố. Bạn có thể tìm kiếm nhà hàng gần vị trí của bạn không?"
-        
-        elif any(keyword in message_lower for keyword in ["giá", "price", "cost"]):
-            return "Giá cả tùy thuộc vào món ăn và nhà hàng. Bạn muốn xem menu của nhà hàng nào?"
-        
-        else:
-            return "Tôi là trợ lý đặt bàn nhà hàng. Tôi có thể giúp bạn tìm nhà hàng, xem menu, đặt bàn hoặc kiểm tra voucher. Bạn cần hỗ trợ gì?"
+        for pattern, reply in _FALLBACK_REPLIES:
+            if pattern.search(message_lower):
+                return reply
+        return _DEFAULT_FALLBACK_REPLY
     
+    def start_vector_database_initialization(self) -> bool:
+        """Chạy initialize_vector_database nền, trả False nếu đang có 1 lần init chạy dở"""
+        if self._init_task is not None and not self._init_task.done():
+            return False
+        self.init_progress = {"state": "running", "done": 0, "total": 0, "failed": 0}
+        self._init_task = asyncio.create_task(self.initialize_vector_database())
+        return True
+
+    async def wait_vector_database_initialization(self):
+        """Chờ lần init nền hiện tại xong (shield: request bị huỷ không huỷ init)"""
+        if self._init_task is not None:
+            await asyncio.shield(self._init_task)
+
+    async def cancel_vector_database_initialization(self):
+        """Huỷ init đang chạy nền (gọi khi app shutdown)"""
+        if self._init_task is not None and not self._init_task.done():
+            self._init_task.cancel()
+            try:
+                await self._init_task
+            except asyncio.CancelledError:
+                self.init_progress["state"] = "cancelled"
+        self._init_task = None
+
     async def initialize_vector_database(self):
         """Initialize Vector Database với restaurant data + Intent Embeddings"""
+        self.init_progress = {"state": "running", "done": 0, "total": 0, "failed": 0}
         try:
             logger.info("Initializing Vector Database...")
             
@@ -2175,90 +2638,116 @@ QUAN TRỌNG:
             from app.services.spring_api_client import spring_api_client
             
             restaurants = await spring_api_client.get_all_restaurants()
-            if restaurants:
-                # Store restaurant data in vector database
-                await self.vector_service.store_restaurant_data(restaurants)
-                logger.info(f"Stored {len(restaurants)} restaurants in Vector Database")
-                
-                # Store additional data for ALL restaurants
-                total_restaurants = len(restaurants)
-                for i, restaurant in enumerate(restaurants):
-                    restaurant_id = (
-                        restaurant.get('id')
-                        or restaurant.get('restaurantId')
-                        or restaurant.get('restaurantID')
-                    )
-                    if restaurant_id:
-                        try:
-                            # Store menu data
-                            menu = await spring_api_client.get_restaurant_menu(restaurant_id)
-                            if menu:
-                                logger.debug(
-                                    "Fetched %d menu items for restaurant %s. Sample: %s",
-                                    len(menu),
-                                    restaurant_id,
-                                    menu[0] if isinstance(menu, list) and menu else menu,
-                                )
-                                await self.vector_service.store_menu_data(restaurant_id, menu)
-                                logger.info(f"Stored menu for restaurant {restaurant_id} ({i+1}/{total_restaurants})")
-                            else:
-                                logger.warning(f"No menu data for restaurant {restaurant_id}")
-                            
-                            # Store restaurant services
-                            services = await spring_api_client.get_restaurant_services(restaurant_id)
-                            if services:
-                                logger.debug(
-                                    "Fetched %d services for restaurant %s. Sample: %s",
-                                    len(services),
-                                    restaurant_id,
-                                    services[0] if isinstance(services, list) and services else services,
-                                )
-                                await self.vector_service.store_services_data(restaurant_id, services)
-                                logger.info(f"Stored services for restaurant {restaurant_id}")
-                            
-                            tables = await spring_api_client.get_restaurant_tables(restaurant_id)
-                            if tables:
-                                logger.debug(
-                                    "Fetched %d tables for restaurant %s. Sample: %s",
-                                    len(tables),
-                                    restaurant_id,
-                                    tables[0] if isinstance(tables, list) and tables else tables,
-                                )
-                                await self.vector_service.store_tables_data(restaurant_id, tables)
-                                logger.info(f"Stored tables for restaurant {restaurant_id}")
-                            
-                            # Store table layouts
-                            table_layouts = await spring_api_client.get_table_layouts(restaurant_id)
-                            if table_layouts:
-                                logger.debug(
-                                    "Fetched %d table layouts for restaurant %s. Sample: %s",
-                                    len(table_layouts),
-                                    restaurant_id,
-                                    table_layouts[0] if isinstance(table_layouts, list) and table_layouts else table_layouts,
-                                )
-                                await self.vector_service.store_table_layouts_data(restaurant_id, table_layouts)
-                                logger.info(f"Stored table layouts for restaurant {restaurant_id}")
-                                
-                        except Exception as e:
-                            logger.error(f"Error storing data for restaurant {restaurant_id}: {e}")
-                            continue
-            
-            logger.info("Vector Database initialization completed")
+            self.init_progress["total"] = len(restaurants)
+            
+            # Fetch + store theo group (bounded): memory không tăng theo số nhà hàng, group lỗi
+            # chỉ mất group đó; group sau được fetch trong lúc group trước đang encode/upsert
+            semaphore = asyncio.Semaphore(settings.INIT_FETCH_CONCURRENCY)
+            group_size = max(1, settings.INIT_STORE_GROUP_SIZE)
+            groups = [restaurants[i:i + group_size] for i in range(0, len(restaurants), group_size)]
+            next_fetch = (
+                asyncio.create_task(self._fetch_restaurant_group(spring_api_client, groups[0], semaphore))
+                if groups else None
+            )
+            try:
+                for index, group in enumerate(groups):
+                    details, failed = await next_fetch
+                    next_fetch = None
+                    if index + 1 < len(groups):
+                        next_fetch = asyncio.create_task(
+                            self._fetch_restaurant_group(spring_api_client, groups[index + 1], semaphore)
+                        )
+                    try:
+                        await self.vector_service.store_restaurant_details_bulk(details, restaurants=group)
+                    except Exception as e:
+                        logger.error("Error storing group of %s restaurants: %s", len(group), e)
+                        failed = len(group)
+                    self.init_progress["failed"] += failed
+                    self.init_progress["done"] += len(group)
+            finally:
+                if next_fetch is not None:
+                    next_fetch.cancel()
+            
+            if self.init_progress["failed"]:
+                logger.warning(
+                    "Vector Database initialization partial: %s/%s restaurants failed",
+                    self.init_progress["failed"], len(restaurants),
+                )
+                self.init_progress["state"] = "partial"
+            else:
+                logger.info("Vector Database initialization completed")
+                self.init_progress["state"] = "completed"
             
         except Exception as e:
-            logger.error(f"Error initializing Vector Database: {e}")
+            logger.error("Error initializing Vector Database: %s", e)
+            self.init_progress.update(state="failed", error=str(e))
+    
+    async def _fetch_restaurant_group(
+        self, spring_api_client, restaurants: List[Dict], semaphore: asyncio.Semaphore
+    ) -> Tuple[List[Tuple[Any, List[Dict], List[Dict], List[Dict], List[Dict]]], int]:
+        """Fetch details của 1 group nhà hàng, trả về (details, số nhà hàng fetch lỗi)"""
+        results = await asyncio.gather(
+            *(self._fetch_restaurant_details(spring_api_client, restaurant, semaphore)
+              for restaurant in restaurants),
+            return_exceptions=True,
+        )
+        details = [result for result in results if isinstance(result, tuple)]
+        failed = sum(1 for result in results if isinstance(result, BaseException))
+        return details, failed
+    
+    async def _fetch_restaurant_details(
+        self, spring_api_client, restaurant: Dict, semaphore: asyncio.Semaphore
+    ) -> Optional[Tuple[Any, List[Dict], List[Dict], List[Dict], List[Dict]]]:
+        """Fetch menu/services/tables/layouts của 1 nhà hàng cùng lúc (lỗi được raise cho caller)"""
+        restaurant_id = (
+            restaurant.get('id')
+            or restaurant.get('restaurantId')
+            or restaurant.get('restaurantID')
+        )
+        if not restaurant_id:
+            return None
+        
+        try:
+            async with semaphore:
+                menu, services, tables, table_layouts = await asyncio.gather(
+                    spring_api_client.get_restaurant_menu(restaurant_id),
+                    spring_api_client.get_restaurant_services(restaurant_id),
+                    spring_api_client.get_restaurant_tables(restaurant_id),
+                    spring_api_client.get_table_layouts(restaurant_id),
+                )
+        except Exception as e:
+            logger.error("Error fetching data for restaurant %s: %s", restaurant_id, e)
+            raise
+        
+        if menu:
+            logger.debug(
+                "Fetched %d menu items for restaurant %s. Sample: %s",
+                len(menu),
+                restaurant_id,
+                menu[0] if isinstance(menu, list) and menu else menu,
+            )
+        else:
+            logger.warning("No menu data for restaurant %s", restaurant_id)
+        logger.debug(
+            "Fetched %d services, %d tables, %d table layouts for restaurant %s",
+            len(services or []),
+            len(tables or []),
+            len(table_layouts or []),
+            restaurant_id,
+        )
+        return restaurant_id, menu, services, tables, table_layouts
     
     async def get_vector_database_stats(self) -> Dict[str, any]:
         """Get statistics về Vector Database"""
         try:
-            stats = self.vector_service.get_collection_stats()
+            stats = await asyncio.to_thread(self.vector_service.get_collection_stats)
             return {
                 "status": "healthy",
                 "collections": stats,
                 "total_items": sum(stats.values())
             }
         except Exception as e:
-            logger.error(f"Error getting Vector Database stats: {e}")
+            logger.error("Error getting Vector Database stats: %s", e)
             return {
                 "status": "error",
                 "error": str(e)
@@ -2270,3 +2759,8 @@ restaurant_agent = RestaurantAgent()
 # Backward compatibility
 async def handle_message(payload: MessageRequest) -> MessageResponse:
     return await restaurant_agent.handle_message(payload)
+
+
+async def handle_message_stream(payload: MessageRequest) -> AsyncIterator[Dict[str, str]]:
+    async for event in restaurant_agent.handle_message_stream(payload):
+        yield event
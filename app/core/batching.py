@@ -0,0 +1,66 @@
+"""Async micro-batching helper."""
+
+import asyncio
+from typing import Any, Awaitable, Callable, List, Optional, Sequence, Set, Tuple, Union
+
+
+class MicroBatcher:
+    """Gom các request tới gần nhau thành 1 lần gọi ``batch_fn``.
+
+    Request được giữ tối đa ``max_wait`` giây (hoặc tới khi đủ ``max_batch``) rồi flush;
+    ``batch_fn`` nhận list input, trả list output cùng thứ tự. Hàm sync chạy trong worker
+    thread; coroutine function được await trực tiếp trên event loop (tự quyết phần nào
+    offload). Dùng cho model embedding: encode 1 batch rẻ hơn nhiều so với N lần lẻ.
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[[List[Any]], Union[Sequence[Any], Awaitable[Sequence[Any]]]],
+        max_batch: int = 32,
+        max_wait: float = 0.005,
+    ):
+        self._batch_fn = batch_fn
+        self._is_async = asyncio.iscoroutinefunction(batch_fn)
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._pending: List[Tuple[Any, asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        # Giữ reference tới batch đang chạy để không bị GC trước khi xong
+        self._running: Set[asyncio.Task] = set()
+
+    async def submit(self, item: Any) -> Any:
+        """Thêm 1 input vào batch hiện tại, chờ kết quả tương ứng"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run(self, batch: List[Tuple[Any, asyncio.Future]]):
+        try:
+            items = [item for item, _ in batch]
+            if self._is_async:
+                results = await self._batch_fn(items)
+            else:
+                results = await asyncio.to_thread(self._batch_fn, items)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
@@ -0,0 +1,76 @@
+"""Small in-process cache helpers."""
+
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Iterator, MutableMapping, Optional, Tuple
+
+
+class TTLCache(MutableMapping):
+    """Dict-like LRU cache with a per-entry TTL.
+
+    Dùng cho state theo user (turn state, conversation history) để memory không
+    tăng vô hạn theo số user trong process sống lâu. Entry hết hạn bị bỏ khi
+    truy cập; entry cũ nhất bị evict khi vượt quá ``maxsize``.
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: float,
+        timer: Callable[[], float] = time.monotonic,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._timer = timer
+        self._data: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
+
+    def __getitem__(self, key: Hashable) -> Any:
+        value, expires_at = self._data[key]
+        if expires_at <= self._timer():
+            del self._data[key]
+            raise KeyError(key)
+        # Truy cập gia hạn TTL + đưa lên cuối LRU
+        self._data[key] = (value, self._timer() + self.ttl)
+        self._data.move_to_end(key)
+        return value
+
+    def __setitem__(self, key: Hashable, value: Any):
+        self._data[key] = (value, self._timer() + self.ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def __delitem__(self, key: Hashable):
+        del self._data[key]
+
+    def __contains__(self, key: object) -> bool:
+        entry = self._data.get(key)
+        return entry is not None and entry[1] > self._timer()
+
+    def __iter__(self) -> Iterator[Hashable]:
+        self.expire()
+        return iter(list(self._data))
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Optional[Any] = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def setdefault(self, key: Hashable, default: Optional[Any] = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            self[key] = default
+            return default
+
+    def expire(self) -> int:
+        """Xoá toàn bộ entry đã hết hạn, trả về số entry bị xoá"""
+        now = self._timer()
+        expired = [key for key, (_, expires_at) in self._data.items() if expires_at <= now]
+        for key in expired:
+            del self._data[key]
+        return len(expired)
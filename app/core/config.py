@@ -32,6 +32,61 @@ class Settings(BaseSettings):
     OPENAI_MODEL: str = Field("gpt-4o-mini", description="Model for OpenAI chat")
     OPENAI_TEMPERATURE: float = Field(0.4, description="Creativity for OpenAI responses")
 
+    SESSION_CACHE_SIZE: int = Field(10_000, description="Max users kept in turn state / conversation memory")
+    SESSION_TTL: float = Field(3600.0, description="Seconds of inactivity before a user's session state is dropped")
+
+    EMBEDDING_CACHE_SIZE: int = Field(10_000, description="Max cached query embeddings")
+    EMBEDDING_CACHE_TTL: float = Field(600.0, description="Seconds a cached query embedding stays valid")
+
+    EMBEDDING_BATCH_SIZE: int = Field(32, description="Max concurrent query embeddings encoded in one batch")
+    EMBEDDING_BATCH_WAIT_MS: float = Field(
+        5.0, description="Milliseconds a query embedding waits for others to join its batch"
+    )
+
+    CONVERSATION_BATCH_SIZE: int = Field(32, description="Max conversations encoded and upserted in one write")
+    CONVERSATION_BATCH_WAIT_MS: float = Field(
+        50.0, description="Milliseconds a conversation write waits for others to join its batch"
+    )
+
+    RESPONSE_CACHE_SIZE: int = Field(512, description="Max entries in the semantic response cache")
+    RESPONSE_CACHE_TTL: float = Field(600.0, description="Seconds a cached chat response stays valid")
+    RESPONSE_CACHE_AVAILABILITY_TTL: float = Field(
+        60.0, description="Shorter TTL for availability answers (data changes quickly)"
+    )
+    RESPONSE_CACHE_SIMILARITY: float = Field(
+        0.92, description="Minimum cosine similarity for a semantic cache hit"
+    )
+
+    LLM_CACHE_SIZE: int = Field(10_000, description="Max cached LLM completions keyed by prompt hash")
+    LLM_CACHE_TTL: float = Field(600.0, description="Seconds a cached LLM completion stays valid")
+
+    LLM_CONTEXT_TOKEN_BUDGET: int = Field(
+        4000, description="Approximate token budget for the data context injected into the formatting prompt"
+    )
+
+    USE_LLM_FORMATTER: bool = Field(
+        True, description="Format search results with the LLM; disable to always use the template formatter"
+    )
+    DIRECT_FORMAT_MAX_ITEMS: int = Field(
+        3, description="Result sets with at most this many restaurants + dishes + services skip the LLM formatter"
+    )
+
+    INIT_FETCH_CONCURRENCY: int = Field(
+        16, description="Max restaurants whose details are fetched concurrently during vector DB initialization"
+    )
+    INIT_STORE_GROUP_SIZE: int = Field(
+        20, description="Restaurants fetched and stored together per step during vector DB initialization"
+    )
+    INIT_VECTOR_DB_ON_STARTUP: bool = Field(
+        False, description="Start vector DB initialization in the background when the app starts"
+    )
+
+    REASONING_CACHE_SIZE: int = Field(1000, description="Max cached LLM reasoning profiles")
+    REASONING_CACHE_TTL: float = Field(3600.0, description="Seconds a cached reasoning profile stays valid")
+    REASONING_CACHE_SIMILARITY: float = Field(
+        0.95, description="Minimum cosine similarity to reuse a reasoning profile for a paraphrased message"
+    )
+
     model_config = {
         "env_file": ENV_FILE,
         "case_sensitive": True,
@@ -1,7 +1,14 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
+from app.agents.restaurant_agent import restaurant_agent
 from app.core.config import load_environment
+from app.services.menu_reasoning_service import menu_reasoning_service
+from app.services.menu_tagging_service import menu_tagging_service
+from app.services.spring_api_client import spring_api_client
+from app.services.vector_intent_service import vector_intent_service
 from app.routers import chat, health, sync, vector
 import logging
 
@@ -13,10 +20,27 @@ logging.basicConfig(
 # Load configuration once so environment-specific settings are ready.
 _settings = load_environment()
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Init chạy nền → app nhận traffic/health check ngay, không chờ ingest xong
+    if _settings.INIT_VECTOR_DB_ON_STARTUP:
+        restaurant_agent.start_vector_database_initialization()
+    yield
+    # Đóng các client dùng chung khi shutdown
+    await restaurant_agent.cancel_vector_database_initialization()
+    await restaurant_agent.aclose()
+    await vector_intent_service.aclose()
+    await menu_reasoning_service.aclose()
+    await menu_tagging_service.aclose()
+    spring_api_client.close()
+
+
 app = FastAPI(
     title="Restaurant Chatbot Service",
     version="2.0.0",
     description="Conversational AI agent for restaurant support.",
+    lifespan=lifespan,
 )
 
 # Add CORS middleware
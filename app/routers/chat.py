@@ -1,7 +1,10 @@
 # app/routers/chat.py
+import json
+
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from app.models import MessageRequest, MessageResponse
-from app.agents.restaurant_agent import handle_message
+from app.agents.restaurant_agent import handle_message, handle_message_stream
 
 router = APIRouter(prefix="/chat", tags=["Chat"])
 
@@ -16,4 +19,23 @@ async def chat_endpoint(payload: MessageRequest):
     if not payload.userId.strip():
         raise HTTPException(status_code=400, detail="UserId is required.")
     
-    return await handle_message(payload)
\ No newline at end of file
+    return await handle_message(payload)
+
+
+@router.post("/stream")
+async def chat_stream_endpoint(payload: MessageRequest):
+    """
+    Streaming chat endpoint (Server-Sent Events) - event "delta" cho từng chunk LLM, "final" cho response đầy đủ
+    """
+    if not payload.message.strip():
+        raise HTTPException(status_code=400, detail="Message cannot be empty.")
+    
+    if not payload.userId.strip():
+        raise HTTPException(status_code=400, detail="UserId is required.")
+    
+    async def _sse():
+        async for event in handle_message_stream(payload):
+            data = json.dumps({"content": event["content"]}, ensure_ascii=False)
+            yield f"event: {event['event']}\ndata: {data}\n\n"
+    
+    return StreamingResponse(_sse(), media_type="text/event-stream")
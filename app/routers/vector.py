@@ -1,25 +1,56 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Response, status
 from app.agents.restaurant_agent import restaurant_agent
 
 router = APIRouter(prefix="/vector", tags=["Vector Database"])
 
-@router.post("/initialize")
-async def initialize_vector_database():
+@router.post("/initialize", status_code=status.HTTP_202_ACCEPTED)
+async def initialize_vector_database(response: Response, wait: bool = False):
     """
     Initialize Vector Database với restaurant data từ Spring API
+
+    Mặc định chạy nền và trả về 202 ngay (theo dõi qua GET /vector/initialize/status);
+    ``wait=true`` để chờ init xong như trước (200, hoặc 500 nếu init failed/partial).
     """
     try:
-        await restaurant_agent.initialize_vector_database()
-        return {
-            "status": "success",
-            "message": "Vector Database initialized successfully"
-        }
+        started = restaurant_agent.start_vector_database_initialization()
+        if wait:
+            await restaurant_agent.wait_vector_database_initialization()
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Failed to initialize Vector Database: {str(e)}"
         )
 
+    if not wait:
+        return {
+            "status": "started" if started else "running",
+            "message": "Vector Database initialization started" if started else "Vector Database initialization is already running",
+            "progress": restaurant_agent.init_progress
+        }
+
+    progress = restaurant_agent.init_progress
+    if progress.get("state") != "completed":
+        reason = progress.get("error") or progress.get("state")
+        if progress.get("state") == "partial":
+            reason = f"{progress.get('failed')}/{progress.get('total')} restaurants failed"
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to initialize Vector Database: {reason}"
+        )
+    response.status_code = status.HTTP_200_OK
+    return {
+        "status": "success",
+        "message": "Vector Database initialized successfully",
+        "progress": progress
+    }
+
+@router.get("/initialize/status")
+async def get_initialization_status():
+    """
+    Tiến độ init Vector Database (state, done/total nhà hàng)
+    """
+    return restaurant_agent.init_progress
+
 @router.get("/stats")
 async def get_vector_database_stats():
     """
@@ -234,3 +234,7 @@ class FunctionService:
     
     
     # Không cần response template nữa
+
+
+# Global instance
+function_service = FunctionService()
@@ -2,12 +2,13 @@
 Menu Reasoning Service - LLM-based reasoning để sinh structured profile
 Thay vì dùng keyword list, dùng ontology nhỏ (high_protein, low_fat, occasion, temperature...)
 """
+import copy
 import json
 import logging
-import asyncio
-from typing import Dict, Any, Optional
-from openai import OpenAI
+from typing import Dict, Any, List, Optional
+from openai import AsyncOpenAI
 from app.core.config import settings
+from app.services.response_cache import SemanticResponseCache
 
 logger = logging.getLogger(__name__)
 
@@ -15,8 +16,21 @@ logger = logging.getLogger(__name__)
 class MenuReasoningService:
     """Service để LLM reasoning và sinh structured profile từ user query"""
     
+    _PROFILE_SIGNATURE = "universal_query_reasoning"
+    
+    # Giá trị enum hợp lệ cho structured fields
+    _VALID_OCCASIONS = frozenset({"gym", "sick", "comfort", "celebration", "any"})
+    _VALID_TEMPERATURES = frozenset({"hot", "cold", "any"})
+    _VALID_SPICE_LEVELS = frozenset({"mild", "medium", "spicy", "any"})
+    
     def __init__(self):
         self.openai_client = None
+        # Cache profile theo message (exact) + embedding (paraphrase) → bỏ qua LLM call cho câu hỏi lặp lại
+        self._profile_cache = SemanticResponseCache(
+            max_entries=settings.REASONING_CACHE_SIZE,
+            ttl_seconds=settings.REASONING_CACHE_TTL,
+            similarity_threshold=settings.REASONING_CACHE_SIMILARITY,
+        )
         self._default_profile = {
             # Structured fields (để boost/filter cho cases phổ biến)
             "diet_profile": {
@@ -38,25 +52,35 @@ class MenuReasoningService:
             "summary": ""  # Tóm tắt ngắn gọn nhu cầu
         }
     
-    def _get_openai_client(self) -> Optional[OpenAI]:
+    def _get_openai_client(self) -> Optional[AsyncOpenAI]:
         """Get OpenAI client (lazy init)"""
         if not self.openai_client:
             if settings.OPENAI_API_KEY:
-                self.openai_client = OpenAI(api_key=settings.OPENAI_API_KEY)
+                self.openai_client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
             else:
                 logger.warning("OpenAI API key not available for menu reasoning")
         return self.openai_client
     
-    async def universal_query_reasoning(self, user_message: str) -> Dict[str, Any]:
+    async def aclose(self):
+        """Đóng HTTP connection pool của OpenAI client (gọi khi app shutdown)"""
+        if self.openai_client is not None:
+            await self.openai_client.close()
+            self.openai_client = None
+    
+    async def universal_query_reasoning(
+        self, user_message: str, query_vector: Optional[List[float]] = None
+    ) -> Dict[str, Any]:
         """
         LLM reasoning để sinh hybrid profile: structured fields + text fields
         
         Strategy:
         - Structured fields (boolean/enum) → boost/filter cho cases phổ biến
         - Text fields (goals, constraints_text, search_query, summary) → semantic search không bao giờ bị thiếu
+        - Profile được cache theo message; nếu có query_vector thì message gần nghĩa cũng dùng lại profile
         
         Args:
             user_message: User query về món ăn
+            query_vector: Embedding của user_message (nếu caller đã tính sẵn)
             
         Returns:
             {
@@ -75,6 +99,11 @@ class MenuReasoningService:
                 "summary": "..."
             }
         """
+        cached = self._profile_cache.lookup(self._PROFILE_SIGNATURE, user_message, query_vector)
+        if cached is not None:
+            logger.debug("Reasoning profile cache hit for message: %s", user_message[:50])
+            return copy.deepcopy(cached)
+        
         try:
             client = self._get_openai_client()
             if not client:
@@ -294,8 +323,7 @@ LƯU Ý CUỐI:
             ]
             
             # Call OpenAI với JSON response format
-            response = await asyncio.to_thread(
-                client.chat.completions.create,
+            response = await client.chat.completions.create(
                 model=settings.OPENAI_MODEL,
                 messages=messages,
                 temperature=0.2,  # Low temperature để reasoning chính xác
@@ -320,6 +348,10 @@ LƯU Ý CUỐI:
                             validated_result["search_query"] = user_message
                     
                     logger.info(f"Menu reasoning result: summary='{validated_result['summary']}', search_query='{validated_result.get('search_query', '')[:50]}...'")
+                    # Chỉ cache kết quả LLM hợp lệ (không cache fallback khi lỗi)
+                    self._profile_cache.store(
+                        self._PROFILE_SIGNATURE, user_message, query_vector, copy.deepcopy(validated_result)
+                    )
                     return validated_result
                     
                 except json.JSONDecodeError as e:
@@ -354,18 +386,15 @@ LƯU Ý CUỐI:
         
         # Validate occasion
         occasion = profile.get("occasion", "any")
-        valid_occasions = ["gym", "sick", "comfort", "celebration", "any"]
-        validated["occasion"] = occasion if occasion in valid_occasions else "any"
+        validated["occasion"] = occasion if isinstance(occasion, str) and occasion in self._VALID_OCCASIONS else "any"
         
         # Validate temperature
         temperature = profile.get("temperature", "any")
-        valid_temperatures = ["hot", "cold", "any"]
-        validated["temperature"] = temperature if temperature in valid_temperatures else "any"
+        validated["temperature"] = temperature if isinstance(temperature, str) and temperature in self._VALID_TEMPERATURES else "any"
         
         # Validate spice_level
         spice_level = profile.get("spice_level", "any")
-        valid_spice_levels = ["mild", "medium", "spicy", "any"]
-        validated["spice_level"] = spice_level if spice_level in valid_spice_levels else "any"
+        validated["spice_level"] = spice_level if isinstance(spice_level, str) and spice_level in self._VALID_SPICE_LEVELS else "any"
         
         # Validate cuisine
         cuisine = profile.get("cuisine", [])
@@ -6,7 +6,7 @@ import json
 import logging
 import asyncio
 from typing import Dict, Any, List, Optional
-from openai import OpenAI
+from openai import AsyncOpenAI
 from app.core.config import settings
 from app.services.vector_service import vector_service
 from app.services.spring_api_client import spring_api_client
@@ -20,15 +20,21 @@ class MenuTaggingService:
     def __init__(self):
         self.openai_client = None
     
-    def _get_openai_client(self) -> Optional[OpenAI]:
+    def _get_openai_client(self) -> Optional[AsyncOpenAI]:
         """Get OpenAI client (lazy init)"""
         if not self.openai_client:
             if settings.OPENAI_API_KEY:
-                self.openai_client = OpenAI(api_key=settings.OPENAI_API_KEY)
+                self.openai_client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
             else:
                 logger.warning("OpenAI API key not available for menu tagging")
         return self.openai_client
     
+    async def aclose(self):
+        """Đóng HTTP connection pool của OpenAI client (gọi khi app shutdown)"""
+        if self.openai_client is not None:
+            await self.openai_client.close()
+            self.openai_client = None
+    
     async def tag_menu_item(self, dish: Dict[str, Any]) -> Dict[str, Any]:
         """
         Tag một menu item với LLM
@@ -112,8 +118,7 @@ Lưu ý:
                 {"role": "user", "content": f"Phân tích món ăn này và trả về tags:\n{dish_info}"}
             ]
             
-            response = await asyncio.to_thread(
-                client.chat.completions.create,
+            response = await client.chat.completions.create(
                 model=settings.OPENAI_MODEL,
                 messages=messages,
                 temperature=0.2,  # Low temperature để tagging chính xác
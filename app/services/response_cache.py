@@ -0,0 +1,144 @@
+"""
+Semantic Response Cache - Cache response của agent theo (intent, entities) + embedding của message
+Traffic chatbot lặp lại nhiều (cùng loại ẩm thực, cùng "ngày mai tối") → trả lại response cũ
+khi message mới đủ giống về ngữ nghĩa, bỏ qua vector search + LLM formatting.
+"""
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class SemanticResponseCache:
+    """In-process LRU cache, lookup theo signature trước rồi so cosine similarity của embedding"""
+
+    def __init__(
+        self,
+        max_entries: int = 512,
+        ttl_seconds: float = 600.0,
+        similarity_threshold: float = 0.92,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        # {(signature, normalized_message): (unit_vector, response, expires_at)}
+        # response thường là str (chat response) nhưng có thể là object bất kỳ (vd: reasoning profile)
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[np.ndarray, Any, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def build_signature(intent: str, entities: Optional[Dict[str, Any]]) -> str:
+        """Signature ổn định cho (intent, entities) - entities có thể chứa list/dict nên dùng JSON"""
+        entities_key = json.dumps(entities or {}, sort_keys=True, ensure_ascii=False, default=str)
+        return f"{intent}|{entities_key}"
+
+    @staticmethod
+    def _normalize_message(message: str) -> str:
+        return " ".join(message.lower().split())
+
+    @staticmethod
+    def _to_unit_vector(vector: Sequence[float]) -> Optional[np.ndarray]:
+        if vector is None or len(vector) == 0:
+            return None
+        array = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(array))
+        if norm == 0.0:
+            return None
+        return array / norm
+
+    def lookup(self, signature: str, message: str, vector: Optional[Sequence[float]]) -> Optional[Any]:
+        """Trả về response đã cache nếu cùng signature và cosine similarity >= threshold"""
+        now = time.monotonic()
+        exact_key = (signature, self._normalize_message(message))
+
+        # Fast path: cùng message (sau normalize) → không cần so vector
+        entry = self._entries.get(exact_key)
+        if entry is not None and entry[2] > now:
+            self._entries.move_to_end(exact_key)
+            self.hits += 1
+            return entry[1]
+
+        query = self._to_unit_vector(vector)
+        best_key = None
+        best_similarity = self.similarity_threshold
+        expired: List[Tuple[str, str]] = []
+        candidate_keys: List[Tuple[str, str]] = []
+        candidate_vectors: List[np.ndarray] = []
+
+        if query is not None:
+            for key, (cached_vector, _, expires_at) in self._entries.items():
+                if expires_at <= now:
+                    expired.append(key)
+                    continue
+                if key[0] != signature or cached_vector.shape != query.shape:
+                    continue
+                candidate_keys.append(key)
+                candidate_vectors.append(cached_vector)
+
+        if candidate_vectors:
+            # 1 phép matmul cho tất cả candidates thay vì np.dot từng entry trong Python loop
+            similarities = np.stack(candidate_vectors) @ query
+            # Hoà điểm → entry mới nhất thắng (giống so sánh >= tuần tự trước đây)
+            best_index = len(similarities) - 1 - int(np.argmax(similarities[::-1]))
+            if similarities[best_index] >= best_similarity:
+                best_similarity = float(similarities[best_index])
+                best_key = candidate_keys[best_index]
+
+        for key in expired:
+            self._entries.pop(key, None)
+
+        if best_key is None:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(best_key)
+        self.hits += 1
+        logger.debug(
+            "Semantic response cache hit (similarity=%.3f) for message: %s",
+            best_similarity,
+            message[:50],
+        )
+        return self._entries[best_key][1]
+
+    def store(
+        self,
+        signature: str,
+        message: str,
+        vector: Sequence[float],
+        response: Any,
+        ttl_seconds: Optional[float] = None,
+    ):
+        """Lưu response; ttl_seconds override TTL mặc định (vd: kết quả check_availability)"""
+        unit_vector = self._to_unit_vector(vector)
+        if unit_vector is None or not response:
+            return
+
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        key = (signature, self._normalize_message(message))
+        self._entries[key] = (unit_vector, response, time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+# Global instance
+response_cache = SemanticResponseCache(
+    max_entries=settings.RESPONSE_CACHE_SIZE,
+    ttl_seconds=settings.RESPONSE_CACHE_TTL,
+    similarity_threshold=settings.RESPONSE_CACHE_SIMILARITY,
+)
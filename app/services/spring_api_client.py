@@ -1,4 +1,6 @@
 # app/services/spring_api_client.py
+import asyncio
+import orjson
 import requests
 import logging
 from typing import List, Dict, Any, Optional
@@ -16,6 +18,14 @@ class SpringAPIClient:
             'User-Agent': 'RestaurantChatbot/1.0'
         }
         self.timeout = 10
+        # 1 Session dùng chung → keep-alive, không phải mở TCP/TLS mới cho mỗi call.
+        # Pool đủ cho fan-out lúc init (mỗi nhà hàng gọi 4 endpoint song song)
+        pool_size = max(10, settings.INIT_FETCH_CONCURRENCY * 4)
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
     
     def _make_request(self, method: str, endpoint: str, **kwargs) -> Optional[Dict[str, Any]]:
         """Helper method để gọi API với error handling"""
@@ -23,16 +33,16 @@ class SpringAPIClient:
             url = f"{self.base_url}{endpoint}"
             logger.info(f"Đang gọi API: {method} {url}")
             
-            response = requests.request(
+            response = self.session.request(
                 method=method,
                 url=url,
-                headers=self.headers,
                 timeout=self.timeout,
                 **kwargs
             )
             
             if response.ok:
-                return response.json()
+                # orjson parse thẳng từ bytes, nhanh hơn response.json() với payload lớn (init vector DB)
+                return orjson.loads(response.content)
             else:
                 logger.error(f"API trả về status {response.status_code}: {response.text}")
                 return None
@@ -47,35 +57,43 @@ class SpringAPIClient:
             logger.error(f"Lỗi không xác định - {endpoint}: {e}")
             return None
     
+    def close(self):
+        """Đóng connection pool (gọi khi app shutdown)"""
+        self.session.close()
+    
+    async def _request(self, method: str, endpoint: str, **kwargs) -> Optional[Dict[str, Any]]:
+        """_make_request chạy trong worker thread → không block event loop, gather được nhiều call"""
+        return await asyncio.to_thread(self._make_request, method, endpoint, **kwargs)
+    
     # ==================== RESTAURANT APIs ====================
     
     async def get_all_restaurants(self) -> List[Dict[str, Any]]:
         """Lấy danh sách tất cả nhà hàng"""
-        result = self._make_request('GET', '/api/booking/restaurants')
+        result = await self._request('GET', '/api/booking/restaurants')
         return result if result else []
     
     async def get_restaurant_details(self, restaurant_id: int) -> Optional[Dict[str, Any]]:
         """Lấy chi tiết nhà hàng"""
-        return self._make_request('GET', f'/api/booking/restaurants/{restaurant_id}')
+        return await self._request('GET', f'/api/booking/restaurants/{restaurant_id}')
     
     async def get_restaurant_menu(self, restaurant_id: int) -> List[Dict[str, Any]]:
         """Lấy menu nhà hàng"""
-        result = self._make_request('GET', f'/api/booking/restaurants/{restaurant_id}/dishes')
+        result = await self._request('GET', f'/api/booking/restaurants/{restaurant_id}/dishes')
         return result if result else []
     
     async def get_restaurant_services(self, restaurant_id: int) -> List[Dict[str, Any]]:
         """Lấy dịch vụ nhà hàng"""
-        result = self._make_request('GET', f'/api/booking/restaurants/{restaurant_id}/services')
+        result = await self._request('GET', f'/api/booking/restaurants/{restaurant_id}/services')
         return result if result else []
     
     async def get_restaurant_tables(self, restaurant_id: int) -> List[Dict[str, Any]]:
         """Lấy danh sách bàn nhà hàng"""
-        result = self._make_request('GET', f'/api/booking/restaurants/{restaurant_id}/tables')
+        result = await self._request('GET', f'/api/booking/restaurants/{restaurant_id}/tables')
         return result if result else []
     
     async def get_table_layouts(self, restaurant_id: int) -> List[Dict[str, Any]]:
         """Lấy table layouts của nhà hàng"""
-        result = self._make_request('GET', f'/api/booking/restaurants/{restaurant_id}/table-layouts')
+        result = await self._request('GET', f'/api/booking/restaurants/{restaurant_id}/table-layouts')
         return result if result else []
     
     # ==================== BOOKING APIs ====================
@@ -90,12 +108,12 @@ class SpringAPIClient:
         if selected_table_ids:
             params['selectedTableIds'] = ','.join(map(str, selected_table_ids))
         
-        return self._make_request('GET', '/api/booking/availability-check', params=params)
+        return await self._request('GET', '/api/booking/availability-check', params=params)
     
     async def get_available_time_slots(self, table_id: int, date: str) -> Optional[Dict[str, Any]]:
         """Lấy danh sách time slots khả dụng cho một bàn"""
         params = {'date': date}
-        return self._make_request('GET', f'/api/booking/conflicts/available-slots/{table_id}', params=params)
+        return await self._request('GET', f'/api/booking/conflicts/available-slots/{table_id}', params=params)
     
     # ==================== PUBLIC APIs ONLY ====================
     # Chỉ giữ lại các API public không cần authentication
@@ -106,7 +124,7 @@ class SpringAPIClient:
         if restaurant_id:
             params['restaurantId'] = restaurant_id
         
-        result = self._make_request('GET', '/api/vouchers/demo', params=params)
+        result = await self._request('GET', '/api/vouchers/demo', params=params)
         return result if result else []
     
     # ==================== LEGACY METHODS (Backward Compatibility) ====================
@@ -6,7 +6,7 @@ import asyncio
 from typing import Dict, List, Optional, Any
 from app.services.vector_service import vector_service
 from app.core.config import settings
-from openai import OpenAI
+from openai import AsyncOpenAI
 
 logger = logging.getLogger(__name__)
 
@@ -68,6 +68,12 @@ class VectorIntentService:
         
         # Intent embeddings sẽ được init khi gọi initialize_intent_embeddings()
     
+    async def aclose(self):
+        """Đóng HTTP connection pool của OpenAI client (gọi khi app shutdown)"""
+        if self.openai_client is not None:
+            await self.openai_client.close()
+            self.openai_client = None
+    
     async def recognize_intent_with_context(self, user_message: str, user_id: str = None) -> Dict[str, Any]:
         """
         Auto Intent Recognition với Intent Embedding Collection FIRST + LLM + Vector + Pattern
@@ -324,7 +330,7 @@ class VectorIntentService:
             # Initialize OpenAI client nếu chưa có
             if not self.openai_client:
                 if settings.OPENAI_API_KEY:
-                    self.openai_client = OpenAI(api_key=settings.OPENAI_API_KEY)
+                    self.openai_client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
                 else:
                     logger.warning("OpenAI API key not available, skipping LLM classification")
                     return {
@@ -377,8 +383,7 @@ Lưu ý:
             })
             
             # Call OpenAI
-            response = await asyncio.to_thread(
-                self.openai_client.chat.completions.create,
+            response = await self.openai_client.chat.completions.create(
                 model=settings.OPENAI_MODEL,
                 messages=messages,
                 temperature=0.1,  # Low temperature để classification chính xác
@@ -989,7 +994,7 @@ Lưu ý:
         """LLM-based entity extraction using OpenAI"""
         try:
             if not self.openai_client:
-                self.openai_client = OpenAI(api_key=settings.OPENAI_API_KEY)
+                self.openai_client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
             
             # Build dynamic prompt based on intent
             if intent == "table_inquiry":
@@ -1035,7 +1040,7 @@ Lưu ý:
                 return {}
             
             # Call OpenAI API
-            response = self.openai_client.chat.completions.create(
+            response = await self.openai_client.chat.completions.create(
                 model="gpt-4o-mini",
                 messages=[
                     {"role": "system", "content": "You are an entity extraction system. Extract entities from Vietnamese text and return JSON only."},
@@ -1316,7 +1321,7 @@ Lưu ý:
                             suggestions.append(f"Xem menu nhà hàng {data['restaurant_id']}")
             
             # Remove duplicates và limit
-            suggestions = list(set(suggestions))[:3]
+            suggestions = list(dict.fromkeys(suggestions))[:3]
             
             logger.info(f"Generated {len(suggestions)} personalized suggestions for user {user_id}")
             return suggestions
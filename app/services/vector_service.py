@@ -1,12 +1,19 @@
+import ast
+import asyncio
 import json
 import logging
 import os
+import threading
 import time
+import unicodedata
 import uuid
-from typing import Optional, Dict, List, Any
+from types import MappingProxyType
+from typing import Optional, Dict, List, Any, Tuple
 import warnings
 warnings.filterwarnings("ignore", category=FutureWarning, module="huggingface_hub")
 
+import numpy as np
+import orjson
 from qdrant_client import QdrantClient
 from qdrant_client.http.models import (
     Distance,
@@ -19,9 +26,50 @@ from qdrant_client.http.models import (
 )
 from sentence_transformers import SentenceTransformer
 
+from app.core.batching import MicroBatcher
+from app.core.cache import TTLCache
+from app.core.rwlock import ReadWriteLock
+from app.core.config import settings
+
 logger = logging.getLogger(__name__)
 
 
+# ingredient_tags → mô tả tiếng Việt trong searchable text của món ăn
+_INGREDIENT_LABELS = MappingProxyType({
+    "beef": "có thịt bò",
+    "pork": "có thịt heo",
+    "chicken": "có thịt gà",
+    "seafood": "có hải sản",
+    "shrimp": "có tôm",
+    "crab": "có cua",
+    "squid": "có mực",
+    "clam": "có nghêu/sò",
+    "fish": "có cá",
+    "egg": "có trứng",
+    "milk": "có sữa",
+    "peanut": "có đậu phộng",
+    "soy": "có đậu nành/đậu phụ",
+})
+
+
+def parse_tag_list(value) -> List[Any]:
+    """Tags trong metadata có thể là list hoặc string (repr của list) → luôn trả về list"""
+    if isinstance(value, str):
+        if not value:
+            return []
+        if not value.startswith("["):
+            return [value]
+        # Payload thường lưu JSON → orjson.loads nhanh hơn nhiều so với ast.literal_eval
+        try:
+            value = orjson.loads(value)
+        except ValueError:
+            try:
+                value = ast.literal_eval(value)
+            except Exception:
+                value = [value]
+    return value if isinstance(value, list) else []
+
+
 class VectorService:
     """Vector Database Service sử dụng Qdrant embedded và Sentence Transformers."""
 
@@ -32,17 +80,42 @@ class VectorService:
     INTENTS_COLLECTION = "intents"  # NEW: Intent Embedding Collection
     IMAGE_URL_COLLECTION = "image_url"
 
+    ENCODE_BATCH_SIZE = 64  # batch_size cho SentenceTransformer.encode
+    UPSERT_BATCH_SIZE = 500  # số point tối đa mỗi lần upsert
+
     def __init__(self):
         try:
             persist_dir = os.getenv("QDRANT_DB_PATH", "storage/qdrant")
             os.makedirs(persist_dir, exist_ok=True)
             self.client = QdrantClient(path=persist_dir)
+            # Embedded Qdrant không có locking: đọc (search/scroll/retrieve/count) chạy song song
+            # trong worker thread, ghi (upsert/delete) độc quyền
+            self._client_lock = ReadWriteLock()
             logger.info("Qdrant embedded client initialised at %s", persist_dir)
 
             self.model = SentenceTransformer("paraphrase-multilingual-MiniLM-L12-v2")
             self.vector_size = self.model.get_sentence_embedding_dimension()
             logger.info("Sentence Transformer model loaded successfully (dim=%s)", self.vector_size)
 
+            # Cache embedding của query (message lặp lại nhiều, 1 turn encode cùng message nhiều lần)
+            self._query_embedding_cache = TTLCache(
+                settings.EMBEDDING_CACHE_SIZE, settings.EMBEDDING_CACHE_TTL
+            )
+            # encode_query có thể chạy trong worker thread (asyncio.to_thread)
+            self._query_embedding_lock = threading.Lock()
+            # Query của các request đồng thời được gom thành 1 lần encode (aencode_query)
+            self._query_batcher = MicroBatcher(
+                self.encode_texts,
+                max_batch=settings.EMBEDDING_BATCH_SIZE,
+                max_wait=settings.EMBEDDING_BATCH_WAIT_MS / 1000,
+            )
+            # Conversation của nhiều request → 1 lần encode + 1 lần upsert
+            self._conversation_batcher = MicroBatcher(
+                self._store_conversations_batch,
+                max_batch=settings.CONVERSATION_BATCH_SIZE,
+                max_wait=settings.CONVERSATION_BATCH_WAIT_MS / 1000,
+            )
+
             self._ensure_collections()
         except Exception as e:
             logger.error(f"Error initializing VectorService: {e}")
@@ -74,6 +147,22 @@ class VectorService:
 
         logger.info("All Qdrant collections ready")
 
+    def _read_client(self, method, *args, **kwargs):
+        with self._client_lock.read():
+            return method(*args, **kwargs)
+
+    def _write_client(self, method, *args, **kwargs):
+        with self._client_lock.write():
+            return method(*args, **kwargs)
+
+    async def _aread_client(self, method, *args, **kwargs):
+        """Gọi method đọc của Qdrant client trong worker thread, giữ shared lock"""
+        return await asyncio.to_thread(self._read_client, method, *args, **kwargs)
+
+    async def _awrite_client(self, method, *args, **kwargs):
+        """Gọi upsert/delete trong worker thread, giữ exclusive lock (chờ search đang chạy xong)"""
+        return await asyncio.to_thread(self._write_client, method, *args, **kwargs)
+
     def encode_text(self, text: str) -> List[float]:
         """Encode text to vector embedding."""
         try:
@@ -82,6 +171,81 @@ class VectorService:
             logger.error(f"Error encoding text: {e}")
             return []
 
+    def encode_texts(self, texts: List[str]) -> List[List[float]]:
+        """Encode nhiều text trong 1 lần gọi model (batch inference nhanh hơn nhiều so với từng text)."""
+        if not texts:
+            return []
+        try:
+            return self.model.encode(texts, batch_size=self.ENCODE_BATCH_SIZE).tolist()
+        except Exception as e:
+            logger.error(f"Error encoding texts: {e}")
+            return [[] for _ in texts]
+
+    async def _upsert_encoded(self, collection_name: str, specs: List[Tuple[str, Any, Dict]]) -> int:
+        """Encode searchable text của các point theo chunk (worker thread) rồi upsert từng chunk.
+
+        specs: [(searchable_text, point_id, payload)], trả về số point đã upsert.
+        Mỗi chunk tối đa UPSERT_BATCH_SIZE point → bộ nhớ vector bị chặn, event loop không bị
+        model.encode chiếm cả dataset.
+        """
+        stored = 0
+        for start in range(0, len(specs), self.UPSERT_BATCH_SIZE):
+            chunk = specs[start:start + self.UPSERT_BATCH_SIZE]
+            vectors = await asyncio.to_thread(self.encode_texts, [text for text, _, _ in chunk])
+            points = []
+            for (_, point_id, payload), vector in zip(chunk, vectors):
+                if not vector:
+                    logger.warning("Failed to encode point %s for %s", point_id, collection_name)
+                    continue
+                points.append(PointStruct(id=point_id, vector=vector, payload=payload))
+            if points:
+                await self._awrite_client(
+                    self.client.upsert, collection_name=collection_name, points=points
+                )
+                stored += len(points)
+        return stored
+
+    @staticmethod
+    def _normalize_query(text: str) -> str:
+        return " ".join(unicodedata.normalize("NFKC", text or "").lower().split())
+
+    def _get_cached_query_vector(self, key: str) -> Optional[List[float]]:
+        with self._query_embedding_lock:
+            cached = self._query_embedding_cache.get(key)
+        # Copy ra list mới mỗi lần → caller sửa list cũng không làm hỏng cache
+        return cached.tolist() if cached is not None else None
+
+    def _cache_query_vector(self, key: str, vector: List[float]):
+        # float32 array ~1.5KB/384-d thay vì list Python float ~12KB, không mất độ chính xác
+        # (model trả float32 sẵn)
+        compact = np.asarray(vector, dtype=np.float32)
+        with self._query_embedding_lock:
+            self._query_embedding_cache[key] = compact
+
+    def encode_query(self, text: str) -> List[float]:
+        """Encode search query với LRU/TTL cache theo message đã normalize."""
+        key = self._normalize_query(text)
+        cached = self._get_cached_query_vector(key)
+        if cached is not None:
+            return cached
+
+        vector = self.encode_text(text)
+        if vector:
+            self._cache_query_vector(key, vector)
+        return vector
+
+    async def aencode_query(self, text: str) -> List[float]:
+        """Async encode_query: cache miss được gom batch với query của các request đồng thời."""
+        key = self._normalize_query(text)
+        cached = self._get_cached_query_vector(key)
+        if cached is not None:
+            return cached
+
+        vector = await self._query_batcher.submit(text)
+        if vector:
+            self._cache_query_vector(key, vector)
+        return vector
+
     def _build_filter(self, field_pairs: Dict[str, Optional[str]]) -> Optional[Filter]:
         conditions = []
         for key, value in field_pairs.items():
@@ -106,6 +270,14 @@ class VectorService:
             )
         return formatted
 
+    @staticmethod
+    def _score_threshold(distance_threshold: float) -> float:
+        """distance = 1 - cosine score → distance < threshold tương đương score > 1 - threshold.
+
+        Truyền xuống Qdrant để point quá xa bị loại ngay trong engine, không phải format rồi mới filter.
+        """
+        return 1.0 - distance_threshold
+
     def _make_point_id(self, collection: str, *parts: Any, allow_int: bool = False):
         """Generate a Qdrant-compatible point ID for given parts."""
         valid_parts = [part for part in parts if part is not None]
@@ -165,37 +337,53 @@ class VectorService:
             
             user_id = user_id.strip()  # Sanitize
             
-            conversation_text = f"User: {message}\nAssistant: {response}"
-            vector = self.encode_text(conversation_text)
+            # Gom với conversation của các request đồng thời → encode/upsert theo batch
+            stored = await self._conversation_batcher.submit(
+                (user_id, message, response, intent, int(time.time()))
+            )
+            if stored:
+                logger.info(f"Stored conversation for user {user_id} (intent: {intent})")
 
+        except Exception as e:
+            logger.error(f"Error storing conversation: {e}")
+
+    async def _store_conversations_batch(
+        self, items: List[Tuple[str, str, str, Optional[str], int]]
+    ) -> List[bool]:
+        """Encode (worker thread) + upsert 1 lần cho cả batch conversation, trả về stored/không theo thứ tự"""
+        texts = [f"User: {message}\nAssistant: {response}" for _, message, response, _, _ in items]
+        vectors = await asyncio.to_thread(self.encode_texts, texts)
+
+        points = []
+        stored = []
+        for (user_id, message, response, intent, timestamp), text, vector in zip(items, texts, vectors):
             if not vector:
                 logger.warning("Failed to encode conversation text")
-                return
+                stored.append(False)
+                continue
 
             # Point ID bao gồm user_id để dễ query và delete sau này
             conversation_id = self._make_point_id(
-                self.CONVERSATIONS_COLLECTION, user_id, int(time.time())
+                self.CONVERSATIONS_COLLECTION, user_id, timestamp
             )
             
             payload = {
                 "user_id": user_id,  # ✅ REQUIRED - Luôn có trong payload
-                "timestamp": str(int(time.time())),
+                "timestamp": str(timestamp),
                 "intent": intent or "unknown",
                 "message_length": len(message),
                 "response_length": len(response),
-                "document": conversation_text,
+                "document": text,
                 "point_id": str(conversation_id),
             }
+            points.append(PointStruct(id=conversation_id, vector=vector, payload=payload))
+            stored.append(True)
 
-            self.client.upsert(
-                collection_name=self.CONVERSATIONS_COLLECTION,
-                points=[PointStruct(id=conversation_id, vector=vector, payload=payload)],
+        if points:
+            await self._awrite_client(
+                self.client.upsert, collection_name=self.CONVERSATIONS_COLLECTION, points=points
             )
-
-            logger.info(f"Stored conversation for user {user_id} (intent: {intent})")
-
-        except Exception as e:
-            logger.error(f"Error storing conversation: {e}")
+        return stored
 
     async def get_user_conversations_recent(
         self, user_id: str, limit: int = 10
@@ -225,7 +413,8 @@ class VectorService:
             offset = None
             
             while True:
-                points, offset = self.client.scroll(
+                points, offset = await self._aread_client(
+                    self.client.scroll,
                     collection_name=self.CONVERSATIONS_COLLECTION,
                     limit=100,
                     offset=offset,
@@ -290,7 +479,7 @@ class VectorService:
             List of similar conversations
         """
         try:
-            query_vector = self.encode_text(query)
+            query_vector = self.encode_query(query)
             if not query_vector:
                 return []
 
@@ -301,7 +490,8 @@ class VectorService:
 
             # ✅ FIX: Search không dùng filter (Qdrant local mode không hỗ trợ)
             # Tăng limit để có đủ kết quả sau khi filter
-            results = self.client.search(
+            results = await self._aread_client(
+                self.client.search,
                 collection_name=self.CONVERSATIONS_COLLECTION,
                 query_vector=query_vector,
                 limit=limit * 5,  # ✅ Tăng để có đủ kết quả sau khi filter
@@ -352,7 +542,8 @@ class VectorService:
             
             offset = None
             while True:
-                points, offset = self.client.scroll(
+                points, offset = await self._aread_client(
+                    self.client.scroll,
                     collection_name=self.CONVERSATIONS_COLLECTION,
                     limit=100,
                     filter=filter_obj,
@@ -372,7 +563,8 @@ class VectorService:
                 return 0
             
             # Delete tất cả points
-            self.client.delete(
+            await self._awrite_client(
+                self.client.delete,
                 collection_name=self.CONVERSATIONS_COLLECTION,
                 points_selector=PointIdsList(points=point_ids),
             )
@@ -401,7 +593,8 @@ class VectorService:
             user_id = user_id.strip()
             filter_obj = self._build_filter({"user_id": user_id})
             
-            count = self.client.count(
+            count = await self._aread_client(
+                self.client.count,
                 collection_name=self.CONVERSATIONS_COLLECTION,
                 filter=filter_obj,
             )
@@ -412,35 +605,35 @@ class VectorService:
             logger.error(f"Error counting user conversations: {e}")
             return 0
     
+    def _restaurant_point_specs(self, restaurant_data: List[Dict]) -> List[Tuple[str, Any, Dict]]:
+        specs = []
+        for restaurant in restaurant_data:
+            raw_id = self._extract_id(restaurant, "id", "restaurantId", "restaurantID")
+            if raw_id is None:
+                logger.warning("Restaurant data missing id: %s", restaurant)
+                continue
+
+            searchable_text = self._create_restaurant_searchable_text(restaurant)
+            point_id = self._make_point_id(
+                self.RESTAURANTS_COLLECTION, raw_id, allow_int=True
+            )
+            payload = {
+                **restaurant,
+                "stored_at": str(int(time.time())),
+                "document": searchable_text,
+                "point_id": str(point_id),
+            }
+            specs.append((searchable_text, point_id, payload))
+        return specs
+
     async def store_restaurant_data(self, restaurant_data: List[Dict]):
         """Store restaurant information cho semantic search."""
         try:
-            points = []
-            for restaurant in restaurant_data:
-                searchable_text = self._create_restaurant_searchable_text(restaurant)
-                vector = self.encode_text(searchable_text)
-                if not vector:
-                    logger.warning("Failed to encode restaurant %s", restaurant.get("id"))
-                    continue
-                raw_id = self._extract_id(restaurant, "id", "restaurantId", "restaurantID")
-                if raw_id is None:
-                    logger.warning("Restaurant data missing id: %s", restaurant)
-                    continue
-
-                point_id = self._make_point_id(
-                    self.RESTAURANTS_COLLECTION, raw_id, allow_int=True
-                )
-                payload = {
-                    **restaurant,
-                    "stored_at": str(int(time.time())),
-                    "document": searchable_text,
-                    "point_id": str(point_id),
-                }
-                points.append(PointStruct(id=point_id, vector=vector, payload=payload))
-
-            if points:
-                self.client.upsert(collection_name=self.RESTAURANTS_COLLECTION, points=points)
-                logger.info("Stored %s restaurants", len(points))
+            stored = await self._upsert_encoded(
+                self.RESTAURANTS_COLLECTION, self._restaurant_point_specs(restaurant_data)
+            )
+            if stored:
+                logger.info("Stored %s restaurants", stored)
 
         except Exception as e:
             logger.error(f"Error storing restaurant data: {e}")
@@ -455,7 +648,8 @@ class VectorService:
             point_id = self._make_point_id(
                 self.RESTAURANTS_COLLECTION, restaurant_id, allow_int=True
             )
-            self.client.delete(
+            await self._awrite_client(
+                self.client.delete,
                 collection_name=self.RESTAURANTS_COLLECTION,
                 points_selector=PointIdsList(points=[point_id]),
             )
@@ -464,19 +658,28 @@ class VectorService:
             logger.error(f"Error deleting restaurant {restaurant_id}: {e}")
 
     async def search_restaurants(
-        self, query: str, limit: int = 5, distance_threshold: float = 0.5
+        self,
+        query: str,
+        limit: int = 5,
+        distance_threshold: float = 0.5,
+        query_vector: Optional[List[float]] = None,
     ) -> List[Dict]:
         """Semantic search cho restaurants với distance filtering."""
         try:
-            query_vector = self.encode_text(query)
+            # Dùng embedding đã tính sẵn nếu caller truyền vào (tránh encode lại cùng query)
+            if query_vector is None:
+                query_vector = self.encode_query(query)
             if not query_vector:
                 return []
 
             # Search nhiều hơn để có thể filter sau
-            results = self.client.search(
+            # Worker thread → chạy song song với search các collection khác (gather)
+            results = await self._aread_client(
+                self.client.search,
                 collection_name=self.RESTAURANTS_COLLECTION,
                 query_vector=query_vector,
                 limit=limit * 3,  # Search nhiều hơn để filter
+                score_threshold=self._score_threshold(distance_threshold),
             )
             formatted_results = self._format_results(results)
             
@@ -536,7 +739,9 @@ class VectorService:
                 point_ids.append(point_id)
                 point_id_lookup[str(point_id)] = rid
 
-            points = self.client.retrieve(
+            # Chạy trong worker thread để caller có thể overlap với việc khác (create_task)
+            points = await self._aread_client(
+                self.client.retrieve,
                 collection_name=self.RESTAURANTS_COLLECTION,
                 ids=point_ids,
                 with_payload=True,
@@ -622,6 +827,133 @@ class VectorService:
             logger.error(f"Error in cross-collection search: {e}")
             return []
 
+    def _menu_point_specs(self, restaurant_id: int, menu_data: List[Dict]) -> List[Tuple[str, Any, Dict]]:
+        specs = []
+        for dish in menu_data:
+            dish_raw_id = self._extract_id(
+                dish,
+                "id",
+                "dishId",
+                "dishID",
+                "menuId",
+                "menuID",
+                "dish_id",
+            )
+            if dish_raw_id is None:
+                logger.warning(
+                    "Menu item missing id for restaurant %s: %s", restaurant_id, dish
+                )
+                continue
+
+            searchable_text = self._create_menu_searchable_text(dish, restaurant_id)
+            point_id = self._make_point_id(
+                self.MENUS_COLLECTION, restaurant_id, dish_raw_id
+            )
+            payload = {
+                **dish,
+                "restaurant_id": restaurant_id,
+                "stored_at": str(int(time.time())),
+                "document": searchable_text,
+                "point_id": str(point_id),
+            }
+            specs.append((searchable_text, point_id, payload))
+        return specs
+
+    def _service_point_specs(self, restaurant_id: int, services_data: List[Dict]) -> List[Tuple[str, Any, Dict]]:
+        specs = []
+        for service in services_data:
+            service_raw_id = self._extract_id(
+                service,
+                "id",
+                "serviceId",
+                "serviceID",
+                "service_id",
+                "code",
+            )
+            if service_raw_id is None:
+                logger.warning(
+                    "Service item missing id for restaurant %s: %s",
+                    restaurant_id,
+                    service,
+                )
+                continue
+
+            searchable_text = self._create_service_searchable_text(service, restaurant_id)
+            point_id = self._make_point_id(
+                self.MENUS_COLLECTION, "service", restaurant_id, service_raw_id
+            )
+            payload = {
+                **service,
+                "restaurant_id": restaurant_id,
+                "stored_at": str(int(time.time())),
+                "document": searchable_text,
+                "point_id": str(point_id),
+            }
+            specs.append((searchable_text, point_id, payload))
+        return specs
+
+    def _table_point_specs(self, restaurant_id: int, tables_data: List[Dict]) -> List[Tuple[str, Any, Dict]]:
+        specs = []
+        for table in tables_data:
+            table_raw_id = self._extract_id(
+                table,
+                "id",
+                "tableId",
+                "tableID",
+                "table_id",
+                "code",
+            )
+            if table_raw_id is None:
+                logger.warning(
+                    "Table item missing id for restaurant %s: %s",
+                    restaurant_id,
+                    table,
+                )
+                continue
+
+            searchable_text = self._create_table_searchable_text(table, restaurant_id)
+            point_id = self._make_point_id(
+                self.MENUS_COLLECTION, "table", restaurant_id, table_raw_id
+            )
+            payload = {
+                **table,
+                "restaurant_id": restaurant_id,
+                "stored_at": str(int(time.time())),
+                "document": searchable_text,
+                "point_id": str(point_id),
+            }
+            specs.append((searchable_text, point_id, payload))
+        return specs
+
+    def _table_layout_point_specs(
+        self, restaurant_id: int, table_layouts_data: List[Dict]
+    ) -> List[Tuple[str, Any, Dict]]:
+        specs = []
+        for layout in table_layouts_data:
+            # Table layout có thể là ảnh/phòng ...
+            searchable_text = self._create_table_layout_searchable_text(layout, restaurant_id)
+            mediaId = (
+                layout.get("mediaId")
+                or layout.get("id")
+                or layout.get("layoutId")
+            )
+            # Lưu từng ảnh/media là 1 point
+            point_id = self._make_point_id(
+                self.IMAGE_URL_COLLECTION,
+                "table_layout",
+                restaurant_id,
+                mediaId or uuid.uuid4().hex,
+            )
+            payload = {
+                **layout,
+                "restaurant_id": restaurant_id,
+                "stored_at": str(int(time.time())),
+                "type": layout.get("type") or "table_layout",
+                "point_id": str(point_id),
+            }
+            specs.append((searchable_text, point_id, payload))
+        return specs
+
     async def store_menu_data(self, restaurant_id: int, menu_data: List[Dict]):
         """Store menu information cho semantic search."""
         try:
@@ -630,44 +962,12 @@ class VectorService:
                 restaurant_id,
                 len(menu_data),
             )
-            points = []
-            for dish in menu_data:
-                searchable_text = self._create_menu_searchable_text(dish, restaurant_id)
-                vector = self.encode_text(searchable_text)
-                if not vector:
-                    logger.warning("Failed to encode dish %s", dish.get("id"))
-                    continue
-                dish_raw_id = self._extract_id(
-                    dish,
-                    "id",
-                    "dishId",
-                    "dishID",
-                    "menuId",
-                    "menuID",
-                    "dish_id",
-                )
-                if dish_raw_id is None:
-                    logger.warning(
-                        "Menu item missing id for restaurant %s: %s", restaurant_id, dish
-                    )
-                    continue
-
-                point_id = self._make_point_id(
-                    self.MENUS_COLLECTION, restaurant_id, dish_raw_id
-                )
-                payload = {
-                    **dish,
-                    "restaurant_id": restaurant_id,
-                    "stored_at": str(int(time.time())),
-                    "document": searchable_text,
-                    "point_id": str(point_id),
-                }
-                points.append(PointStruct(id=point_id, vector=vector, payload=payload))
-
-            if points:
-                self.client.upsert(collection_name=self.MENUS_COLLECTION, points=points)
+            stored = await self._upsert_encoded(
+                self.MENUS_COLLECTION, self._menu_point_specs(restaurant_id, menu_data)
+            )
+            if stored:
                 logger.info(
-                    "Stored %s menu items for restaurant %s", len(points), restaurant_id
+                    "Stored %s menu items for restaurant %s", stored, restaurant_id
                 )
             else:
                 logger.debug(
@@ -686,45 +986,13 @@ class VectorService:
                 restaurant_id,
                 len(services_data),
             )
-            points = []
-            for service in services_data:
-                searchable_text = self._create_service_searchable_text(service, restaurant_id)
-                vector = self.encode_text(searchable_text)
-                if not vector:
-                    logger.warning("Failed to encode service %s", service.get("id"))
-                    continue
-                service_raw_id = self._extract_id(
-                    service,
-                    "id",
-                    "serviceId",
-                    "serviceID",
-                    "service_id",
-                    "code",
-                )
-                if service_raw_id is None:
-                    logger.warning(
-                        "Service item missing id for restaurant %s: %s",
-                        restaurant_id,
-                        service,
-                    )
-                    continue
-
-                point_id = self._make_point_id(
-                    self.MENUS_COLLECTION, "service", restaurant_id, service_raw_id
-                )
-                payload = {
-                    **service,
-                    "restaurant_id": restaurant_id,
-                    "stored_at": str(int(time.time())),
-                    "document": searchable_text,
-                    "point_id": str(point_id),
-                }
-                points.append(PointStruct(id=point_id, vector=vector, payload=payload))
-
-            if points:
-                self.client.upsert(collection_name=self.MENUS_COLLECTION, points=points)  # Reuse menus collection
+            stored = await self._upsert_encoded(
+                self.MENUS_COLLECTION,  # Reuse menus collection
+                self._service_point_specs(restaurant_id, services_data),
+            )
+            if stored:
                 logger.info(
-                    "Stored %s services for restaurant %s", len(points), restaurant_id
+                    "Stored %s services for restaurant %s", stored, restaurant_id
                 )
             else:
                 logger.debug(
@@ -738,46 +1006,12 @@ class VectorService:
     async def store_tables_data(self, restaurant_id: int, tables_data: List[Dict]):
         """Store restaurant table information cho semantic search."""
         try:
-            points = []
-            for table in tables_data:
-                searchable_text = self._create_table_searchable_text(table, restaurant_id)
-                vector = self.encode_text(searchable_text)
-                if not vector:
-                    logger.warning("Failed to encode table %s", table)
-                    continue
-
-                table_raw_id = self._extract_id(
-                    table,
-                    "id",
-                    "tableId",
-                    "tableID",
-                    "table_id",
-                    "code",
-                )
-                if table_raw_id is None:
-                    logger.warning(
-                        "Table item missing id for restaurant %s: %s",
-                        restaurant_id,
-                        table,
-                    )
-                    continue
-
-                point_id = self._make_point_id(
-                    self.MENUS_COLLECTION, "table", restaurant_id, table_raw_id
-                )
-                payload = {
-                    **table,
-                    "restaurant_id": restaurant_id,
-                    "stored_at": str(int(time.time())),
-                    "document": searchable_text,
-                    "point_id": str(point_id),
-                }
-                points.append(PointStruct(id=point_id, vector=vector, payload=payload))
-
-            if points:
-                self.client.upsert(collection_name=self.MENUS_COLLECTION, points=points)
+            stored = await self._upsert_encoded(
+                self.MENUS_COLLECTION, self._table_point_specs(restaurant_id, tables_data)
+            )
+            if stored:
                 logger.info(
-                    "Stored %s tables for restaurant %s", len(points), restaurant_id
+                    "Stored %s tables for restaurant %s", stored, restaurant_id
                 )
 
         except Exception as e:
@@ -786,42 +1020,52 @@ class VectorService:
     async def store_table_layouts_data(self, restaurant_id: int, table_layouts_data: List[Dict]):
         """Store table layouts and media info in IMAGE_URL_COLLECTION, always include restaurant_id."""
         try:
-            points = []
-            for layout in table_layouts_data:
-                # Table layout có thể là ảnh/phòng ...
-                searchable_text = self._create_table_layout_searchable_text(layout, restaurant_id)
-                vector = self.encode_text(searchable_text)
-                if not vector:
-                    logger.warning("Failed to encode table layout for image_url: %s", layout.get("id"))
-                    continue
-                mediaId = (
-                    layout.get("mediaId")
-                    or layout.get("id")
-                    or layout.get("layoutId")
-                )
-                # Lưu từng ảnh/media là 1 point
-                point_id = self._make_point_id(
-                    self.IMAGE_URL_COLLECTION,
-                    "table_layout",
-                    restaurant_id,
-                    mediaId or uuid.uuid4().hex,
-                )
-                payload = {
-                    **layout,
-                    "restaurant_id": restaurant_id,
-                    "stored_at": str(int(time.time())),
-                    "type": layout.get("type") or "table_layout",
-                    "point_id": str(point_id),
-                }
-                points.append(PointStruct(id=point_id, vector=vector, payload=payload))
-            if points:
-                self.client.upsert(collection_name=self.IMAGE_URL_COLLECTION, points=points)
+            stored = await self._upsert_encoded(
+                self.IMAGE_URL_COLLECTION,
+                self._table_layout_point_specs(restaurant_id, table_layouts_data),
+            )
+            if stored:
                 logger.info(
-                    "Stored %s table layouts/images for restaurant %s in image_url collection", len(points), restaurant_id
+                    "Stored %s table layouts/images for restaurant %s in image_url collection", stored, restaurant_id
                 )
         except Exception as e:
             logger.error(f"Error storing table layouts/image data: {e}")
 
+    async def store_restaurant_details_bulk(
+        self,
+        details: List[Tuple[Any, List[Dict], List[Dict], List[Dict], List[Dict]]],
+        restaurants: Optional[List[Dict]] = None,
+    ):
+        """Store restaurant + menu/services/tables/layouts của 1 group nhà hàng (dùng khi init).
+
+        details: [(restaurant_id, menu, services, tables, table_layouts)]. Gom point theo collection
+        → encode theo batch + upsert theo chunk thay vì 4 lần encode/upsert cho mỗi nhà hàng.
+        Lỗi được raise để caller ghi nhận group thất bại (init_progress).
+        """
+        stored_restaurants = 0
+        if restaurants:
+            stored_restaurants = await self._upsert_encoded(
+                self.RESTAURANTS_COLLECTION, self._restaurant_point_specs(restaurants)
+            )
+
+        menu_specs: List[Tuple[str, Any, Dict]] = []
+        layout_specs: List[Tuple[str, Any, Dict]] = []
+        for restaurant_id, menu, services, tables, table_layouts in details:
+            # Menus, services, tables cùng nằm trong menus collection
+            menu_specs += self._menu_point_specs(restaurant_id, menu or [])
+            menu_specs += self._service_point_specs(restaurant_id, services or [])
+            menu_specs += self._table_point_specs(restaurant_id, tables or [])
+            layout_specs += self._table_layout_point_specs(restaurant_id, table_layouts or [])
+
+        stored_menus = await self._upsert_encoded(self.MENUS_COLLECTION, menu_specs)
+        stored_layouts = await self._upsert_encoded(self.IMAGE_URL_COLLECTION, layout_specs)
+        logger.info(
+            "Bulk stored %s restaurants, %s menu/service/table points and %s layouts",
+            stored_restaurants,
+            stored_menus,
+            stored_layouts,
+        )
+
     async def upsert_menu(self, restaurant_id: int, dish: Dict):
         """Upsert single menu item."""
         await self.store_menu_data(restaurant_id, [dish])
@@ -832,7 +1076,8 @@ class VectorService:
             point_id = self._make_point_id(
                 self.MENUS_COLLECTION, restaurant_id, dish_id
             )
-            self.client.delete(
+            await self._awrite_client(
+                self.client.delete,
                 collection_name=self.MENUS_COLLECTION,
                 points_selector=PointIdsList(points=[point_id]),
             )
@@ -845,52 +1090,68 @@ class VectorService:
             logger.error(f"Error deleting menu {dish_id} of restaurant {restaurant_id}: {e}")
 
     async def search_menus(
-        self, query: str, restaurant_id: int = None, limit: int = 5, distance_threshold: float = 0.5
+        self,
+        query: str,
+        restaurant_id: int = None,
+        limit: int = 5,
+        distance_threshold: float = 0.5,
+        query_vector: Optional[List[float]] = None,
     ) -> List[Dict]:
         """Semantic search cho menus với distance filtering."""
         try:
-            query_vector = self.encode_text(query)
+            # Dùng embedding đã tính sẵn nếu caller truyền vào (tránh encode lại cùng query)
+            if query_vector is None:
+                query_vector = self.encode_query(query)
             if not query_vector:
                 return []
 
             # ✅ FIX: Search không dùng filter (Qdrant local mode không hỗ trợ)
             # Tăng limit để có đủ kết quả sau khi filter
-            results = self.client.search(
+            # Chạy trong worker thread để nhiều search_menus có thể chạy song song (gather)
+            results = await self._aread_client(
+                self.client.search,
                 collection_name=self.MENUS_COLLECTION,
                 query_vector=query_vector,
                 limit=limit * 5,  # ✅ Tăng từ limit * 3 lên limit * 5
+                score_threshold=self._score_threshold(distance_threshold),
             )
-            formatted_results = self._format_results(results)
-            
-            # ✅ FIX: Manual filter theo restaurant_id nếu có
-            if restaurant_id is not None:
-                formatted_results = [
-                    r for r in formatted_results
-                    if r.get("metadata", {}).get("restaurant_id") == restaurant_id
-                ]
-            
-            # FILTER theo distance threshold - CHỈ lấy results "gần gần"
-            filtered_results = [
-                r for r in formatted_results 
-                if r["distance"] < distance_threshold
-            ]
-            
-            # Giới hạn lại số lượng sau khi filter
-            filtered_results = filtered_results[:limit]
-            
-            logger.info(
-                "Found %s menu items (filtered from %s, threshold=%.2f) for query: %s",
-                len(filtered_results),
-                len(formatted_results),
-                distance_threshold,
-                query
-            )
-            return filtered_results
+            return self._filter_menu_points(results, query, restaurant_id, limit, distance_threshold)
 
         except Exception as e:
             logger.error(f"Error searching menus: {e}")
             return []
 
+    def _filter_menu_points(
+        self, points, query: str, restaurant_id: Optional[int], limit: int, distance_threshold: float
+    ) -> List[Dict]:
+        """Post-process kết quả search menus collection thành menu items."""
+        formatted_results = self._format_results(points)
+        
+        # ✅ FIX: Manual filter theo restaurant_id nếu có
+        if restaurant_id is not None:
+            formatted_results = [
+                r for r in formatted_results
+                if r.get("metadata", {}).get("restaurant_id") == restaurant_id
+            ]
+        
+        # FILTER theo distance threshold - CHỈ lấy results "gần gần"
+        filtered_results = [
+            r for r in formatted_results 
+            if r["distance"] < distance_threshold
+        ]
+        
+        # Giới hạn lại số lượng sau khi filter
+        filtered_results = filtered_results[:limit]
+        
+        logger.info(
+            "Found %s menu items (filtered from %s, threshold=%.2f) for query: %s",
+            len(filtered_results),
+            len(formatted_results),
+            distance_threshold,
+            query
+        )
+        return filtered_results
+
     async def semantic_menu_search_with_reasoning(
         self,
         user_message: str,
@@ -960,16 +1221,8 @@ class VectorService:
             for result in results:
                 metadata = result.get("metadata", {})
                 
-                # Get tags (ensure it's a list)
-                tags = metadata.get("tags", [])
-                if isinstance(tags, str):
-                    try:
-                        import ast
-                        tags = ast.literal_eval(tags) if tags.startswith("[") else [tags]
-                    except:
-                        tags = [tags] if tags else []
-                if not isinstance(tags, list):
-                    tags = []
+                # Get tags (set cho membership check - mỗi item check ~10 tag)
+                tags = {tag for tag in parse_tag_list(metadata.get("tags", [])) if isinstance(tag, str)}
                 
                 # Start với base score (convert distance to similarity score)
                 base_distance = result.get("distance", 1.0)
@@ -1097,7 +1350,7 @@ class VectorService:
             )
             
             preference_text = (
-                f"User {user_id} preference for {preference_type}: {json.dumps(data, ensure_ascii=False)}"
+                f"User {user_id} preference for {preference_type}: {json.dumps(data, ensure_ascii=False, sort_keys=True)}"
             )
             vector = self.encode_text(preference_text)
             if not vector:
@@ -1113,7 +1366,8 @@ class VectorService:
                 "point_id": str(preference_id),  # ✅ Giờ đã có preference_id
             }
 
-            self.client.upsert(
+            await self._awrite_client(
+                self.client.upsert,
                 collection_name=self.USER_PREFERENCES_COLLECTION,
                 points=[PointStruct(id=preference_id, vector=vector, payload=payload)],
             )
@@ -1139,7 +1393,8 @@ class VectorService:
             all_results: List[Dict] = []
             offset = None
             while True:
-                points, offset = self.client.scroll(
+                points, offset = await self._aread_client(
+                    self.client.scroll,
                     collection_name=self.USER_PREFERENCES_COLLECTION,
                     limit=64,
                     filter=filter_obj,
@@ -1204,24 +1459,25 @@ class VectorService:
         """Get statistics về các collection."""
         stats: Dict[str, int] = {}
         try:
-            stats["conversations"] = self.client.count(
-                collection_name=self.CONVERSATIONS_COLLECTION
-            ).count
-            stats["restaurants"] = self.client.count(
-                collection_name=self.RESTAURANTS_COLLECTION
-            ).count
-            stats["menus"] = self.client.count(
-                collection_name=self.MENUS_COLLECTION
-            ).count
-            stats["user_preferences"] = self.client.count(
-                collection_name=self.USER_PREFERENCES_COLLECTION
-            ).count
-            stats["intents"] = self.client.count(
-                collection_name=self.INTENTS_COLLECTION
-            ).count
-            stats["image_url"] = self.client.count(
-                collection_name=self.IMAGE_URL_COLLECTION
-            ).count
+            with self._client_lock.read():
+                stats["conversations"] = self.client.count(
+                    collection_name=self.CONVERSATIONS_COLLECTION
+                ).count
+                stats["restaurants"] = self.client.count(
+                    collection_name=self.RESTAURANTS_COLLECTION
+                ).count
+                stats["menus"] = self.client.count(
+                    collection_name=self.MENUS_COLLECTION
+                ).count
+                stats["user_preferences"] = self.client.count(
+                    collection_name=self.USER_PREFERENCES_COLLECTION
+                ).count
+                stats["intents"] = self.client.count(
+                    collection_name=self.INTENTS_COLLECTION
+                ).count
+                stats["image_url"] = self.client.count(
+                    collection_name=self.IMAGE_URL_COLLECTION
+                ).count
         except Exception as e:
             logger.error(f"Error getting collection stats: {e}")
         return stats
@@ -1263,7 +1519,7 @@ class VectorService:
 
         except Exception as e:
             logger.error(f"Error creating restaurant searchable text: {e}")
-            return json.dumps(restaurant, ensure_ascii=False)
+            return json.dumps(restaurant, ensure_ascii=False, sort_keys=True)
 
     def _create_service_searchable_text(self, service: Dict, restaurant_id: int) -> str:
         """Tạo đoạn text có thể tìm kiếm từ dữ liệu dịch vụ nhà hàng."""
@@ -1362,12 +1618,12 @@ class VectorService:
                 base_text += "\n" + ", ".join(searchable_terms)
 
             if not base_text.strip():
-                return json.dumps(table, ensure_ascii=False)
+                return json.dumps(table, ensure_ascii=False, sort_keys=True)
             return base_text
 
         except Exception as e:
             logger.error(f"Error creating table searchable text: {e}")
-            return json.dumps(table, ensure_ascii=False)
+            return json.dumps(table, ensure_ascii=False, sort_keys=True)
 
     def _create_menu_searchable_text(self, dish: Dict, restaurant_id: int) -> str:
         """
@@ -1398,25 +1654,11 @@ class VectorService:
                 text_parts.append(f"Ẩm thực: {cuisine_type}")
             
             # Tags-based semantic context (CHÍNH LÀ CÁI QUAN TRỌNG)
-            tags = dish.get("tags", [])
             # Đảm bảo tags là list, không phải string
-            if isinstance(tags, str):
-                try:
-                    import ast
-                    tags = ast.literal_eval(tags) if tags.startswith("[") else [tags]
-                except:
-                    tags = [tags] if tags else []
+            tags = parse_tag_list(dish.get("tags", []))
             
             # ✅ Get ingredient_tags (MỚI - dùng cho dị ứng/kiêng khem)
-            ingredient_tags = dish.get("ingredient_tags", [])
-            if isinstance(ingredient_tags, str):
-                try:
-                    import ast
-                    ingredient_tags = ast.literal_eval(ingredient_tags) if ingredient_tags.startswith("[") else [ingredient_tags]
-                except:
-                    ingredient_tags = [ingredient_tags] if ingredient_tags else []
-            if not isinstance(ingredient_tags, list):
-                ingredient_tags = []
+            ingredient_tags = parse_tag_list(dish.get("ingredient_tags", []))
             
             if isinstance(tags, list) and tags:
                 tag_contexts = []
@@ -1454,25 +1696,10 @@ class VectorService:
             
             # ✅ Ingredient context (MỚI - cho semantic search về dị ứng/kiêng khem)
             if ingredient_tags:
-                ingredient_map = {
-                    "beef": "có thịt bò",
-                    "pork": "có thịt heo",
-                    "chicken": "có thịt gà",
-                    "seafood": "có hải sản",
-                    "shrimp": "có tôm",
-                    "crab": "có cua",
-                    "squid": "có mực",
-                    "clam": "có nghêu/sò",
-                    "fish": "có cá",
-                    "egg": "có trứng",
-                    "milk": "có sữa",
-                    "peanut": "có đậu phộng",
-                    "soy": "có đậu nành/đậu phụ"
-                }
                 ingredient_labels = [
-                    ingredient_map.get(tag.lower(), tag) 
-                    for tag in ingredient_tags 
-                    if tag.lower() in ingredient_map
+                    label
+                    for tag in ingredient_tags
+                    if (label := _INGREDIENT_LABELS.get(tag.lower()))
                 ]
                 if ingredient_labels:
                     text_parts.append(f"Nguyên liệu: {', '.join(ingredient_labels)}")
@@ -1499,7 +1726,7 @@ class VectorService:
 
         except Exception as e:
             logger.error(f"Error creating menu searchable text: {e}")
-            return json.dumps(dish, ensure_ascii=False)
+            return json.dumps(dish, ensure_ascii=False, sort_keys=True)
     
     # ==================== INTENT EMBEDDING COLLECTION ====================
     
@@ -1510,7 +1737,8 @@ class VectorService:
             point_id = self._make_point_id(self.INTENTS_COLLECTION, intent_name)
             
             # Xóa point
-            self.client.delete(
+            await self._awrite_client(
+                self.client.delete,
                 collection_name=self.INTENTS_COLLECTION,
                 points_selector=PointIdsList(points=[point_id])
             )
@@ -1526,14 +1754,16 @@ class VectorService:
         """Xóa tất cả intent embeddings (để reset)"""
         try:
             # Lấy tất cả points trong collection
-            points, _ = self.client.scroll(
+            points, _ = await self._aread_client(
+                self.client.scroll,
                 collection_name=self.INTENTS_COLLECTION,
                 limit=1000  # Lấy tất cả
             )
             
             if points:
                 point_ids = [point.id for point in points]
-                self.client.delete(
+                await self._awrite_client(
+                    self.client.delete,
                     collection_name=self.INTENTS_COLLECTION,
                     points_selector=PointIdsList(points=point_ids)
                 )
@@ -1577,7 +1807,8 @@ class VectorService:
                 "stored_at": str(int(time.time())),
             }
             
-            self.client.upsert(
+            await self._awrite_client(
+                self.client.upsert,
                 collection_name=self.INTENTS_COLLECTION,
                 points=[PointStruct(id=point_id, vector=vector, payload=payload)],
             )
@@ -1602,15 +1833,17 @@ class VectorService:
             List of intent results với distance và metadata
         """
         try:
-            query_vector = self.encode_text(query)
+            query_vector = self.encode_query(query)
             if not query_vector:
                 return []
             
             # Search với higher limit để filter sau
-            results = self.client.search(
+            results = await self._aread_client(
+                self.client.search,
                 collection_name=self.INTENTS_COLLECTION,
                 query_vector=query_vector,
                 limit=limit * 2,
+                score_threshold=self._score_threshold(distance_threshold),
             )
             
             formatted_results = self._format_results(results)
@@ -1693,65 +1926,170 @@ class VectorService:
             logger.error(f"Error initializing intent embeddings: {e}")
 
     async def search_tables(
-        self, query: str, restaurant_id: int = None, limit: int = 5, distance_threshold: float = 0.5
+        self,
+        query: str,
+        restaurant_id: int = None,
+        limit: int = 5,
+        distance_threshold: float = 0.5,
+        query_vector: Optional[List[float]] = None,
     ) -> List[Dict]:
         """Semantic search cho tables (menus collection, type=table)."""
         try:
-            query_vector = self.encode_text(query)
+            # Dùng embedding đã tính sẵn nếu caller truyền vào (tránh encode lại cùng query)
+            if query_vector is None:
+                query_vector = self.encode_query(query)
             if not query_vector:
                 return []
             
             # ✅ FIX: Bỏ filter parameter (Qdrant local mode không hỗ trợ)
             # Search nhiều hơn để có đủ kết quả sau khi filter
-            results = self.client.search(
+            results = await self._aread_client(
+                self.client.search,
                 collection_name=self.MENUS_COLLECTION,
                 query_vector=query_vector,
                 limit=limit * 5,
             )
-            
-            # Format results
-            tables = [
-                dict(result.payload, distance=result.score, id=result.id)
-                for result in results
-            ]
-            
-            # ✅ FIX: Manual filter theo type=table
+            return self._filter_table_points(results, restaurant_id, limit, distance_threshold)
+        except Exception as e:
+            logger.error(f"Error searching tables: {e}")
+            return []
+
+    def _filter_table_points(
+        self, points, restaurant_id: Optional[int], limit: int, distance_threshold: float
+    ) -> List[Dict]:
+        """Post-process kết quả search menus collection, chỉ giữ type=table."""
+        # Format results
+        tables = [
+            dict(result.payload, distance=result.score, id=result.id)
+            for result in points or []
+        ]
+        
+        # ✅ FIX: Manual filter theo type=table
+        tables = [
+            t for t in tables
+            if t.get("type") == "table" or t.get("metadata", {}).get("type") == "table"
+        ]
+        
+        # ✅ FIX: Manual filter theo restaurant_id nếu có
+        if restaurant_id is not None:
             tables = [
                 t for t in tables
-                if t.get("type") == "table" or t.get("metadata", {}).get("type") == "table"
+                if str(t.get("restaurant_id")) == str(restaurant_id) or 
+                   str(t.get("metadata", {}).get("restaurant_id")) == str(restaurant_id)
             ]
-            
-            # ✅ FIX: Manual filter theo restaurant_id nếu có
-            if restaurant_id is not None:
-                tables = [
-                    t for t in tables
-                    if str(t.get("restaurant_id")) == str(restaurant_id) or 
-                       str(t.get("metadata", {}).get("restaurant_id")) == str(restaurant_id)
-                ]
-            
-            # FILTER theo distance threshold - CHỈ lấy results "gần gần"
-            filtered_tables = [
-                t for t in tables
-                if t.get("distance", 999) < distance_threshold
-            ]
-            
-            # Giới hạn lại số lượng sau khi filter
-            return filtered_tables[:limit]
+        
+        # FILTER theo distance threshold - CHỈ lấy results "gần gần"
+        filtered_tables = [
+            t for t in tables
+            if t.get("distance", 999) < distance_threshold
+        ]
+        
+        # Giới hạn lại số lượng sau khi filter
+        return filtered_tables[:limit]
+
+    async def search_menus_batch(
+        self,
+        restaurant_ids: List[Any],
+        query: str = "",
+        limit_per_restaurant: int = 5,
+        distance_threshold: float = 0.5,
+        query_vector: Optional[List[float]] = None,
+    ) -> Dict[Any, List[Dict]]:
+        """
+        Search menus cho nhiều nhà hàng trong 1 lần query, trả về {restaurant_id: menus}.
+
+        Tương đương gọi search_menus(query, restaurant_id=rid, ...) cho từng rid: mỗi lần gọi đó
+        search cùng 1 vector với cùng limit rồi mới filter theo restaurant_id, nên chỉ cần search 1 lần
+        rồi chia bucket theo restaurant_id.
+        """
+        menus_by_restaurant: Dict[Any, List[Dict]] = {rid: [] for rid in restaurant_ids}
+        if not menus_by_restaurant:
+            return menus_by_restaurant
+        try:
+            if query_vector is None:
+                query_vector = self.encode_query(query)
+            if not query_vector:
+                return menus_by_restaurant
+
+            results = await self._aread_client(
+                self.client.search,
+                collection_name=self.MENUS_COLLECTION,
+                query_vector=query_vector,
+                limit=limit_per_restaurant * 5,
+                score_threshold=self._score_threshold(distance_threshold),
+            )
+
+            for item in self._format_results(results):
+                bucket = menus_by_restaurant.get(item.get("metadata", {}).get("restaurant_id"))
+                if (
+                    bucket is not None
+                    and len(bucket) < limit_per_restaurant
+                    and item["distance"] < distance_threshold
+                ):
+                    bucket.append(item)
+
+            logger.info(
+                "Found menu items for %s restaurants in one search (threshold=%.2f) for query: %s",
+                len(menus_by_restaurant),
+                distance_threshold,
+                query,
+            )
+            return menus_by_restaurant
+
         except Exception as e:
-            logger.error(f"Error searching tables: {e}")
-            return []
+            logger.error(f"Error batch searching menus: {e}")
+            return menus_by_restaurant
+
+    async def search_menus_and_tables(
+        self,
+        query: str,
+        restaurant_id: int = None,
+        menu_limit: int = 5,
+        table_limit: int = 5,
+        distance_threshold: float = 0.5,
+        query_vector: Optional[List[float]] = None,
+    ) -> Tuple[List[Dict], List[Dict]]:
+        """Menus và tables cùng nằm trong menus collection → 1 lần search cho cả hai."""
+        try:
+            if query_vector is None:
+                query_vector = self.encode_query(query)
+            if not query_vector:
+                return [], []
+
+            # Lấy đủ candidates cho phía cần nhiều hơn, rồi post-process riêng từng loại
+            results = await self._aread_client(
+                self.client.search,
+                collection_name=self.MENUS_COLLECTION,
+                query_vector=query_vector,
+                limit=max(menu_limit, table_limit) * 5,
+            )
+            menus = self._filter_menu_points(results, query, restaurant_id, menu_limit, distance_threshold)
+            tables = self._filter_table_points(results, restaurant_id, table_limit, distance_threshold)
+            return menus, tables
+        except Exception as e:
+            logger.error(f"Error searching menus and tables: {e}")
+            return [], []
+
     async def search_table_layouts(
-        self, query: str, restaurant_id: int = None, limit: int = 5, distance_threshold: float = 0.5
+        self,
+        query: str,
+        restaurant_id: int = None,
+        limit: int = 5,
+        distance_threshold: float = 0.5,
+        query_vector: Optional[List[float]] = None,
     ) -> List[Dict]:
         """Semantic search cho table_layout (image_url collection), luôn filter theo type=table_layout."""
         try:
-            query_vector = self.encode_text(query)
+            # Dùng embedding đã tính sẵn nếu caller truyền vào (tránh encode lại cùng query)
+            if query_vector is None:
+                query_vector = self.encode_query(query)
             if not query_vector:
                 return []
             
             # ✅ FIX: Bỏ filter parameter (Qdrant local mode không hỗ trợ)
             # Search nhiều hơn để có đủ kết quả sau khi filter
-            results = self.client.search(
+            results = await self._aread_client(
+                self.client.search,
                 collection_name=self.IMAGE_URL_COLLECTION,
                 query_vector=query_vector,
                 limit=limit * 5,